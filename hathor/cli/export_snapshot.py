@@ -0,0 +1,69 @@
+"""
+Copyright 2019 Hathor Labs
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+from argparse import ArgumentParser, Namespace
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from hathor.transaction.storage import TransactionStorage
+
+
+def add_storage_arguments(parser: ArgumentParser) -> None:
+    parser.add_argument('--data', required=True, help='Data directory')
+    parser.add_argument('--rocksdb-storage', action='store_true', help='Use RocksDB storage backend')
+    parser.add_argument('--testnet', action='store_true', help='Use the settings of Hathor testnet')
+
+
+def create_tx_storage(args: Namespace) -> 'TransactionStorage':
+    """ Open the storage of a data directory, without the indexes, which are not needed to read or write all txs.
+    """
+    if args.testnet and not os.environ.get('HATHOR_CONFIG_FILE'):
+        os.environ['HATHOR_CONFIG_FILE'] = 'hathor.conf.testnet'
+
+    from hathor.transaction.storage import TransactionCompactStorage, TransactionRocksDBStorage
+
+    if args.rocksdb_storage:
+        return TransactionRocksDBStorage(path=args.data, with_index=False)
+    return TransactionCompactStorage(path=args.data, with_index=False)
+
+
+def create_parser() -> ArgumentParser:
+    from hathor.cli.util import create_parser
+    parser = create_parser()
+    add_storage_arguments(parser)
+    parser.add_argument('output', help='Snapshot file to be written, "-" writes to stdout')
+    return parser
+
+
+def execute(args: Namespace) -> None:
+    tx_storage = create_tx_storage(args)
+
+    from hathor.snapshot import export_snapshot
+
+    if args.output == '-':
+        export_snapshot(tx_storage, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.output, 'wb') as fp:
+            export_snapshot(tx_storage, fp)
+
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    execute(args)
@@ -0,0 +1,56 @@
+"""
+Copyright 2019 Hathor Labs
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+from argparse import ArgumentParser, Namespace
+
+
+def create_parser() -> ArgumentParser:
+    from hathor.cli.export_snapshot import add_storage_arguments
+    from hathor.cli.util import create_parser
+    parser = create_parser()
+    add_storage_arguments(parser)
+    parser.add_argument('input', help='Snapshot file to be read, "-" reads from stdin')
+    parser.add_argument('--verify', action='store_true',
+                        help='Verify the proof-of-work and the scripts of all txs again on a pool of processes')
+    parser.add_argument('--verification-processes', type=int,
+                        help='Number of processes used by --verify (default: number of CPUs)')
+    return parser
+
+
+def execute(args: Namespace) -> None:
+    from hathor.cli.export_snapshot import create_tx_storage
+
+    tx_storage = create_tx_storage(args)
+
+    from hathor.snapshot import import_snapshot
+
+    verification_processes = 0
+    if args.verify:
+        verification_processes = args.verification_processes or os.cpu_count() or 1
+
+    if args.input == '-':
+        import_snapshot(tx_storage, sys.stdin.buffer, verification_processes=verification_processes)
+    else:
+        with open(args.input, 'rb') as fp:
+            import_snapshot(tx_storage, fp, verification_processes=verification_processes)
+
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    execute(args)
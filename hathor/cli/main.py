@@ -34,7 +34,9 @@ class CliManager:
         self.longest_cmd: int = 0
 
         from . import (
+            export_snapshot,
             generate_valid_words,
+            import_snapshot,
             merged_mining,
             mining,
             multisig_address,
@@ -60,6 +62,8 @@ class CliManager:
         self.add_cmd('mining', 'run_stratum_miner', stratum_mining, 'Run a mining process (running node required)')
         self.add_cmd('hathor', 'run_node', run_node, 'Run a node')
         self.add_cmd('hathor', 'gen_peer_id', peer_id, 'Generate a new random peer-id')
+        self.add_cmd('hathor', 'export_snapshot', export_snapshot, 'Export the DAG of a stopped node to a file')
+        self.add_cmd('hathor', 'import_snapshot', import_snapshot, 'Import a DAG snapshot into an empty data dir')
         self.add_cmd('docs', 'generate_openapi_json', openapi_json, 'Generate OpenAPI json for API docs')
         self.add_cmd('multisig', 'gen_multisig_address', multisig_address, 'Generate a new multisig address')
         self.add_cmd('multisig', 'spend_multisig_output', multisig_spend, 'Generate tx that spends a multisig output')
@@ -138,6 +138,10 @@ def generate_nginx_config(openapi: Dict[str, Any], *, out_file: TextIO, rate_k:
         if not rate_limits:
             continue
 
+        max_body_size = rate_limits.get('max-body-size')
+        if max_body_size:
+            location_params['max_body_size'] = max_body_size
+
         path_key = path.lower().replace('/', '__').replace('.', '__').replace('{', '').replace('}', '')
 
         global_rate_limits = rate_limits.get('global', [])
@@ -292,6 +296,8 @@ server {{
         out_file.write(' ' * 8 + f'limit_except {methods} {{ deny all; }}\n')
         for rate_limit in location_params.get('rate_limits', []):
             out_file.write(' ' * 8 + rate_limit.to_nginx_config())
+        if 'max_body_size' in location_params:
+            out_file.write(' ' * 8 + f'client_max_body_size {location_params["max_body_size"]};\n')
         out_file.write(location_close)
     out_file.write(server_close)
 
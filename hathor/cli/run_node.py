@@ -56,6 +56,16 @@ class RunNode:
                             help='Execute a fast initialization, which skips some transaction verifications. '
                             'This is still a beta feature as it may cause issues when restarting the full node '
                             'after a crash.')
+        parser.add_argument('--verification-processes', type=int,
+                            help='Number of processes used to verify pow and signatures during a full verification '
+                            '(default: number of CPUs)')
+        parser.add_argument('--x-rocksdb-indexes', action='store_true',
+                            help='Save the wallet and tokens indexes in the RocksDB storage instead of building them '
+                            'every time the full node starts. It is not used with --cache. This is still an '
+                            'experimental feature.')
+        parser.add_argument('--x-binary-framing', action='store_true',
+                            help='Send the p2p messages in binary frames to the peers that also support them. '
+                            'This is still an experimental feature.')
         return parser
 
     def prepare(self, args: Namespace) -> None:
@@ -128,7 +138,8 @@ class RunNode:
         tx_storage: TransactionStorage
         if args.data:
             if args.rocksdb_storage:
-                tx_storage = TransactionRocksDBStorage(path=args.data, with_index=(not args.cache))
+                tx_storage = TransactionRocksDBStorage(path=args.data, with_index=(not args.cache),
+                                                       with_persistent_indexes=args.x_rocksdb_indexes)
             else:
                 tx_storage = TransactionCompactStorage(path=args.data, with_index=(not args.cache))
             log.info('with storage', storage_class=type(tx_storage).__name__, path=args.data)
@@ -168,9 +179,15 @@ class RunNode:
             print('Hostname discovered and set to {}'.format(hostname))
 
         network = settings.NETWORK_NAME
+        verification_processes = args.verification_processes or os.cpu_count() or 1
+        capabilities = [settings.CAPABILITY_WHITELIST, settings.CAPABILITY_DATA_BATCH, settings.CAPABILITY_INV,
+                        settings.CAPABILITY_TIPS_COMMITMENT, settings.CAPABILITY_BLOCK_HEADERS]
+        if args.x_binary_framing:
+            capabilities.append(settings.CAPABILITY_BINARY_FRAMING)
         self.manager = HathorManager(reactor, peer_id=peer_id, network=network, hostname=hostname,
                                      tx_storage=self.tx_storage, wallet=self.wallet, wallet_index=args.wallet_index,
-                                     stratum_port=args.stratum, min_block_weight=args.min_block_weight, ssl=True)
+                                     stratum_port=args.stratum, min_block_weight=args.min_block_weight, ssl=True,
+                                     capabilities=capabilities, verification_processes=verification_processes)
         if args.allow_mining_without_peers:
             self.manager.allow_mining_without_peers()
 
@@ -217,12 +234,14 @@ class RunNode:
             GetBlockTemplateResource,
             GraphvizFullResource,
             GraphvizNeighboursResource,
+            GraphvizRenderer,
             PushTxResource,
             SubmitBlockResource,
             TipsHistogramResource,
             TipsResource,
             TransactionAccWeightResource,
             TransactionResource,
+            TransactionsResource,
             TxParentsResource,
             ValidateAddressResource,
         )
@@ -279,10 +298,13 @@ class RunNode:
             graphviz = Resource()
             # XXX: reach the resource through /graphviz/ too, previously it was a leaf so this wasn't a problem
             graphviz.putChild(b'', graphviz)
+            graphviz_renderer = GraphvizRenderer()
             for fmt in ['dot', 'pdf', 'png', 'jpg']:
                 bfmt = fmt.encode('ascii')
-                graphviz.putChild(b'full.' + bfmt, GraphvizFullResource(self.manager, format=fmt))
-                graphviz.putChild(b'neighbours.' + bfmt, GraphvizNeighboursResource(self.manager, format=fmt))
+                graphviz.putChild(b'full.' + bfmt,
+                                  GraphvizFullResource(self.manager, format=fmt, renderer=graphviz_renderer))
+                graphviz.putChild(b'neighbours.' + bfmt,
+                                  GraphvizNeighboursResource(self.manager, format=fmt, renderer=graphviz_renderer))
 
             resources = (
                 (b'status', StatusResource(self.manager), root),
@@ -295,6 +317,7 @@ class RunNode:
                 (b'tips-histogram', TipsHistogramResource(self.manager), root),
                 (b'tips', TipsResource(self.manager), root),
                 (b'transaction', TransactionResource(self.manager), root),
+                (b'transactions', TransactionsResource(self.manager), root),
                 (b'transaction_acc_weight', TransactionAccWeightResource(self.manager), root),
                 (b'dashboard_tx', DashboardTransactionResource(self.manager), root),
                 (b'profiler', ProfilerResource(self.manager), root),
@@ -134,6 +134,28 @@ class HathorSettings(NamedTuple):
     # Maximum level of the neighborhood graph generated by graphviz
     MAX_GRAPH_LEVEL: int = 3
 
+    # Maximum number of txs and blocks in the neighborhood graph generated by graphviz
+    GRAPHVIZ_NEIGHBORHOOD_MAX_NODES: int = 300
+
+    # The full graph is not generated by graphviz when it would have more txs and blocks than this
+    GRAPHVIZ_FULL_MAX_NODES: int = 2000
+
+    # Number of graphviz graphs generated at the same time, each one in a thread
+    GRAPHVIZ_MAX_WORKERS: int = 2
+
+    # Number of different graphviz graphs waiting to be generated, the requests of new ones are refused above it
+    GRAPHVIZ_MAX_PENDING: int = 20
+
+    # Number of generated graphviz graphs kept in memory, see `GraphvizRenderer`
+    GRAPHVIZ_CACHE_SIZE: int = 100
+
+    # Maximum number of recent txs whose accumulated weight is kept up to date, see `ConfirmationTracker`
+    CONFIRMATION_TRACKER_MAX_TXS: int = 10000
+
+    # Maximum number of txs and blocks visited when a new tx adds its weight to the tracked txs, see
+    # `ConfirmationTracker`
+    CONFIRMATION_TRACKER_MAX_WALK: int = 2000
+
     # Maximum difference between our latest timestamp and a peer's synced timestamp to consider
     # that the peer is synced (in seconds).
     P2P_SYNC_THRESHOLD: int = 60
@@ -166,6 +188,9 @@ class HathorSettings(NamedTuple):
     # Maximum number of txs or blocks returned by the '/transaction' endpoint
     MAX_TX_COUNT: int = 15
 
+    # Maximum number of txs or blocks requested at once to the '/transactions' endpoint
+    MAX_TX_LOOKUP_COUNT: int = 100
+
     # URL prefix where API is served, for instance: /v1a/status
     API_VERSION_PREFIX: str = 'v1a'
 
@@ -217,6 +242,22 @@ class HathorSettings(NamedTuple):
     # Number of retries for downloading a tx from a peer (in the downloader)
     GET_DATA_RETRIES: int = 5
 
+    # Number of txs requested in each GET-DATA-BATCH message (in the downloader)
+    GET_DATA_BATCH_SIZE: int = 20
+
+    # Maximum number of txs that a peer can request in a GET-DATA-BATCH message
+    GET_DATA_BATCH_MAX_HASHES: int = 100
+
+    # Maximum size (in bytes) of the payload of a DATA-BATCH message, the txs that do not fit go in other messages
+    DATA_BATCH_MAX_SIZE: int = 32768
+
+    # Maximum number of hashes known by each peer that are kept, so we do not announce txs the peer already has
+    KNOWN_INVENTORY_MAX_SIZE: int = 10000
+
+    # Maximum size (in bytes) of the messages waiting to be sent to a peer that reads slowly. Above it, the tx relay
+    # messages are dropped and the messages of the peer are not read until half of it is sent
+    P2P_OUTBOUND_QUEUE_MAX_BYTES: int = 4194304
+
     # Maximum number of characters in a token name
     MAX_LENGTH_TOKEN_NAME: int = 30
 
@@ -255,8 +296,37 @@ class HathorSettings(NamedTuple):
     # the difficulty of all blocks, we execute the validation every N blocks only
     VERIFY_WEIGHT_EVERY_N_BLOCKS: int = 1000
 
+    # Number of txs sent at once to each worker of the verification pool, used when initializing with a full
+    # verification on more than one process
+    VERIFICATION_POOL_CHUNK_SIZE: int = 500
+
+    # Number of txs between the checkpoints of a snapshot file, which let the import stop early on a corrupted file
+    SNAPSHOT_CHECKPOINT_INTERVAL: int = 10000
+
+    # Number of values of the persistent wallet and tokens indexes kept in memory, see `IndexDB`
+    ROCKSDB_INDEXES_CACHE_SIZE: int = 100000
+
+    # Number of responses of the explorer APIs kept in memory, see `ResponseCache`
+    RESPONSE_CACHE_SIZE: int = 1000
+
     # Name of whitelist capability
     CAPABILITY_WHITELIST: str = 'whitelist'
 
+    # Name of the capability of sending the p2p messages in binary frames instead of text lines
+    CAPABILITY_BINARY_FRAMING: str = 'binary-framing'
+
+    # Name of the capability of requesting and sending many txs at once (GET-DATA-BATCH and DATA-BATCH messages)
+    CAPABILITY_DATA_BATCH: str = 'data-batch'
+
+    # Name of the capability of announcing new txs by hash (INV message) instead of sending them
+    CAPABILITY_INV: str = 'inv'
+
+    # Name of the capability of comparing the tips by their XOR commitment instead of the hash of the sorted tips
+    CAPABILITY_TIPS_COMMITMENT: str = 'tips-commitment'
+
+    # Name of the capability of downloading and validating the chain of blocks before the rest of the DAG (GET-BLOCKS
+    # and BLOCKS messages)
+    CAPABILITY_BLOCK_HEADERS: str = 'block-headers'
+
     # Where to download whitelist from
     WHITELIST_URL: Optional[str] = None
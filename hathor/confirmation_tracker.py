@@ -0,0 +1,151 @@
+from math import log
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from sortedcontainers import SortedList
+
+from hathor.conf import HathorSettings
+from hathor.indexes import TransactionIndexElement
+from hathor.transaction import BaseTransaction
+from hathor.transaction.base_transaction import sum_weights
+from hathor.transaction.storage.traversal import BFSWalk
+
+if TYPE_CHECKING:
+    from hathor.transaction.storage import TransactionStorage  # noqa: F401
+
+settings = HathorSettings()
+
+# Greater than the hash of any tx, used to find the last tx of a timestamp.
+_MAX_HASH = b'\xff' * 32
+
+
+def get_confirmation_stop_value(tx: BaseTransaction) -> Optional[float]:
+    """ Return the accumulated weight above which a tx is fully confirmed, it is None while the tx is not confirmed by
+    a block.
+    """
+    assert tx.storage is not None
+    meta = tx.get_metadata()
+    if meta.first_block is None:
+        return None
+    block = tx.storage.get_transaction(meta.first_block)
+    return block.weight + log(6, 2)
+
+
+class _TrackedTx:
+    __slots__ = ('timestamp', 'accumulated_weight', 'first_block', 'stop_value')
+
+    def __init__(self, timestamp: int, accumulated_weight: float) -> None:
+        self.timestamp = timestamp
+        self.accumulated_weight = accumulated_weight
+        # The stop value is kept along with the block it was calculated from, which changes on reorgs.
+        self.first_block: Optional[bytes] = None
+        self.stop_value: Optional[float] = None
+
+
+class ConfirmationTracker:
+    """ Keep the accumulated weight of the recent txs, so the confirmation level is known without walking the txs
+    that verify them.
+
+    The txs are tracked when they are accepted, when they are verified by nothing yet. Each tx or block accepted after
+    them adds its weight to the tracked txs it verifies (directly or not, including the funds). The backward walk
+    stops at the timestamp of the oldest tracked tx, because the timestamps grow along the DAG.
+
+    A tx is no longer tracked when it is fully confirmed (see `get_confirmation_stop_value`), or when it is the oldest
+    and there are more than `max_txs`. Its accumulated weight is then saved in its metadata. The voided txs are not
+    tracked, as they may never be confirmed, and the walk visits at most `max_walk` txs and blocks: the tracked txs it
+    does not reach are no longer tracked.
+    """
+
+    def __init__(self, max_txs: int = settings.CONFIRMATION_TRACKER_MAX_TXS,
+                 max_walk: int = settings.CONFIRMATION_TRACKER_MAX_WALK) -> None:
+        self.max_txs = max_txs
+        self.max_walk = max_walk
+        self._txs: Dict[bytes, _TrackedTx] = {}
+        self._sorted_txs: 'SortedList[TransactionIndexElement]' = SortedList()
+
+    def __contains__(self, tx_hash: bytes) -> bool:
+        return tx_hash in self._txs
+
+    def get_accumulated_weight(self, tx_hash: bytes) -> Optional[float]:
+        """ Return the accumulated weight of a tracked tx, or None if it is not tracked.
+        """
+        tracked = self._txs.get(tx_hash)
+        if tracked is None:
+            return None
+        return tracked.accumulated_weight
+
+    def add_tx(self, tx: BaseTransaction) -> None:
+        """ Add the weight of a new tx or block to the tracked txs it verifies, and track it if it is a tx.
+        """
+        assert tx.hash is not None
+        assert tx.storage is not None
+        self._untrack_voided(tx.storage)
+        if self._txs:
+            self._add_weight_to_ancestors(tx)
+        if not tx.is_block and not tx.get_metadata().voided_by:
+            self._txs[tx.hash] = _TrackedTx(tx.timestamp, tx.weight)
+            self._sorted_txs.add(TransactionIndexElement(tx.timestamp, tx.hash))
+            while len(self._txs) > self.max_txs:
+                oldest = self._sorted_txs[0]
+                self._untrack(tx.storage.get_transaction(oldest.hash))
+
+    def _untrack_voided(self, storage: 'TransactionStorage') -> None:
+        """ Stop tracking the oldest txs while they are voided, so they do not hold the walk back.
+
+        The voided txs that are not the oldest are left for later, they do not make the walk any longer.
+        """
+        while self._sorted_txs:
+            oldest = storage.get_transaction(self._sorted_txs[0].hash)
+            if not oldest.get_metadata().voided_by:
+                break
+            self._untrack(oldest)
+
+    def _add_weight_to_ancestors(self, tx: BaseTransaction) -> None:
+        assert tx.storage is not None
+        oldest_timestamp = self._sorted_txs[0].timestamp
+        untracked: List[BaseTransaction] = []
+        cut_timestamp: Optional[int] = None
+        bfs_walk = BFSWalk(tx.storage, is_dag_funds=True, is_dag_verifications=True, is_left_to_right=False)
+        for visited, ancestor in enumerate(bfs_walk.run(tx, skip_root=True)):
+            if ancestor.timestamp < oldest_timestamp:
+                # The walk is sorted by timestamp (newest first), the other ancestors are older too.
+                break
+            if visited >= self.max_walk:
+                cut_timestamp = ancestor.timestamp
+                break
+            assert ancestor.hash is not None
+            tracked = self._txs.get(ancestor.hash)
+            if tracked is None:
+                continue
+            tracked.accumulated_weight = sum_weights(tracked.accumulated_weight, tx.weight)
+            if ancestor.get_metadata().voided_by:
+                untracked.append(ancestor)
+                continue
+            stop_value = self._get_stop_value(ancestor, tracked)
+            if stop_value is not None and tracked.accumulated_weight > stop_value:
+                untracked.append(ancestor)
+        for ancestor in untracked:
+            self._untrack(ancestor)
+        if cut_timestamp is not None:
+            # The ancestors newer than the last one visited were all visited, the older ones may have been missed.
+            end = self._sorted_txs.bisect_right(TransactionIndexElement(cut_timestamp, _MAX_HASH))
+            for element in list(self._sorted_txs[:end]):
+                self._untrack(tx.storage.get_transaction(element.hash))
+
+    def _get_stop_value(self, tx: BaseTransaction, tracked: _TrackedTx) -> Optional[float]:
+        first_block = tx.get_metadata().first_block
+        if first_block != tracked.first_block:
+            tracked.first_block = first_block
+            tracked.stop_value = get_confirmation_stop_value(tx)
+        return tracked.stop_value
+
+    def _untrack(self, tx: BaseTransaction) -> None:
+        """ Stop tracking a tx, saving its accumulated weight in its metadata.
+        """
+        assert tx.hash is not None
+        assert tx.storage is not None
+        tracked = self._txs.pop(tx.hash)
+        self._sorted_txs.remove(TransactionIndexElement(tracked.timestamp, tx.hash))
+        meta = tx.get_metadata()
+        if tracked.accumulated_weight > meta.accumulated_weight:
+            meta.accumulated_weight = tracked.accumulated_weight
+            tx.storage.save_transaction(tx, only_metadata=True)
@@ -164,7 +164,7 @@ class BlockConsensusAlgorithm:
             # we need to check that block is not voided.
             meta = block.get_metadata()
             if not meta.voided_by:
-                storage._best_block_tips = [block.hash]
+                self.update_best_block_tips([block])
             # The following assert must be true, but it is commented out for performance reasons.
             #     assert len(storage.get_best_block_tips(skip_cache=True)) == 1
         else:
@@ -218,15 +218,25 @@ class BlockConsensusAlgorithm:
                     # we need to check that block is not voided.
                     meta = block.get_metadata()
                     if not meta.voided_by:
-                        storage._best_block_tips = [block.hash]
+                        self.update_best_block_tips([block])
                 else:
-                    storage._best_block_tips = [blk.hash for blk in heads]
+                    self.update_best_block_tips(heads)
 
         # Uncomment the following lines to check that the cache update is working properly.
         # You shouldn't run this test in production because it dampens performance.
         #     v = storage.get_best_block_tips(skip_cache=True)
         #     assert v == storage._best_block_tips
 
+    def update_best_block_tips(self, heads: List[Block]) -> None:
+        """ Update the cache of the best block tips and the best chain index of the storage.
+        """
+        assert heads
+        storage = heads[0].storage
+        assert storage is not None
+        storage._best_block_tips = [blk.hash for blk in heads]
+        if storage.best_chain_index is not None:
+            storage.best_chain_index.update(heads)
+
     def union_voided_by_from_parents(self, block: Block) -> Set[bytes]:
         """Return the union of the voided_by of block's parents.
 
@@ -587,6 +597,10 @@ class TransactionConsensusAlgorithm:
                 meta.conflict_with = spent_by.copy()
         tx.storage.save_transaction(tx, only_metadata=True)
 
+        twins_index = tx.storage.twins_index
+        if spent_by and twins_index is not None:
+            twins_index.add_tx(tx)
+
         for h in spent_by:
             # Update meta.conflict_with of our conflict transactions.
             conflict_tx = tx.storage.get_transaction(h)
@@ -596,6 +610,9 @@ class TransactionConsensusAlgorithm:
             else:
                 tx_meta.conflict_with = [tx.hash]
             tx.storage.save_transaction(conflict_tx, only_metadata=True)
+            if twins_index is not None:
+                assert isinstance(conflict_tx, Transaction)
+                twins_index.add_tx(conflict_tx)
 
         # Add ourselves to meta.spent_by of our input.
         spent_by.append(tx.hash)
@@ -611,8 +628,16 @@ class TransactionConsensusAlgorithm:
         if not meta.conflict_with:
             return
 
-        conflict_txs = [tx.storage.get_transaction(h) for h in meta.conflict_with]
-        self.check_twins(tx, conflict_txs)
+        twins_index = tx.storage.twins_index
+        if twins_index is None:
+            conflict_txs = [tx.storage.get_transaction(h) for h in meta.conflict_with]
+            self.check_twins(tx, conflict_txs)
+            return
+
+        # Twins spend the same outputs, so they are all in conflict_with and were added to the index when the
+        # conflicts were found. Only the twins are loaded.
+        twins = twins_index.get_twins(tx)
+        self.check_twins(tx, [tx.storage.get_transaction(h) for h in meta.conflict_with if h in twins])
 
     def check_twins(self, tx: Transaction, transactions: Iterable[BaseTransaction]) -> None:
         """ Check if the tx has any twins in transactions list
@@ -627,40 +652,25 @@ class TransactionConsensusAlgorithm:
         # Getting tx metadata to save the new twins
         meta = tx.get_metadata()
 
-        # Sorting inputs and outputs for easier validation
-        sorted_inputs = sorted(tx.inputs, key=lambda x: (x.tx_id, x.index, x.data))
-        sorted_outputs = sorted(tx.outputs, key=lambda x: (x.script, x.value))
+        twins_index = tx.storage.twins_index
+        if twins_index is not None:
+            fingerprint = twins_index.add_tx(tx)
+        else:
+            fingerprint = tx.get_twin_fingerprint()
 
         for candidate in transactions:
             assert candidate.hash is not None
 
-            # If quantity of inputs is different, it's not a twin.
-            if len(candidate.inputs) != len(tx.inputs):
-                continue
-
-            # If quantity of outputs is different, it's not a twin.
-            if len(candidate.outputs) != len(tx.outputs):
-                continue
-
             # If the hash is the same, it's not a twin.
             if candidate.hash == tx.hash:
                 continue
 
-            # Verify if all the inputs are the same
-            equal = True
-            for index, tx_input in enumerate(sorted(candidate.inputs, key=lambda x: (x.tx_id, x.index, x.data))):
-                if (tx_input.tx_id != sorted_inputs[index].tx_id or tx_input.data != sorted_inputs[index].data
-                        or tx_input.index != sorted_inputs[index].index):
-                    equal = False
-                    break
-
-            # Verify if all the outputs are the same
-            if equal:
-                for index, tx_output in enumerate(sorted(candidate.outputs, key=lambda x: (x.script, x.value))):
-                    if (tx_output.value != sorted_outputs[index].value
-                            or tx_output.script != sorted_outputs[index].script):
-                        equal = False
-                        break
+            # Twins have the same inputs and outputs, which is what the fingerprint is made of.
+            assert isinstance(candidate, Transaction)
+            if twins_index is not None:
+                equal = twins_index.add_tx(candidate) == fingerprint
+            else:
+                equal = candidate.get_twin_fingerprint() == fingerprint
 
             # If everything is equal we add in both metadatas
             if equal:
@@ -1,6 +1,6 @@
-
+from collections import deque
 from itertools import chain
-from typing import Dict, Iterator, Set
+from typing import Dict, Iterator, Optional, Set
 
 from graphviz import Digraph
 
@@ -155,11 +155,13 @@ class GraphvizVisualizer:
         return dot
 
     def tx_neighborhood(self, tx: BaseTransaction, format: str = 'pdf',
-                        max_level: int = 2, graph_type: str = 'verification') -> Digraph:
+                        max_level: int = 2, graph_type: str = 'verification',
+                        max_nodes: Optional[int] = None) -> Digraph:
         """ Draw the blocks and transactions around `tx`.
 
         :params max_level: Maximum distance between `tx` and the others.
         :params graph_type: Graph type to be generated. Possibilities are 'verification' and 'funds'
+        :params max_nodes: Maximum number of blocks and transactions visited, the closest ones are visited first.
         """
         dot = Digraph(format=format)
         dot.attr(rankdir='RL')
@@ -167,11 +169,14 @@ class GraphvizVisualizer:
         dot.attr('node', shape='oval', style='')
 
         root = tx
-        to_visit = [(0, tx)]
+        to_visit = deque([(0, tx)])
         seen = set([tx.hash])
 
+        def can_visit() -> bool:
+            return max_nodes is None or len(seen) < max_nodes
+
         while to_visit:
-            level, tx = to_visit.pop()
+            level, tx = to_visit.popleft()
             assert tx.hash is not None
             assert tx.storage is not None
             name = tx.hash.hex()
@@ -190,7 +195,7 @@ class GraphvizVisualizer:
 
                 if level <= max_level:
                     for h in chain(tx.parents, meta.children):
-                        if h not in seen:
+                        if h not in seen and can_visit():
                             seen.add(h)
                             tx2 = tx.storage.get_transaction(h)
                             to_visit.append((level + 1, tx2))
@@ -206,7 +211,7 @@ class GraphvizVisualizer:
                     spent_outputs_ids = chain.from_iterable(meta.spent_outputs.values())
                     tx_input_ids = [txin.tx_id for txin in tx.inputs]
                     for h in chain(tx_input_ids, spent_outputs_ids):
-                        if h not in seen:
+                        if h not in seen and can_visit():
                             seen.add(h)
                             tx2 = tx.storage.get_transaction(h)
                             to_visit.append((level + 1, tx2))
@@ -14,16 +14,30 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from bisect import bisect_right
 from collections import defaultdict
 from math import inf
-from typing import TYPE_CHECKING, DefaultDict, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, cast
+from typing import (
+    TYPE_CHECKING,
+    Container,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    cast,
+)
 
 from intervaltree import Interval, IntervalTree
-from sortedcontainers import SortedKeyList
+from sortedcontainers import SortedDict, SortedKeyList
 from structlog import get_logger
 
 from hathor.pubsub import HathorEvents
-from hathor.transaction import BaseTransaction, Transaction
+from hathor.transaction import BaseTransaction, Block, Transaction
 from hathor.transaction.base_transaction import TxVersion
 from hathor.transaction.scripts import parse_address_script
 
@@ -97,6 +111,78 @@ class IndexesManager:
         return self.txs_index.get_newer(timestamp, hash_bytes, count)
 
 
+class TipsCommitment:
+    """ Order-independent commitment of the tips at any timestamp, which is the XOR of their hashes.
+
+    The hash of an interval [begin, end) is toggled at `begin` and toggled back at `end`, so the commitment at a
+    timestamp is the XOR of all toggles at or before it. The toggles are kept by timestamp, together with the prefix
+    XORs of the first ones (the checkpoints). A change invalidates the checkpoints from its timestamp on, and they are
+    only recomputed when queried. As the changes are usually at the newest timestamps, a query takes O(log n).
+
+    The number of tips is kept the same way.
+    """
+
+    # Size of the hashes, in bytes.
+    HASH_SIZE = 32
+
+    def __init__(self) -> None:
+        # XOR of the hashes toggled and variation of the number of tips at each timestamp.
+        self.toggles: 'SortedDict[float, Tuple[int, int]]' = SortedDict()
+
+        # Commitment and number of tips at each of the first timestamps of `toggles`.
+        self.checkpoints: List[Tuple[int, int]] = []
+
+    @classmethod
+    def calculate(cls, hashes: Iterable[bytes]) -> bytes:
+        """ Return the commitment of a set of tips.
+        """
+        value = 0
+        for hash_bytes in hashes:
+            value ^= int.from_bytes(hash_bytes, 'big')
+        return value.to_bytes(cls.HASH_SIZE, 'big')
+
+    def add_interval(self, interval: Interval) -> None:
+        """ Add the interval of a transaction.
+        """
+        value = int.from_bytes(interval.data, 'big')
+        self._toggle(interval.begin, value, 1)
+        self._toggle(interval.end, value, -1)
+
+    def remove_interval(self, interval: Interval) -> None:
+        """ Remove the interval of a transaction.
+        """
+        value = int.from_bytes(interval.data, 'big')
+        self._toggle(interval.begin, value, -1)
+        self._toggle(interval.end, value, 1)
+
+    def _toggle(self, timestamp: float, value: int, delta: int) -> None:
+        if timestamp == inf:
+            return
+        old_value, old_delta = self.toggles.get(timestamp, (0, 0))
+        new_value, new_delta = old_value ^ value, old_delta + delta
+        if new_value == 0 and new_delta == 0:
+            del self.toggles[timestamp]
+        else:
+            self.toggles[timestamp] = (new_value, new_delta)
+        del self.checkpoints[self.toggles.bisect_left(timestamp):]
+
+    def get(self, timestamp: float) -> Tuple[bytes, int]:
+        """ Return the commitment and the number of tips at a timestamp.
+        """
+        index = self.toggles.bisect_right(timestamp)
+        if index == 0:
+            return bytes(self.HASH_SIZE), 0
+        checkpoints = self.checkpoints
+        if index > len(checkpoints):
+            value, count = checkpoints[-1] if checkpoints else (0, 0)
+            for toggle_value, delta in self.toggles.values()[len(checkpoints):index]:
+                value ^= toggle_value
+                count += delta
+                checkpoints.append((value, count))
+        value, count = checkpoints[index - 1]
+        return value.to_bytes(self.HASH_SIZE, 'big'), count
+
+
 class TipsIndex:
     """ Use an interval tree to quick get the tips at a given timestamp.
 
@@ -120,10 +206,22 @@ class TipsIndex:
     # It is useful because the interval tree allows access only by the interval.
     tx_last_interval: Dict[bytes, Interval]
 
+    # Commitment of the tips at any timestamp, it is kept with the intervals of the tree.
+    commitment: TipsCommitment
+
     def __init__(self) -> None:
         self.log = logger.new()
         self.tree = IntervalTree()
         self.tx_last_interval = {}  # Dict[bytes(hash), Interval]
+        self.commitment = TipsCommitment()
+
+    def _add_interval(self, interval: Interval) -> None:
+        self.tree.add(interval)
+        self.commitment.add_interval(interval)
+
+    def _remove_interval(self, interval: Interval) -> None:
+        self.tree.remove(interval)
+        self.commitment.remove_interval(interval)
 
     def add_tx(self, tx: BaseTransaction) -> bool:
         """ Add a new transaction to the index
@@ -141,9 +239,9 @@ class TipsIndex:
             if not pi:
                 continue
             if tx.timestamp < pi.end:
-                self.tree.remove(pi)
+                self._remove_interval(pi)
                 new_interval = Interval(pi.begin, tx.timestamp, pi.data)
-                self.tree.add(new_interval)
+                self._add_interval(new_interval)
                 self.tx_last_interval[parent_hash] = new_interval
 
         # Check whether any children has already been added.
@@ -157,7 +255,7 @@ class TipsIndex:
 
         # Add the interval to the tree.
         interval = Interval(tx.timestamp, min_timestamp, tx.hash)
-        self.tree.add(interval)
+        self._add_interval(interval)
         self.tx_last_interval[tx.hash] = interval
         return True
 
@@ -174,7 +272,7 @@ class TipsIndex:
         if not relax_assert:
             assert interval.end == inf
 
-        self.tree.remove(interval)
+        self._remove_interval(interval)
 
         # Update its parents as tips if needed.
         # FIXME Although it works, it does not seem to be a good solution.
@@ -205,14 +303,59 @@ class TipsIndex:
                 min_timestamp = min(min_timestamp, child.timestamp)
 
         if min_timestamp != pi.end:
-            self.tree.remove(pi)
+            self._remove_interval(pi)
             new_interval = Interval(pi.begin, min_timestamp, pi.data)
-            self.tree.add(new_interval)
+            self._add_interval(new_interval)
             self.tx_last_interval[tx.hash] = new_interval
 
     def __getitem__(self, index: float) -> Set[Interval]:
         return self.tree[index]
 
+    def overlap(self, begin: float, end: float) -> Set[Interval]:
+        """ Return the intervals of the txs that are tips at any timestamp in [begin, end).
+        """
+        return self.tree.overlap(begin, end)
+
+    def get_histogram(self, begin: int, end: int, bucket: int = 1) -> List[Tuple[int, int]]:
+        """ Return the number of tips in each bucket of `bucket` seconds of [begin, end], as a list of
+        `(first timestamp of the bucket, number of tips)`. The number of a bucket is the maximum number of tips at
+        any of its timestamps, so buckets of one second have the number of tips at each timestamp.
+
+        It sweeps the sorted begins and ends of the intervals inside [begin, end] instead of querying the tree for
+        each timestamp.
+        """
+        assert bucket > 0
+        events: List[Tuple[float, int]] = []
+        for interval in self.overlap(begin, end + 1):
+            events.append((max(interval.begin, begin), 1))
+            if interval.end <= end:
+                events.append((interval.end, -1))
+        events.sort()
+
+        histogram = []
+        count = 0
+        index = 0
+        for timestamp in range(begin, end + 1, bucket):
+            while index < len(events) and events[index][0] <= timestamp:
+                count += events[index][1]
+                index += 1
+            peak = count
+            bucket_end = min(timestamp + bucket, end + 1)
+            while index < len(events) and events[index][0] < bucket_end:
+                # All the events at the same timestamp are applied before the number of tips is checked.
+                event_timestamp = events[index][0]
+                while index < len(events) and events[index][0] == event_timestamp:
+                    count += events[index][1]
+                    index += 1
+                peak = max(peak, count)
+            histogram.append((timestamp, peak))
+        return histogram
+
+    def get_commitment(self, timestamp: float) -> Tuple[bytes, int]:
+        """ Return the commitment of the tips at a timestamp and their number, see `TipsCommitment`.
+        """
+        return self.commitment.get(timestamp)
+
 
 def get_newest_sorted_key_list(key_list: 'SortedKeyList[TransactionIndexElement]', count: int
                                ) -> Tuple[List[bytes], bool]:
@@ -354,12 +497,198 @@ class TransactionsIndex:
         idx = self.transactions.bisect_key_left((timestamp, b''))
         return idx
 
+    def iter_from(self, timestamp: int) -> Iterator[TransactionIndexElement]:
+        """ Iterate over the elements in order, starting at the first one at or after the given timestamp.
+
+        It works as a cursor over the index, so nothing is copied. The index must not be changed while iterating.
+
+        :param timestamp: timestamp of the first element
+        """
+        return self.transactions.islice(self.find_first_at_timestamp(timestamp))
+
+
+class BestChainIndex:
+    """ Index of the blocks of the best chain by height, from the genesis to the head.
+
+    As the timestamps always increase along a chain, it also gives the height of the best chain at any timestamp
+    using a binary search.
+
+    It is updated with the heads of the best chain every time they change, walking back only until the first block
+    that is already in the index. So, a reorg costs the number of blocks that changed, and a new block costs O(1).
+    """
+
+    # Hashes of the blocks in the best chain, where the position is the height.
+    hashes: List[bytes]
+
+    # Timestamps of the blocks in the best chain, in the same positions as `hashes`.
+    timestamps: List[int]
+
+    # Heads used in the last update, None when the index must be rebuilt.
+    heads: Optional[List[bytes]]
+
+    def __init__(self) -> None:
+        self.hashes = []
+        self.timestamps = []
+        self.heads = None
+
+    def update(self, heads: List[Block]) -> None:
+        """ Update the index to the best chain ending in one of the `heads`.
+
+        When there is more than one head, i.e., multiple best chains, the highest one is used.
+
+        :param heads: Heads of the best chains, usually `storage.get_best_block_tips()`
+        """
+        assert heads
+        block = max(heads, key=lambda blk: blk.get_metadata().height)
+        head_height = block.get_metadata().height
+
+        # walk back until a block that is already in the index, all the ones before it are also there
+        new_blocks: List[Block] = []
+        height = head_height
+        while height >= len(self.hashes) or self.hashes[height] != block.hash:
+            new_blocks.append(block)
+            if not block.parents:
+                assert block.is_genesis
+                break
+            block = block.get_block_parent()
+            height -= 1
+
+        start = head_height - len(new_blocks) + 1
+        del self.hashes[start:]
+        del self.timestamps[start:]
+        for blk in reversed(new_blocks):
+            assert blk.hash is not None
+            self.hashes.append(blk.hash)
+            self.timestamps.append(blk.timestamp)
+        self.heads = [blk.hash for blk in heads if blk.hash is not None]
+
+    def del_block(self, block: Block) -> None:
+        """ Remove a block and all the blocks after it, the index must be updated before it is used again.
+        """
+        height = block.get_metadata().height
+        if height < len(self.hashes) and self.hashes[height] == block.hash:
+            del self.hashes[height:]
+            del self.timestamps[height:]
+        self.heads = None
+
+    def get_height(self) -> int:
+        """ Height of the head of the best chain.
+        """
+        return len(self.hashes) - 1
+
+    def get_hash(self, height: int) -> Optional[bytes]:
+        """ Hash of the block of the best chain at the given height, or None if there is none.
+        """
+        if 0 <= height < len(self.hashes):
+            return self.hashes[height]
+        return None
+
+    def get_hashes_before(self, height: int, count: int) -> List[bytes]:
+        """ Hashes of up to `count` blocks of the best chain right before `height`, from the newest to the oldest.
+        """
+        start = max(height - count, 0)
+        return self.hashes[start:height][::-1]
+
+    def get_hashes_after(self, height: int, count: int) -> List[bytes]:
+        """ Hashes of up to `count` blocks of the best chain right after `height`, from the oldest to the newest.
+        """
+        return self.hashes[height + 1:height + 1 + count]
+
+    def get_height_at_timestamp(self, timestamp: float) -> int:
+        """ Height of the last block of the best chain whose timestamp is at most `timestamp`, or -1 if there is none.
+        """
+        return bisect_right(self.timestamps, timestamp) - 1
+
+    def is_in_best_chain(self, block: Block) -> bool:
+        """ Whether the block is in the best chain.
+        """
+        return self.get_hash(block.get_metadata().height) == block.hash
+
+
+class TwinsIndex:
+    """ Index of transactions by their twin fingerprint, see `Transaction.get_twin_fingerprint`.
+
+    Twins always spend the same outputs, so only the txs that have conflicts must be added, which is done by the
+    consensus when the conflicts are found. The fingerprint of each tx is computed only once.
+    """
+
+    # Fingerprint of each tx in the index.
+    fingerprints: Dict[bytes, bytes]
+
+    # Hashes of the txs in the index by fingerprint.
+    txs: DefaultDict[bytes, Set[bytes]]
+
+    def __init__(self) -> None:
+        self.fingerprints = {}
+        self.txs = defaultdict(set)
+
+    def add_tx(self, tx: Transaction) -> bytes:
+        """ Add a transaction to the index, if needed, and return its fingerprint.
+        """
+        assert tx.hash is not None
+        fingerprint = self.fingerprints.get(tx.hash)
+        if fingerprint is None:
+            fingerprint = tx.get_twin_fingerprint()
+            self.fingerprints[tx.hash] = fingerprint
+            self.txs[fingerprint].add(tx.hash)
+        return fingerprint
+
+    def del_tx(self, tx: BaseTransaction) -> None:
+        """ Delete a transaction from the index.
+        """
+        assert tx.hash is not None
+        fingerprint = self.fingerprints.pop(tx.hash, None)
+        if fingerprint is None:
+            return
+        hashes = self.txs[fingerprint]
+        hashes.discard(tx.hash)
+        if not hashes:
+            del self.txs[fingerprint]
+
+    def get_twins(self, tx: Transaction) -> Set[bytes]:
+        """ Hashes of the txs in the index that are twins of `tx`, which is added to the index.
+        """
+        fingerprint = self.add_tx(tx)
+        return self.txs[fingerprint] - {tx.hash}
+
 
 class WalletIndex:
     """ Index of inputs/outputs by address
     """
+
+    class TokenBalance:
+        """ Class used to track the balance of a token in an address
+
+        Only the txs that are not voided are counted. 'utxos' has the outputs of those txs that none of them spend,
+        the expected key is (tx_id, index) and the value is the output's value.
+        """
+
+        def __init__(self) -> None:
+            self.received = 0
+            self.spent = 0
+            self.utxos: Dict[Tuple[bytes, int], int] = {}
+
+        @property
+        def balance(self) -> int:
+            return self.received - self.spent
+
     def __init__(self, pubsub: Optional['PubSubManager'] = None) -> None:
-        self.index: DefaultDict[str, Set[bytes]] = defaultdict(set)
+        # Saves the (timestamp, hash) of the transactions of each address
+        self.index: DefaultDict[str, 'SortedKeyList[TransactionIndexElement]'] = defaultdict(
+            lambda: SortedKeyList(key=lambda x: (x.timestamp, x.hash)))
+        # Same as `index`, but only the transactions with inputs or outputs of a given token in the address
+        self.token_index: DefaultDict[Tuple[str, bytes], 'SortedKeyList[TransactionIndexElement]'] = defaultdict(
+            lambda: SortedKeyList(key=lambda x: (x.timestamp, x.hash)))
+        # Balance of each token of each address, kept up to date as txs are added, voided and unvoided
+        self.balances: DefaultDict[str, DefaultDict[bytes, WalletIndex.TokenBalance]] = defaultdict(
+            lambda: defaultdict(self.TokenBalance))
+        # Txs whose inputs and outputs are counted in the balances
+        self.counted_txs: Set[bytes] = set()
+        # Addresses whose history is published, all of them when it is None. The websocket factory sets it to the
+        # addresses that have subscribers, see `HathorAdminWebsocketFactory`.
+        self.address_filter: Optional[Container[str]] = None
+        # The history is not published while the manager loads the txs of the storage
+        self.is_publishing = True
         self.pubsub = pubsub
         if self.pubsub:
             self.subscribe_pubsub_events()
@@ -373,35 +702,56 @@ class WalletIndex:
         for event in events:
             self.pubsub.subscribe(event, self.handle_tx_event)
 
-    def _get_addresses(self, tx: BaseTransaction) -> Set[str]:
-        """ Return a set of addresses collected from tx's inputs and outputs.
+    def unsubscribe_pubsub_events(self) -> None:
+        """ Stop receiving the voided/winner tx pubsub events
+        """
+        assert self.pubsub is not None
+        for event in [HathorEvents.STORAGE_TX_VOIDED, HathorEvents.STORAGE_TX_WINNER]:
+            self.pubsub.unsubscribe(event, self.handle_tx_event)
+
+    def _get_addresses_and_tokens(self, tx: BaseTransaction) -> Set[Tuple[str, bytes]]:
+        """ Return a set of (address, token_uid) collected from tx's inputs and outputs.
         """
         assert tx.storage is not None
-        addresses: Set[str] = set()
+        addresses_and_tokens: Set[Tuple[str, bytes]] = set()
 
-        def add_address_from_output(output: 'TxOutput') -> None:
+        def add_address_from_output(tx2: BaseTransaction, output: 'TxOutput') -> None:
             script_type_out = parse_address_script(output.script)
             if script_type_out:
                 address = script_type_out.address
-                addresses.add(address)
+                addresses_and_tokens.add((address, tx2.get_token_uid(output.get_token_index())))
 
         for txin in tx.inputs:
             tx2 = tx.storage.get_transaction(txin.tx_id)
             txout = tx2.outputs[txin.index]
-            add_address_from_output(txout)
+            add_address_from_output(tx2, txout)
 
         for txout in tx.outputs:
-            add_address_from_output(txout)
+            add_address_from_output(tx, txout)
 
-        return addresses
+        return addresses_and_tokens
+
+    def _get_addresses(self, tx: BaseTransaction) -> Set[str]:
+        """ Return a set of addresses collected from tx's inputs and outputs.
+        """
+        return {address for address, _ in self._get_addresses_and_tokens(tx)}
 
     def publish_tx(self, tx: BaseTransaction, *, addresses: Optional[Iterable[str]] = None) -> None:
-        """ Publish WALLET_ADDRESS_HISTORY for all addresses of a transaction.
+        """ Publish WALLET_ADDRESS_HISTORY for all addresses of a transaction that pass `address_filter`.
+
+        The tx is only serialized when some address passes the filter.
         """
-        if not self.pubsub:
+        if not self.pubsub or not self.is_publishing:
+            return
+        if not self.pubsub.has_subscribers(HathorEvents.WALLET_ADDRESS_HISTORY):
             return
         if addresses is None:
             addresses = self._get_addresses(tx)
+        if self.address_filter is not None:
+            address_filter = self.address_filter
+            addresses = [address for address in addresses if address in address_filter]
+        if not addresses:
+            return
         data = tx.to_json_extended()
         for address in addresses:
             self.pubsub.publish(HathorEvents.WALLET_ADDRESS_HISTORY, address=address, history=data)
@@ -411,9 +761,16 @@ class WalletIndex:
         """
         assert tx.hash is not None
 
-        addresses = self._get_addresses(tx)
+        element = TransactionIndexElement(tx.timestamp, tx.hash)
+        addresses_and_tokens = self._get_addresses_and_tokens(tx)
+        addresses = {address for address, _ in addresses_and_tokens}
         for address in addresses:
-            self.index[address].add(tx.hash)
+            if element not in self.index[address]:
+                self.index[address].add(element)
+        for address_and_token in addresses_and_tokens:
+            if element not in self.token_index[address_and_token]:
+                self.token_index[address_and_token].add(element)
+        self._update_balances(tx)
 
         self.publish_tx(tx, addresses=addresses)
 
@@ -422,9 +779,90 @@ class WalletIndex:
         """
         assert tx.hash is not None
 
-        addresses = self._get_addresses(tx)
-        for address in addresses:
-            self.index[address].discard(tx.hash)
+        element = TransactionIndexElement(tx.timestamp, tx.hash)
+        for address, token_uid in self._get_addresses_and_tokens(tx):
+            self.index[address].discard(element)
+            self.token_index[(address, token_uid)].discard(element)
+        self._update_balances(tx, removed=True)
+
+    def _get_balance_address(self, output: 'TxOutput') -> Optional[str]:
+        """ Return the address whose balance has the output, authorities are not in any balance.
+        """
+        if output.is_token_authority():
+            return None
+        script_type_out = parse_address_script(output.script)
+        if script_type_out is None:
+            return None
+        return script_type_out.address
+
+    def _is_output_spent(self, tx: BaseTransaction, index: int) -> bool:
+        """ Whether a counted tx spends the output.
+        """
+        spent_by = tx.get_metadata().spent_outputs.get(index, [])
+        return any(h in self.counted_txs for h in spent_by)
+
+    def _update_balances(self, tx: BaseTransaction, *, removed: bool = False) -> None:
+        """ Count the inputs and outputs of tx in the balances when it is not voided, and discount them when it is
+        voided or removed. It does nothing when the balances already agree with the tx.
+        """
+        assert tx.hash is not None
+        assert tx.storage is not None
+        counted = not removed and not tx.get_metadata().voided_by
+        if counted == (tx.hash in self.counted_txs):
+            return
+        if counted:
+            self.counted_txs.add(tx.hash)
+            sign = 1
+        else:
+            self.counted_txs.discard(tx.hash)
+            sign = -1
+
+        for txin in tx.inputs:
+            spent_tx = tx.storage.get_transaction(txin.tx_id)
+            txout = spent_tx.outputs[txin.index]
+            address = self._get_balance_address(txout)
+            if address is None:
+                continue
+            token_uid = spent_tx.get_token_uid(txout.get_token_index())
+            key = (txin.tx_id, txin.index)
+            if counted:
+                self._remove_utxo(address, token_uid, key)
+            elif txin.tx_id in self.counted_txs and not self._is_output_spent(spent_tx, txin.index):
+                self._add_utxo(address, token_uid, key, txout.value)
+            self._add_to_balance(address, token_uid, 0, sign * txout.value)
+
+        for index, txout in enumerate(tx.outputs):
+            address = self._get_balance_address(txout)
+            if address is None:
+                continue
+            token_uid = tx.get_token_uid(txout.get_token_index())
+            key = (tx.hash, index)
+            if not counted:
+                self._remove_utxo(address, token_uid, key)
+            elif not self._is_output_spent(tx, index):
+                self._add_utxo(address, token_uid, key, txout.value)
+            self._add_to_balance(address, token_uid, sign * txout.value, 0)
+
+    def _add_to_balance(self, address: str, token_uid: bytes, received: int, spent: int) -> None:
+        """ Add to the amounts received and spent of a token in an address. The balances that no counted tx has are
+        removed, just like the ones never counted.
+        """
+        balances = self.balances[address]
+        balance = balances[token_uid]
+        balance.received += received
+        balance.spent += spent
+        if not balance.received and not balance.spent:
+            del balances[token_uid]
+            if not balances:
+                del self.balances[address]
+
+    def _add_utxo(self, address: str, token_uid: bytes, key: Tuple[bytes, int], value: int) -> None:
+        self.balances[address][token_uid].utxos[key] = value
+
+    def _remove_utxo(self, address: str, token_uid: bytes, key: Tuple[bytes, int]) -> None:
+        balances = self.balances.get(address)
+        if balances is not None and token_uid in balances:
+            balances[token_uid].utxos.pop(key, None)
 
     def handle_tx_event(self, key: HathorEvents, args: 'EventArguments') -> None:
         """ This method is called when pubsub publishes an event that we subscribed
@@ -432,22 +870,86 @@ class WalletIndex:
         data = args.__dict__
         tx = data['tx']
         meta = tx.get_metadata()
+        addresses = self._get_addresses(tx)
+        element = TransactionIndexElement(tx.timestamp, tx.hash)
+        if tx.hash in self.counted_txs or any(element in self.index.get(address, ()) for address in addresses):
+            self._update_balances(tx)
         if meta.has_voided_by_changed_since_last_call() or meta.has_spent_by_changed_since_last_call():
-            self.publish_tx(tx)
+            self.publish_tx(tx, addresses=addresses)
+
+    def _get_key_list(self, address: str, token_uid: Optional[bytes] = None
+                      ) -> 'SortedKeyList[TransactionIndexElement]':
+        """ Get the sorted key list of an address, or of a token in the address. It is empty when it is unknown.
+        """
+        if token_uid is None:
+            key_list = self.index.get(address)
+        else:
+            key_list = self.token_index.get((address, token_uid))
+        if key_list is None:
+            return SortedKeyList(key=lambda x: (x.timestamp, x.hash))
+        return key_list
 
     def get_from_address(self, address: str) -> List[bytes]:
-        """ Get list of transaction hashes of an address
+        """ Get list of transaction hashes of an address, sorted by timestamp and hash
         """
-        return list(self.index[address])
+        return [element.hash for element in self._get_key_list(address)]
 
-    def get_sorted_from_address(self, address: str) -> List[bytes]:
-        """ Get a sorted list of transaction hashes of an address
+    def iter_from_address(self, address: str, timestamp: int = 0, hash_bytes: bytes = b'') -> Iterator[bytes]:
+        """ Iterate over the transaction hashes of an address from the oldest to the newest, starting at the
+        timestamp/hash_bytes reference (included)
         """
-        return sorted(self.index[address])
+        key_list = self._get_key_list(address)
+        for element in key_list.irange_key(min_key=(timestamp, hash_bytes)):
+            yield element.hash
+
+    def has_transaction(self, address: str, tx: BaseTransaction, token_uid: Optional[bytes] = None) -> bool:
+        """ Whether the transaction is in the index of an address (or of a token in the address)
+        """
+        assert tx.hash is not None
+        return TransactionIndexElement(tx.timestamp, tx.hash) in self._get_key_list(address, token_uid)
+
+    def get_transactions_count(self, address: str, token_uid: Optional[bytes] = None) -> int:
+        """ Get quantity of transactions of an address (or of a token in the address)
+        """
+        return len(self._get_key_list(address, token_uid))
+
+    def get_newest_transactions(self, address: str, count: int, token_uid: Optional[bytes] = None
+                                ) -> Tuple[List[bytes], bool]:
+        """ Get transactions of an address (or of a token in the address) from the newest to the oldest
+        """
+        return get_newest_sorted_key_list(self._get_key_list(address, token_uid), count)
+
+    def get_older_transactions(self, address: str, timestamp: int, hash_bytes: bytes, count: int,
+                               token_uid: Optional[bytes] = None) -> Tuple[List[bytes], bool]:
+        """ Get transactions of an address (or of a token in the address) from the timestamp/hash_bytes reference
+        to the oldest
+        """
+        return get_older_sorted_key_list(self._get_key_list(address, token_uid), timestamp, hash_bytes, count)
+
+    def get_newer_transactions(self, address: str, timestamp: int, hash_bytes: bytes, count: int,
+                               token_uid: Optional[bytes] = None) -> Tuple[List[bytes], bool]:
+        """ Get transactions of an address (or of a token in the address) from the timestamp/hash_bytes reference
+        to the newest
+        """
+        return get_newer_sorted_key_list(self._get_key_list(address, token_uid), timestamp, hash_bytes, count)
 
     def is_address_empty(self, address: str) -> bool:
         return not bool(self.index[address])
 
+    def get_balances(self, address: str) -> Dict[bytes, 'WalletIndex.TokenBalance']:
+        """ Get the balance of each token of an address, indexed by token uid
+        """
+        if address not in self.balances:
+            return {}
+        return dict(self.balances[address])
+
+    def get_utxos(self, address: str, token_uid: bytes) -> Dict[Tuple[bytes, int], int]:
+        """ Get the unspent outputs of a token in an address, see `TokenBalance.utxos`.
+        """
+        if address not in self.balances or token_uid not in self.balances[address]:
+            return {}
+        return dict(self.balances[address][token_uid].utxos)
+
 
 class TokensIndex:
     """ Index of tokens by token uid
@@ -477,6 +979,21 @@ class TokensIndex:
     def __init__(self) -> None:
         self.tokens: Dict[bytes, TokensIndex.TokenStatus] = defaultdict(lambda: self.TokenStatus())
 
+    def _get_status(self, token_uid: bytes) -> 'TokensIndex.TokenStatus':
+        """ Get the status of a token to be changed, it is created when it is unknown.
+        """
+        return self.tokens[token_uid]
+
+    def _save_status(self, token_uid: bytes, status: 'TokensIndex.TokenStatus') -> None:
+        """ Save the status of a token after it is changed. The statuses in memory are changed in place.
+        """
+
+    def _delete_status(self, token_uid: bytes) -> None:
+        del self.tokens[token_uid]
+
+    def _get_transactions(self, token_uid: bytes) -> 'SortedKeyList[TransactionIndexElement]':
+        return self.tokens[token_uid].transactions
+
     def _add_to_index(self, tx: BaseTransaction, index: int) -> None:
         """ Add tx to mint/melt indexes and total amount
         """
@@ -484,16 +1001,18 @@ class TokensIndex:
 
         tx_output = tx.outputs[index]
         token_uid = tx.get_token_uid(tx_output.get_token_index())
+        status = self._get_status(token_uid)
 
         if tx_output.is_token_authority():
             if tx_output.can_mint_token():
                 # add to mint index
-                self.tokens[token_uid].mint.add((tx.hash, index))
+                status.mint.add((tx.hash, index))
             if tx_output.can_melt_token():
                 # add to melt index
-                self.tokens[token_uid].melt.add((tx.hash, index))
+                status.melt.add((tx.hash, index))
         else:
-            self.tokens[token_uid].total += tx_output.value
+            status.total += tx_output.value
+        self._save_status(token_uid, status)
 
     def _remove_from_index(self, tx: BaseTransaction, index: int) -> None:
         """ Remove tx from mint/melt indexes and total amount
@@ -502,16 +1021,18 @@ class TokensIndex:
 
         tx_output = tx.outputs[index]
         token_uid = tx.get_token_uid(tx_output.get_token_index())
+        status = self._get_status(token_uid)
 
         if tx_output.is_token_authority():
             if tx_output.can_mint_token():
                 # remove from mint index
-                self.tokens[token_uid].mint.discard((tx.hash, index))
+                status.mint.discard((tx.hash, index))
             if tx_output.can_melt_token():
                 # remove from melt index
-                self.tokens[token_uid].melt.discard((tx.hash, index))
+                status.melt.discard((tx.hash, index))
         else:
-            self.tokens[token_uid].total -= tx_output.value
+            status.total -= tx_output.value
+        self._save_status(token_uid, status)
 
     def add_tx(self, tx: BaseTransaction) -> None:
         """ Checks if this tx has mint or melt inputs/outputs and adds to tokens index
@@ -528,15 +1049,16 @@ class TokensIndex:
             from hathor.transaction.token_creation_tx import TokenCreationTransaction
             tx = cast(TokenCreationTransaction, tx)
             assert tx.hash is not None
-            status = self.tokens[tx.hash]
+            status = self._get_status(tx.hash)
             status.name = tx.token_name
             status.symbol = tx.token_symbol
+            self._save_status(tx.hash, status)
 
         if tx.is_transaction:
             # Adding this tx to the transactions key list
             assert isinstance(tx, Transaction)
             for token_uid in tx.tokens:
-                transactions = self.tokens[token_uid].transactions
+                transactions = self._get_transactions(token_uid)
                 # It is safe to use the in operator because it is O(log(n)).
                 # http://www.grantjenks.com/docs/sortedcontainers/sortedlist.html#sortedcontainers.SortedList.__contains__
                 assert tx.hash is not None
@@ -558,16 +1080,15 @@ class TokensIndex:
         # if it's a TokenCreationTransaction, remove it from index
         if tx.version == TxVersion.TOKEN_CREATION_TRANSACTION:
             assert tx.hash is not None
-            del self.tokens[tx.hash]
+            self._delete_status(tx.hash)
 
         if tx.is_transaction:
             # Removing this tx from the transactions key list
             assert isinstance(tx, Transaction)
+            assert tx.hash is not None
+            element = TransactionIndexElement(tx.timestamp, tx.hash)
             for token_uid in tx.tokens:
-                transactions = self.tokens[token_uid].transactions
-                idx = transactions.bisect_key_left((tx.timestamp, tx.hash))
-                if idx < len(transactions) and transactions[idx].hash == tx.hash:
-                    transactions.pop(idx)
+                self._get_transactions(token_uid).discard(element)
 
     def get_token_info(self, token_uid: bytes) -> 'TokensIndex.TokenStatus':
         """ Get the info from the tokens dict.
@@ -582,6 +1103,11 @@ class TokensIndex:
         info = self.tokens[token_uid]
         return info
 
+    def get_all_tokens(self) -> Iterator[Tuple[bytes, 'TokensIndex.TokenStatus']]:
+        """ Iterate over the uid and the info of all tokens
+        """
+        yield from self.tokens.items()
+
     def get_transactions_count(self, token_uid: bytes) -> int:
         """ Get quantity of transactions from requested token
         """
@@ -20,7 +20,7 @@ import sys
 import time
 from enum import Enum, IntFlag
 from math import log
-from typing import Any, Iterator, List, NamedTuple, Optional, Union, cast
+from typing import Any, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union, cast
 
 from structlog import get_logger
 from twisted.internet import defer
@@ -32,7 +32,6 @@ import hathor.util
 from hathor.conf import HathorSettings
 from hathor.consensus import ConsensusAlgorithm
 from hathor.exception import InvalidNewTransaction
-from hathor.indexes import TokensIndex, WalletIndex
 from hathor.mining import BlockTemplate, BlockTemplates
 from hathor.p2p.peer_discovery import PeerDiscovery
 from hathor.p2p.peer_id import PeerId
@@ -72,7 +71,7 @@ class HathorManager:
                  wallet: Optional[BaseWallet] = None, tx_storage: Optional[TransactionStorage] = None,
                  peer_storage: Optional[Any] = None, default_port: int = 40403, wallet_index: bool = False,
                  stratum_port: Optional[int] = None, min_block_weight: Optional[int] = None, ssl: bool = True,
-                 capabilities: Optional[List[str]] = None) -> None:
+                 capabilities: Optional[List[str]] = None, verification_processes: int = 1) -> None:
         """
         :param reactor: Twisted reactor which handles the mainloop and the events.
         :param peer_id: Id of this node. If not given, a new one is created.
@@ -102,10 +101,16 @@ class HathorManager:
 
         :param min_block_weight: Minimum weight for blocks.
         :type min_block_weight: Optional[int]
+
+        :param verification_processes: Number of processes used to verify txs when initializing with a full
+                                        verification. The checks are done sequentially when it is 1.
+        :type verification_processes: int
         """
+        from hathor.confirmation_tracker import ConfirmationTracker
         from hathor.metrics import Metrics
         from hathor.p2p.factory import HathorClientFactory, HathorServerFactory
         from hathor.p2p.manager import ConnectionsManager
+        from hathor.response_cache import ResponseCache
         from hathor.transaction.storage.memory_storage import TransactionMemoryStorage
 
         self.log = logger.new()
@@ -131,8 +136,8 @@ class HathorManager:
         self.tx_storage = tx_storage or TransactionMemoryStorage()
         self.tx_storage.pubsub = self.pubsub
         if wallet_index and self.tx_storage.with_index:
-            self.tx_storage.wallet_index = WalletIndex(self.pubsub)
-            self.tx_storage.tokens_index = TokensIndex()
+            self.tx_storage.wallet_index, self.tx_storage.tokens_index = \
+                self.tx_storage.create_wallet_indexes(self.pubsub)
 
         self.avg_time_between_blocks = settings.AVG_TIME_BETWEEN_BLOCKS
         self.min_block_weight = min_block_weight or settings.MIN_BLOCK_WEIGHT
@@ -144,6 +149,12 @@ class HathorManager:
             reactor=self.reactor,
         )
 
+        # Responses of the explorer APIs, they are dropped when the DAG changes
+        self.response_cache = ResponseCache(self.metrics)
+
+        # Accumulated weight of the recent txs, used by the confirmation API
+        self.confirmation_tracker = ConfirmationTracker()
+
         self.consensus_algorithm = ConsensusAlgorithm()
 
         self.peer_discoveries: List[PeerDiscovery] = []
@@ -182,6 +193,7 @@ class HathorManager:
         # Full verification execute all validations for transactions and blocks when initializing the node
         # Can be activated on the command line with --full-verification
         self._full_verification = False
+        self.verification_processes = verification_processes
 
         # List of whitelisted peers
         self.peers_whitelist: List[str] = []
@@ -190,7 +202,13 @@ class HathorManager:
         if capabilities is not None:
             self.capabilities = capabilities
         else:
-            self.capabilities = [settings.CAPABILITY_WHITELIST]
+            self.capabilities = [
+                settings.CAPABILITY_WHITELIST,
+                settings.CAPABILITY_DATA_BATCH,
+                settings.CAPABILITY_INV,
+                settings.CAPABILITY_TIPS_COMMITMENT,
+                settings.CAPABILITY_BLOCK_HEADERS,
+            ]
 
     def start(self) -> None:
         """ A factory must be started only once. And it is usually automatically started.
@@ -332,8 +350,38 @@ class HathorManager:
         # If has reached this line, the db is clean, so we add this attribute to it
         self.tx_storage.set_db_clean()
 
+        # When there is a full verification, the checks that do not depend on the DAG (pow and scripts) can be
+        # done on a pool of processes, while the rest is still done sequentially in topological order
+        pre_verified = self._full_verification and self.verification_processes > 1
+        tx_results: Iterator[Tuple[BaseTransaction, Optional[TxValidationError]]]
+        if pre_verified:
+            from hathor.verification_pool import VerificationPool
+            verification_pool = VerificationPool(self.verification_processes)
+            tx_results = verification_pool.run(self.tx_storage._topological_sort())
+        else:
+            tx_results = ((tx, None) for tx in self.tx_storage._topological_sort())
+
+        # The wallet indexes saved by the storage are kept up to date while the node runs, so they do not need the txs
+        # again unless the metadata is verified again
+        wallet_index = self.tx_storage.wallet_index
+        tokens_index = self.tx_storage.tokens_index
+        skip_wallet_indexes = (wallet_index is not None and not self._full_verification
+                               and self.tx_storage.are_wallet_indexes_built())
+        if skip_wallet_indexes:
+            assert wallet_index is not None
+            self.log.info('wallet indexes already built')
+            self.tx_storage.wallet_index = None
+            self.tx_storage.tokens_index = None
+            if wallet_index.pubsub:
+                wallet_index.unsubscribe_pubsub_events()
+        else:
+            self.tx_storage.set_wallet_indexes_built(False)
+        if wallet_index is not None:
+            # Nobody is subscribed to the address history of the txs being loaded
+            wallet_index.is_publishing = False
+
         # self.start_profiler()
-        for tx in self.tx_storage._topological_sort():
+        for tx, verification_error in tx_results:
             assert tx.hash is not None
 
             t2 = time.time()
@@ -355,11 +403,14 @@ class HathorManager:
                 skip_block_weight_verification = False
 
             try:
+                if verification_error is not None:
+                    raise verification_error
                 assert self.on_new_tx(
                     tx,
                     quiet=True,
                     fails_silently=False,
-                    skip_block_weight_verification=skip_block_weight_verification
+                    skip_block_weight_verification=skip_block_weight_verification,
+                    pre_verified=pre_verified,
                 )
             except (InvalidNewTransaction, TxValidationError):
                 self.log.error('unexpected error when initializing', tx=tx, exc_info=True)
@@ -373,6 +424,16 @@ class HathorManager:
                 self.log.warn('tx took too long to load', tx=tx.hash_hex, dt=dt)
 
         # self.stop_profiler(save_to='profiles/initializing.prof')
+        if wallet_index is not None:
+            wallet_index.is_publishing = True
+        if skip_wallet_indexes:
+            assert wallet_index is not None
+            self.tx_storage.wallet_index = wallet_index
+            self.tx_storage.tokens_index = tokens_index
+            if wallet_index.pubsub:
+                wallet_index.subscribe_pubsub_events()
+        elif wallet_index is not None:
+            self.tx_storage.set_wallet_indexes_built(True)
         self.state = self.NodeState.READY
         tdt = hathor.util.LogDuration(t2 - t0)
         tx_rate = '?' if tdt == 0 else cnt / tdt
@@ -571,9 +632,12 @@ class HathorManager:
         """Return the number of tokens issued (aka reward) per block of a given height."""
         return hathor.util._get_tokens_issued_per_block(height)
 
-    def validate_new_tx(self, tx: BaseTransaction, skip_block_weight_verification: bool = False) -> bool:
+    def validate_new_tx(self, tx: BaseTransaction, skip_block_weight_verification: bool = False, *,
+                        pre_verified: bool = False) -> bool:
         """ Process incoming transaction during initialization.
         These transactions came only from storage.
+
+        If `pre_verified` is True, the checks that do not depend on the storage are skipped (see `tx.verify`).
         """
         assert tx.hash is not None
 
@@ -590,7 +654,7 @@ class HathorManager:
                 tx.hash_hex, tx.timestamp))
 
         # Verify transaction and raises an TxValidationError if tx is not valid.
-        tx.verify()
+        tx.verify(pre_verified=pre_verified)
 
         if tx.is_block:
             tx = cast(Block, tx)
@@ -653,7 +717,7 @@ class HathorManager:
 
     def on_new_tx(self, tx: BaseTransaction, *, conn: Optional[HathorProtocol] = None,
                   quiet: bool = False, fails_silently: bool = True, propagate_to_peers: bool = True,
-                  skip_block_weight_verification: bool = False) -> bool:
+                  skip_block_weight_verification: bool = False, pre_verified: bool = False) -> bool:
         """This method is called when any transaction arrive.
 
         If `fails_silently` is False, it may raise either InvalidNewTransaction or TxValidationError.
@@ -671,7 +735,8 @@ class HathorManager:
 
         if self.state != self.NodeState.INITIALIZING or self._full_verification:
             try:
-                assert self.validate_new_tx(tx, skip_block_weight_verification=skip_block_weight_verification) is True
+                assert self.validate_new_tx(tx, skip_block_weight_verification=skip_block_weight_verification,
+                                            pre_verified=pre_verified) is True
             except (InvalidNewTransaction, TxValidationError):
                 # Discard invalid Transaction/block.
                 self.log.debug('tx/block discarded', tx=tx, exc_info=True)
@@ -702,6 +767,13 @@ class HathorManager:
                 self.tx_storage.remove_transaction(tx)
                 raise
 
+        # It is not done through pubsub because the events are delivered in a later reactor iteration, and the
+        # responses would be stale until then.
+        self.response_cache.clear()
+
+        if self.state != self.NodeState.INITIALIZING:
+            self.confirmation_tracker.add_tx(tx)
+
         if not quiet:
             ts_date = datetime.datetime.fromtimestamp(tx.timestamp)
             if tx.is_block:
@@ -755,16 +827,14 @@ class HathorManager:
         if self.test_mode & TestMode.TEST_BLOCK_WEIGHT:
             return 1.0
 
-        root = parent_block
-        N = min(2 * settings.BLOCK_DIFFICULTY_N_BLOCKS, parent_block.get_metadata().height - 1)
-        K = N // 2
-        T = self.avg_time_between_blocks
-        S = 5
-        if N < 10:
+        parent_height = parent_block.get_metadata().height
+        window_size = self.get_weight_window_size(parent_height)
+        if window_size == 0:
             return self.min_block_weight
 
+        root = parent_block
         blocks: List[Block] = []
-        while len(blocks) < N + 1:
+        while len(blocks) < window_size:
             blocks.append(root)
             root = root.get_block_parent()
             assert isinstance(root, Block)
@@ -774,10 +844,44 @@ class HathorManager:
         assert blocks == sorted(blocks, key=lambda tx: -tx.timestamp)
         blocks = list(reversed(blocks))
 
-        assert len(blocks) == N + 1
+        window = [(block.timestamp, block.weight) for block in blocks]
+        return self.calculate_next_weight_from_window(parent_height, window, timestamp)
+
+    def get_weight_window_size(self, parent_height: int) -> int:
+        """ Number of blocks, ending at the parent block, used by the DAA to calculate the weight of the next block.
+
+        When it is zero, the next block has the minimum weight.
+        """
+        N = min(2 * settings.BLOCK_DIFFICULTY_N_BLOCKS, parent_height - 1)
+        if N < 10:
+            return 0
+        return N + 1
+
+    def calculate_next_weight_from_window(self, parent_height: int, window: Sequence[Tuple[int, float]],
+                                          timestamp: int) -> float:
+        """ Same as `calculate_next_weight`, but the blocks do not need to be in the storage.
+
+        :param window: `(timestamp, weight)` of the latest blocks of the chain, the last one being the parent block;
+                       at least `get_weight_window_size` blocks are needed
+        """
+        # In test mode we don't validate the block difficulty
+        if self.test_mode & TestMode.TEST_BLOCK_WEIGHT:
+            return 1.0
+
+        window_size = self.get_weight_window_size(parent_height)
+        if window_size == 0:
+            return self.min_block_weight
+        assert len(window) >= window_size
+        window = window[len(window) - window_size:]
+
+        N = len(window) - 1
+        K = N // 2
+        T = self.avg_time_between_blocks
+        S = 5
+
         solvetimes, weights = zip(*(
-            (block.timestamp - prev_block.timestamp, block.weight)
-            for prev_block, block in hathor.util.iwindows(blocks, 2)
+            (block_timestamp - prev_timestamp, block_weight)
+            for (prev_timestamp, _), (block_timestamp, block_weight) in hathor.util.iwindows(window, 2)
         ))
         assert len(solvetimes) == len(weights) == N, f'got {len(solvetimes)}, {len(weights)} expected {N}'
 
@@ -801,7 +905,8 @@ class HathorManager:
         weight = logsum_weights - log(sum_solvetimes, 2) + log(T, 2)
 
         # Apply weight decay
-        weight -= self.get_weight_decay_amount(timestamp - parent_block.timestamp)
+        parent_timestamp, _ = window[-1]
+        weight -= self.get_weight_decay_amount(timestamp - parent_timestamp)
 
         # Apply minimum weight
         if weight < self.min_block_weight:
@@ -49,6 +49,8 @@ class Metrics:
     estimated_hash_rate: float  # log(H/s)
     stratum_factory: Optional['StratumFactory']
     send_token_timeouts: int
+    response_cache_hits: int
+    response_cache_misses: int
 
     def __init__(
             self,
@@ -142,6 +144,10 @@ class Metrics:
         # Send-token timeouts counter
         self.send_token_timeouts = 0
 
+        # Requests answered with and without a cached response, see `ResponseCache`
+        self.response_cache_hits = 0
+        self.response_cache_misses = 0
+
     def _start_initial_values(self) -> None:
         """ When we start the metrics object we set the transaction and block count already in the network
         """
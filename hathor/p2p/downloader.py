@@ -16,7 +16,9 @@ limitations under the License.
 
 from collections import deque
 from functools import partial
-from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional
+from math import inf
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional
+from weakref import WeakKeyDictionary
 
 from structlog import get_logger
 from twisted.internet import defer
@@ -35,6 +37,170 @@ if TYPE_CHECKING:
 logger = get_logger()
 
 
+class AimdWindow:
+    """ Window size controlled by additive increase and multiplicative decrease (AIMD), like TCP's congestion window.
+
+    It starts growing by one for each success, which doubles it every round trip, until the first loss. After that,
+    it grows by one for each window-full of successes. Each loss halves it, at most once per round trip, because the
+    losses of the same round trip are usually caused by the same congestion.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.value = float(min(max(initial, minimum), maximum))
+
+        # The window grows by one for each success while it is below this threshold.
+        self.threshold = float(maximum)
+
+        # When the window was last decreased.
+        self.decreased_at: Optional[float] = None
+
+    @property
+    def size(self) -> int:
+        """ Current size of the window.
+        """
+        return int(self.value)
+
+    def increase(self) -> None:
+        """ Increase the window after a success.
+        """
+        if self.value < self.threshold:
+            self.value += 1
+        else:
+            self.value += 1 / self.value
+        self.value = min(self.value, self.maximum)
+
+    def decrease(self, now: float, rtt: float) -> None:
+        """ Decrease the window after a loss, unless it has already been decreased in the last round trip.
+        """
+        if self.decreased_at is not None and now - self.decreased_at < rtt:
+            return
+        self.decreased_at = now
+        self.value = max(self.value / 2, self.minimum)
+        self.threshold = self.value
+
+
+class PeerStats:
+    """ Download statistics of a connection, used to choose from which peer each transaction is downloaded.
+
+    They also control how many transactions can be requested from the peer at the same time (see `AimdWindow`) and
+    the timeout of the requests, which is computed from the latency like TCP's retransmission timeout.
+    """
+
+    # Latency used while there is no sample yet (in seconds).
+    DEFAULT_LATENCY = 1.0
+
+    # Weight of each new sample in the moving average of the latency.
+    LATENCY_ALPHA = 0.2
+
+    # Weight of each new sample in the moving average of the latency deviation.
+    LATENCY_BETA = 0.25
+
+    # Limits of the number of transactions requested from the peer at the same time. It starts at the default size
+    # of the sliding window, so a peer is only limited after it has been slow or timed out.
+    INITIAL_WINDOW = 100
+    MIN_WINDOW = 1
+    MAX_WINDOW = 500
+
+    # The timeout of the requests is the latency plus TIMEOUT_DEVIATIONS times its deviation, but never less than
+    # MIN_TIMEOUT seconds nor more than settings.GET_DATA_TIMEOUT.
+    TIMEOUT_DEVIATIONS = 4
+    MIN_TIMEOUT = 5.0
+
+    # Maximum factor of the timeout backoff.
+    MAX_BACKOFF = 16
+
+    def __init__(self) -> None:
+        # Number of transactions requested from the peer that have not arrived yet.
+        self.outstanding = 0
+
+        # Number of transactions downloaded from the peer.
+        self.downloaded = 0
+
+        # Number of requests to the peer that have failed (not found or timed out).
+        self.retries = 0
+
+        # Number of requests to the peer that have timed out.
+        self.timeouts = 0
+
+        # Moving average of the time between requesting a transaction and receiving it (in seconds).
+        self.latency: Optional[float] = None
+
+        # Moving average of the deviation of the latency (in seconds).
+        self.latency_var = 0.0
+
+        # The timeout is doubled after each timeout, until a transaction arrives.
+        self.backoff = 1
+
+        # Maximum number of transactions requested from the peer at the same time.
+        self.window = AimdWindow(self.INITIAL_WINDOW, self.MIN_WINDOW, self.MAX_WINDOW)
+
+    def add_latency(self, value: float) -> None:
+        """ Add a new latency sample.
+        """
+        if self.latency is None:
+            self.latency = value
+            self.latency_var = value / 2
+        else:
+            self.latency_var += self.LATENCY_BETA * (abs(value - self.latency) - self.latency_var)
+            self.latency += self.LATENCY_ALPHA * (value - self.latency)
+
+    def get_latency(self) -> float:
+        """ Return the expected latency of a new request.
+        """
+        if self.latency is None:
+            return self.DEFAULT_LATENCY
+        return self.latency
+
+    def get_timeout(self) -> float:
+        """ Return the timeout of a new request (in seconds).
+        """
+        if self.latency is None:
+            return settings.GET_DATA_TIMEOUT
+        timeout = max(self.latency + self.TIMEOUT_DEVIATIONS * self.latency_var, self.MIN_TIMEOUT) * self.backoff
+        return min(timeout, settings.GET_DATA_TIMEOUT)
+
+    def get_score(self) -> float:
+        """ Return the expected time to download one more transaction from this peer, the lower the better.
+        """
+        return (self.outstanding + 1) * self.get_latency()
+
+    def is_full(self) -> bool:
+        """ Return whether no more transactions can be requested from the peer for now.
+        """
+        return self.outstanding >= self.window.size
+
+    def on_arrival(self, latency: float) -> None:
+        """ Register that a requested transaction has arrived.
+        """
+        self.downloaded += 1
+        self.backoff = 1
+        self.add_latency(latency)
+        self.window.increase()
+
+    def on_failure(self, now: float, *, timeout: bool) -> None:
+        """ Register that a request has failed, the window is only decreased by timeouts.
+        """
+        self.retries += 1
+        if timeout:
+            self.timeouts += 1
+            self.backoff = min(self.backoff * 2, self.MAX_BACKOFF)
+            self.window.decrease(now, self.get_latency())
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'outstanding': self.outstanding,
+            'downloaded': self.downloaded,
+            'retries': self.retries,
+            'timeouts': self.timeouts,
+            'latency': self.latency,
+            'latency_var': self.latency_var,
+            'timeout': self.get_timeout(),
+            'window': self.window.size,
+        }
+
+
 class TxDetails:
     # Hash of the transaction.
     tx_id: bytes
@@ -50,48 +216,50 @@ class TxDetails:
     # but not necessarily added to the DAG.
     downloading_deferred: Optional[Deferred]
 
-    # Index of the list of connections that requested the data
-    # Useful when we need to retry the request and want to select a new connection
-    requested_index: int
+    # Connection from which the transaction is being downloaded, and when it was requested.
+    requested_connection: Optional['NodeSyncTimestamp']
+    requested_at: float
+
+    # Number of times the transaction was requested from each connection.
+    attempts: Dict['NodeSyncTimestamp', int]
 
     def __init__(self, tx_id: bytes, deferred: Deferred, connections: List['NodeSyncTimestamp']):
         self.tx_id = tx_id
         self.deferred = deferred
         self.connections = connections
         self.downloading_deferred = None
-        self.requested_index = 0
-        self.retry_count = 0
-
-    def get_connection(self) -> Optional['NodeSyncTimestamp']:
+        self.requested_connection = None
+        self.requested_at = 0
+        self.attempts = {}
+
+    def get_connection(self, get_score: Callable[['NodeSyncTimestamp'], float],
+                       exclude: Optional['NodeSyncTimestamp'] = None,
+                       is_full: Optional[Callable[['NodeSyncTimestamp'], bool]] = None
+                       ) -> Optional['NodeSyncTimestamp']:
         """ Get a connection to start the download for this tx detail
 
-            We start from the first connection because it's the first one that requested
-            so it's supposed to be the one with lowest rtt that is available this time
+            It is the connection with the lowest score among the ones that requested this transaction, are still
+            connected and have been tried less than settings.GET_DATA_RETRIES times. So the downloads are spread
+            among the peers according to their latency and how many downloads they already have. When `is_full`
+            is given, the connections that cannot take more requests are skipped too.
 
-            We tried to do a random choice but it was getting too slow because sometimes
-            we were choosing a peer that is far
-
-            We use the requested_index to get the next connection, in case of a retry
+            On ties, we choose the first connection that requested it, which is supposed to be the one with
+            the lowest rtt.
         """
-        connection = None
-        while connection is None:
-            if len(self.connections) <= self.requested_index:
-                # We don't have more connections available
-                break
-
-            connection = self.connections[self.requested_index]
-            self.retry_count += 1
-
-            # only try next peer if we reach max retries on the current one
-            if self.retry_count >= settings.GET_DATA_RETRIES:
-                self.requested_index += 1
-                self.retry_count = 0
-
-            if not connection.protocol.connected:
-                # Connection was already closed, so try the next one
-                connection = None
-
-        return connection
+        best = None
+        best_score = inf
+        for connection in self.connections:
+            if connection is exclude or not connection.protocol.connected:
+                continue
+            if self.attempts.get(connection, 0) >= settings.GET_DATA_RETRIES:
+                continue
+            if is_full is not None and is_full(connection):
+                continue
+            score = get_score(connection)
+            if score < best_score:
+                best = connection
+                best_score = score
+        return best
 
 
 class Downloader:
@@ -99,10 +267,29 @@ class Downloader:
     several optimizations instead of downloading the same transactions multiple times,
     one from each peer.
 
+    When many peers have the same transactions, the downloads are spread among them according to
+    their statistics, and the requests that are taking much longer than expected are moved to
+    faster peers (work stealing).
+
+    Both the sliding window and the number of requests to each peer are controlled by AIMD (see
+    `AimdWindow`): they grow while the transactions arrive and they are halved when requests time out.
+
     TODO: Should we have a flag to sync only the best blockchain? Or to sync the
     best blockchain first?
     """
 
+    # A request is moved to another peer when it takes longer than both STEAL_MIN_DELAY seconds and
+    # STEAL_FACTOR times the latency of its peer, and the other peer is expected to be faster.
+    STEAL_MIN_DELAY = 2.0
+    STEAL_FACTOR = 4.0
+
+    # Interval between the checks for slow requests (in seconds).
+    STEAL_CHECK_INTERVAL = 1.0
+
+    # Limits of the size of the sliding window.
+    MIN_WINDOW_SIZE = 20
+    MAX_WINDOW_SIZE = 1000
+
     # All transactions that must be downloaded.
     pending_transactions: Dict[bytes, TxDetails]
 
@@ -116,10 +303,13 @@ class Downloader:
     # added to the DAG.
     downloading_buffer: Dict[bytes, 'BaseTransaction']
 
-    # Size of the sliding window used to download transactions.
-    window_size: int
+    # Sliding window used to download transactions.
+    window: AimdWindow
 
     def __init__(self, manager: 'HathorManager', window_size: int = 100):
+        """
+        :param window_size: initial size of the sliding window
+        """
         self.log = logger.new()
         self.manager = manager
 
@@ -127,11 +317,62 @@ class Downloader:
         self.waiting_deque = deque()
         self.downloading_deque = deque()
         self.downloading_buffer = {}
-        self.window_size = window_size
+        self.window = AimdWindow(window_size, min(self.MIN_WINDOW_SIZE, window_size), self.MAX_WINDOW_SIZE)
+
+        # Download statistics of each connection.
+        self.peer_stats: 'WeakKeyDictionary[NodeSyncTimestamp, PeerStats]' = WeakKeyDictionary()
+
+    def get_peer_stats(self, connection: 'NodeSyncTimestamp') -> PeerStats:
+        """ Return the download statistics of a connection.
+        """
+        stats = self.peer_stats.get(connection)
+        if stats is None:
+            stats = self.peer_stats[connection] = PeerStats()
+        return stats
+
+    def get_score(self, connection: 'NodeSyncTimestamp') -> float:
+        """ Return the score of a connection, see `PeerStats.get_score`.
+        """
+        return self.get_peer_stats(connection).get_score()
+
+    def is_full(self, connection: 'NodeSyncTimestamp') -> bool:
+        """ Return whether no more transactions can be requested from a connection for now.
+        """
+        return self.get_peer_stats(connection).is_full()
+
+    @property
+    def window_size(self) -> int:
+        """ Current size of the sliding window.
+        """
+        return self.window.size
+
+    def get_status(self) -> Dict[str, Any]:
+        """ Return the status of the downloads.
+        """
+        return {
+            'window_size': self.window_size,
+            'waiting': len(self.waiting_deque),
+            'downloading': len(self.downloading_deque),
+            'downloaded': len(self.downloading_buffer),
+        }
 
     def get_tx(self, tx_id: bytes, connection: 'NodeSyncTimestamp') -> Deferred:
         """ Add a transaction to be downloaded and add to the DAG.
         """
+        return self.get_txs([tx_id], connection)[0]
+
+    def get_txs(self, tx_ids: List[bytes], connection: 'NodeSyncTimestamp') -> List[Deferred]:
+        """ Add many transactions to be downloaded and added to the DAG, in this order.
+
+        They are all queued before any download starts, so they can be requested in batches.
+        """
+        deferreds = [self._add_tx(tx_id, connection) for tx_id in tx_ids]
+        self.download_next_if_possible()
+        return deferreds
+
+    def _add_tx(self, tx_id: bytes, connection: 'NodeSyncTimestamp') -> Deferred:
+        """ Add a transaction to the waiting queue, unless it is already in the storage or being downloaded.
+        """
         try:
             # If I already have this tx in the storage just return a defer already success
             # In the node_sync code we already handle this case but in a race condition situation
@@ -153,32 +394,102 @@ class Downloader:
             details = TxDetails(tx_id, deferred, [connection])
             self.pending_transactions[tx_id] = details
             self.waiting_deque.append(tx_id)
-            self.download_next_if_possible()
             return details.deferred
 
     def download_next_if_possible(self) -> None:
         """ Start as many downloads as the number of available slots in the sliding window.
+        The tx_ids are moved from the waiting queue to the downloading queue.
+
+        As the downloads are requested in batches, it waits for a full batch of free slots when there are enough
+        transactions waiting, unless nothing is being downloaded.
+
+        The transactions are kept in order, so it stops when all the peers of the next transaction are full.
         """
-        while self.waiting_deque and len(self.downloading_deque) < self.window_size:
-            self.start_next_download()
+        window_size = self.window_size
+        free_slots = window_size - len(self.downloading_deque)
+        if self.downloading_deque and free_slots < min(len(self.waiting_deque), settings.GET_DATA_BATCH_SIZE):
+            return
 
-    def start_next_download(self) -> None:
-        """ Start the next download from the waiting queue.
-        The tx_id is moved from the waiting queue to the downloading queue.
+        tx_ids_by_connection: Dict['NodeSyncTimestamp', List[bytes]] = {}
+        while self.waiting_deque and len(self.downloading_deque) < window_size:
+            tx_id = self.waiting_deque[0]
+            details = self.pending_transactions[tx_id]
+            connection = details.get_connection(self.get_score, is_full=self.is_full)
+
+            if connection is None:
+                if details.get_connection(self.get_score) is not None:
+                    # All its peers are full, so it has to wait for some requests to finish.
+                    break
+                self.waiting_deque.popleft()
+                self._remove_pending_tx(tx_id)
+                continue
+
+            self.waiting_deque.popleft()
+            self._set_requested(details, connection)
+            self.downloading_deque.append(tx_id)
+            tx_ids_by_connection.setdefault(connection, []).append(tx_id)
+
+        for connection, tx_ids in tx_ids_by_connection.items():
+            self.request_txs(tx_ids, connection)
+
+    def request_txs(self, tx_ids: List[bytes], connection: 'NodeSyncTimestamp') -> None:
+        """ Request the download of the transactions from a connection, in batches when the peer supports them.
         """
-        tx_id = self.waiting_deque.popleft()
+        if not connection.supports_data_batch():
+            for tx_id in tx_ids:
+                self.add_get_downloading_deferred(tx_id, self.pending_transactions[tx_id], connection)
+            return
 
-        details = self.pending_transactions[tx_id]
-        connection = details.get_connection()
+        for i in range(0, len(tx_ids), settings.GET_DATA_BATCH_SIZE):
+            batch = tx_ids[i:i + settings.GET_DATA_BATCH_SIZE]
+            if len(batch) == 1:
+                self.add_get_downloading_deferred(batch[0], self.pending_transactions[batch[0]], connection)
+                continue
+
+            deferreds = connection.request_data_batch(batch)
+            for tx_id, deferred in zip(batch, deferreds):
+                details = self.pending_transactions[tx_id]
+                assert details.downloading_deferred is None
+                details.downloading_deferred = deferred
+                deferred.addCallback(self.on_new_tx)
+
+            # A single timeout for the whole batch, instead of one for each transaction.
+            timeout = self.get_peer_stats(connection).get_timeout()
+            connection.reactor.callLater(timeout, self.on_batch_timeout, dict(zip(batch, deferreds)))
+
+    def _set_requested(self, details: TxDetails, connection: 'NodeSyncTimestamp') -> None:
+        """ Register that a transaction is being requested from a connection.
+        """
+        details.attempts[connection] = details.attempts.get(connection, 0) + 1
+        details.requested_connection = connection
+        details.requested_at = self.manager.reactor.seconds()
+        self.get_peer_stats(connection).outstanding += 1
 
+    def _clear_requested(self, details: TxDetails, *, arrived: bool) -> None:
+        """ Register that the request of a transaction has finished, either because it has arrived or it has failed.
+        """
+        connection = details.requested_connection
         if connection is None:
-            self._remove_pending_tx(tx_id)
-        else:
-            # Setting downloading deferred
-            self.add_get_downloading_deferred(tx_id, details, connection)
-
-            # Adding to download deque
-            self.downloading_deque.append(tx_id)
+            return
+        stats = self.get_peer_stats(connection)
+        stats.outstanding -= 1
+        if arrived:
+            stats.on_arrival(self.manager.reactor.seconds() - details.requested_at)
+            self.window.increase()
+        details.requested_connection = None
+
+    def _register_failure(self, details: TxDetails, *, timeout: bool) -> None:
+        """ Register that the current request of a transaction has failed. A timeout decreases the windows of the
+        connection and the sliding window.
+        """
+        connection = details.requested_connection
+        if connection is None:
+            return
+        stats = self.get_peer_stats(connection)
+        now = self.manager.reactor.seconds()
+        stats.on_failure(now, timeout=timeout)
+        if timeout:
+            self.window.decrease(now, stats.get_latency())
 
     def add_get_downloading_deferred(self, tx_id: bytes, details: TxDetails, connection: 'NodeSyncTimestamp') -> None:
         """ Getting a downloading deferred when requesting data from a connection
@@ -190,7 +501,7 @@ class Downloader:
         # Adding timeout to callback
         fn_timeout = partial(self.on_deferred_timeout, tx_id=tx_id)
         details.downloading_deferred.addTimeout(
-            settings.GET_DATA_TIMEOUT,
+            self.get_peer_stats(connection).get_timeout(),
             connection.reactor,
             onTimeoutCancel=fn_timeout
         )
@@ -199,11 +510,33 @@ class Downloader:
         """ Timeout handler for the downloading deferred
             It just calls the retry method
         """
-        self.retry(tx_id)
+        self.retry(tx_id, timeout=True)
 
-    def on_new_tx(self, tx: 'BaseTransaction') -> None:
+    def on_batch_timeout(self, deferreds: Dict[bytes, Deferred]) -> None:
+        """ Timeout handler of a batch, it retries the transactions that have not arrived yet.
+
+        The whole batch counts as a single failure of the connection, as it was a single request.
+        """
+        expired = []
+        for tx_id, deferred in deferreds.items():
+            details = self.pending_transactions.get(tx_id, None)
+            if details is None or details.downloading_deferred is not deferred or deferred.called:
+                # Already downloaded or retried.
+                continue
+            expired.append(details)
+
+        if not expired:
+            return
+        self._register_failure(expired[0], timeout=True)
+        for details in expired:
+            self.retry(details.tx_id, timeout=True, register_failure=False)
+
+    def on_new_tx(self, tx: Optional['BaseTransaction']) -> None:
         """ This is called when a new transaction arrives.
         """
+        if tx is None:
+            # The download has been canceled, so there is nothing to do (see `retry`).
+            return
         assert tx.hash is not None
         self.log.debug('new tx', tx=tx.hash_hex)
 
@@ -213,10 +546,14 @@ class Downloader:
             self.log.warn('new tx arrived but tx detail does not exist', tx=tx.hash_hex)
             return
 
+        self._clear_requested(details, arrived=True)
         assert len(self.downloading_deque) > 0
         self.downloading_buffer[tx.hash] = tx
         self.check_downloading_queue()
 
+        # The connection may have room for more requests now, even if the transaction is not the next one.
+        self.download_next_if_possible()
+
     def check_downloading_queue(self) -> None:
         """ Check whether the transactions of the downloading queue
             have already been downloaded. Those that were are added to the DAG.
@@ -246,9 +583,47 @@ class Downloader:
         if count > 0:
             self.download_next_if_possible()
 
-    def retry(self, tx_id: bytes) -> None:
+    def steal_slow_requests(self) -> None:
+        """ Request again from a faster peer the transactions that are taking much longer than expected.
+        It is called periodically by the ConnectionsManager.
+        """
+        now = self.manager.reactor.seconds()
+        for tx_id in list(self.downloading_deque):
+            if tx_id in self.downloading_buffer:
+                continue
+            details = self.pending_transactions.get(tx_id, None)
+            if details is None or details.requested_connection is None:
+                continue
+            current = details.requested_connection
+            stats = self.get_peer_stats(current)
+            elapsed = now - details.requested_at
+            if elapsed < max(self.STEAL_MIN_DELAY, self.STEAL_FACTOR * stats.get_latency()):
+                continue
+            other = details.get_connection(self.get_score, exclude=current, is_full=self.is_full)
+            if other is None or self.get_score(other) >= elapsed:
+                continue
+            self.log.debug('steal tx', tx=tx_id.hex())
+            # The peer is slower than expected, so it gets fewer requests for a while.
+            stats.window.decrease(now, stats.get_latency())
+            self._request_again(details, other)
+
+    def _request_again(self, details: TxDetails, connection: 'NodeSyncTimestamp') -> None:
+        """ Cancel the current request of a transaction and request it from `connection`.
+        """
+        self._clear_requested(details, arrived=False)
+        if details.downloading_deferred:
+            details.downloading_deferred.cancel()
+            details.downloading_deferred = None
+        self._set_requested(details, connection)
+        self.add_get_downloading_deferred(details.tx_id, details, connection)
+
+    def retry(self, tx_id: bytes, *, timeout: bool = False, register_failure: bool = True) -> None:
         """ Retry a failed download
             It will try up to settings.GET_DATA_RETRIES per connection
+
+            :param timeout: whether the download has failed because of a timeout, instead of a NOT-FOUND
+            :param register_failure: whether the failure is charged to the connection, it is false when the
+                failure has already been registered, like for the transactions of a batch
         """
         self.log.warn('retry tx', tx=tx_id.hex())
 
@@ -259,20 +634,20 @@ class Downloader:
             # Maybe a race condition in which the timeout has triggered and the tx has arrived.
             return
 
-        # Failing old downloading deferred
-        if details.downloading_deferred:
-            details.downloading_deferred.cancel()
-            details.downloading_deferred = None
+        if register_failure:
+            self._register_failure(details, timeout=timeout)
 
         # Get new connection
-        new_connection = details.get_connection()
+        new_connection = details.get_connection(self.get_score)
 
         if new_connection is None:
             self._remove_pending_tx(tx_id)
-            return
+        else:
+            # Start new download
+            self._request_again(details, new_connection)
 
-        # Start new download
-        self.add_get_downloading_deferred(tx_id, details, new_connection)
+        # The failed connection has room for other requests now.
+        self.download_next_if_possible()
 
     def _remove_pending_tx(self, tx_id: bytes) -> None:
         """ Cancel tx deferred and remove it from the pending dict and download deque
@@ -280,6 +655,10 @@ class Downloader:
         self.log.warn('no new connections available to download the tx from', tx=tx_id.hex())
         # remove this tx_id from pending_transactions and cancel the deferred
         details = self.pending_transactions.pop(tx_id)
+        self._clear_requested(details, arrived=False)
+        if details.downloading_deferred:
+            details.downloading_deferred.cancel()
+            details.downloading_deferred = None
         details.deferred.cancel()
 
         # also remove from downloading queue
@@ -0,0 +1,171 @@
+import base64
+import struct
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from hathor.p2p.messages import ProtocolMessages
+
+# Header of a binary frame: the length of the rest of the frame and the command id. The length includes the command
+# id byte, so an empty payload has length 1.
+FRAME_HEADER = struct.Struct('!IB')
+
+# Flag set in the command id byte when the payload was converted to its raw binary form, see `_PAYLOAD_ENCODERS`.
+RAW_PAYLOAD_FLAG = 0x80
+
+# Ids of the commands in the binary frames, they must never change.
+COMMAND_IDS: Dict[ProtocolMessages, int] = {
+    ProtocolMessages.ERROR: 0,
+    ProtocolMessages.THROTTLE: 1,
+    ProtocolMessages.HELLO: 2,
+    ProtocolMessages.PEER_ID: 3,
+    ProtocolMessages.READY: 4,
+    ProtocolMessages.GET_PEERS: 5,
+    ProtocolMessages.PEERS: 6,
+    ProtocolMessages.PING: 7,
+    ProtocolMessages.PONG: 8,
+    ProtocolMessages.GET_DATA: 9,
+    ProtocolMessages.DATA: 10,
+    ProtocolMessages.NOT_FOUND: 11,
+    ProtocolMessages.GET_TIPS: 12,
+    ProtocolMessages.TIPS: 13,
+    ProtocolMessages.GET_NEXT: 14,
+    ProtocolMessages.NEXT: 15,
+    ProtocolMessages.GET_BLOCKS: 16,
+    ProtocolMessages.BLOCKS: 17,
+    ProtocolMessages.GET_TRANSACTIONS: 18,
+    ProtocolMessages.TRANSACTIONS: 19,
+    ProtocolMessages.HASHES: 20,
+    ProtocolMessages.GET_DATA_BATCH: 21,
+    ProtocolMessages.DATA_BATCH: 22,
+    ProtocolMessages.INV: 23,
+}
+
+COMMANDS_BY_ID: Dict[int, ProtocolMessages] = {cmd_id: cmd for cmd, cmd_id in COMMAND_IDS.items()}
+
+# Length of each item of a raw DATA-BATCH payload.
+_ITEM_LENGTH = struct.Struct('!I')
+
+
+def _encode_data_batch(payload: str) -> bytes:
+    """ Convert the base64 items of a DATA-BATCH payload to raw items prefixed by their length.
+    """
+    items = (base64.b64decode(item, validate=True) for item in payload.split(' '))
+    return b''.join(_ITEM_LENGTH.pack(len(item)) + item for item in items)
+
+
+def _decode_data_batch(data: bytes) -> str:
+    """ Inverse of `_encode_data_batch`.
+
+    :raises ValueError: when the items are truncated
+    """
+    items = []
+    offset = 0
+    while offset < len(data):
+        if offset + _ITEM_LENGTH.size > len(data):
+            raise ValueError('truncated item length')
+        length, = _ITEM_LENGTH.unpack_from(data, offset)
+        offset += _ITEM_LENGTH.size
+        if offset + length > len(data):
+            raise ValueError('truncated item')
+        items.append(base64.b64encode(data[offset:offset + length]).decode('ascii'))
+        offset += length
+    return ' '.join(items)
+
+
+# Payloads that are binary data in the text protocol (base64 or hex) are sent raw. The other payloads are sent as
+# UTF-8, just like in the text protocol.
+_PAYLOAD_ENCODERS: Dict[ProtocolMessages, Callable[[str], bytes]] = {
+    ProtocolMessages.DATA: lambda payload: base64.b64decode(payload, validate=True),
+    ProtocolMessages.GET_DATA: bytes.fromhex,
+    ProtocolMessages.NOT_FOUND: bytes.fromhex,
+    ProtocolMessages.GET_DATA_BATCH: bytes.fromhex,
+    ProtocolMessages.DATA_BATCH: _encode_data_batch,
+    ProtocolMessages.BLOCKS: _encode_data_batch,
+    ProtocolMessages.INV: bytes.fromhex,
+}
+
+_PAYLOAD_DECODERS: Dict[ProtocolMessages, Callable[[bytes], str]] = {
+    ProtocolMessages.DATA: lambda data: base64.b64encode(data).decode('ascii'),
+    ProtocolMessages.GET_DATA: bytes.hex,
+    ProtocolMessages.NOT_FOUND: bytes.hex,
+    ProtocolMessages.GET_DATA_BATCH: bytes.hex,
+    ProtocolMessages.DATA_BATCH: _decode_data_batch,
+    ProtocolMessages.BLOCKS: _decode_data_batch,
+    ProtocolMessages.INV: bytes.hex,
+}
+
+
+class FramingError(Exception):
+    """ Raised when a binary frame is invalid, the connection must be closed.
+    """
+
+
+def encode_frame(cmd: ProtocolMessages, payload: Optional[str] = None) -> bytes:
+    """ Return the binary frame of a message.
+
+    >>> encode_frame(ProtocolMessages.PING).hex()
+    '0000000107'
+    >>> encode_frame(ProtocolMessages.GET_DATA, 'abcd').hex()
+    '0000000389abcd'
+    >>> encode_frame(ProtocolMessages.GET_DATA, 'not hex').hex()
+    '00000008096e6f7420686578'
+    """
+    cmd_id = COMMAND_IDS[cmd]
+    data = b''
+    if payload:
+        encoder = _PAYLOAD_ENCODERS.get(cmd)
+        try:
+            if encoder is None:
+                raise ValueError
+            data = encoder(payload)
+            cmd_id |= RAW_PAYLOAD_FLAG
+        except ValueError:
+            # Payloads that cannot be converted (usually invalid ones) are sent as they are.
+            data = payload.encode('utf-8')
+    return FRAME_HEADER.pack(len(data) + 1, cmd_id) + data
+
+
+class FrameDecoder:
+    """ Split the received bytes into messages, it keeps the incomplete frames until the rest of them arrive.
+    """
+
+    def __init__(self, max_length: int) -> None:
+        """
+        :param max_length: maximum length of a frame, not including its header
+        """
+        self.max_length = max_length
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> Iterator[Tuple[int, ProtocolMessages, str]]:
+        """ Add received bytes and yield the `(frame length, command, payload)` of each complete frame.
+
+        :raises FramingError: when a frame is too long or invalid
+        """
+        self._buffer.extend(data)
+        header_size = FRAME_HEADER.size
+        while len(self._buffer) >= header_size:
+            length, cmd_id = FRAME_HEADER.unpack_from(self._buffer)
+            if length < 1 or length > self.max_length:
+                raise FramingError('invalid frame length: {}'.format(length))
+            frame_size = header_size - 1 + length
+            if len(self._buffer) < frame_size:
+                break
+            data = bytes(self._buffer[header_size:frame_size])
+            del self._buffer[:frame_size]
+
+            cmd = COMMANDS_BY_ID.get(cmd_id & ~RAW_PAYLOAD_FLAG)
+            if cmd is None:
+                raise FramingError('invalid command id: {}'.format(cmd_id))
+            if cmd_id & RAW_PAYLOAD_FLAG:
+                decoder = _PAYLOAD_DECODERS.get(cmd)
+                if decoder is None:
+                    raise FramingError('raw payload not supported: {}'.format(cmd.value))
+                try:
+                    payload = decoder(data)
+                except ValueError:
+                    raise FramingError('invalid raw payload')
+            else:
+                try:
+                    payload = data.decode('utf-8')
+                except UnicodeDecodeError:
+                    raise FramingError('invalid payload')
+            yield frame_size, cmd, payload
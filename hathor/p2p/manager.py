@@ -14,7 +14,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from typing import TYPE_CHECKING, Any, Dict, Optional, Set, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Union
 
 from structlog import get_logger
 from twisted.internet import endpoints
@@ -85,6 +85,10 @@ class ConnectionsManager:
 
         self.downloader = Downloader(manager)
 
+        # A timer to move the slow downloads to faster peers.
+        self.lc_steal = LoopingCall(self.downloader.steal_slow_requests)
+        self.lc_steal.clock = self.reactor
+
         # A timer to try to reconnect to the disconnect known peers.
         self.lc_reconnect = LoopingCall(self.reconnect_to_all)
         self.lc_reconnect.clock = self.reactor
@@ -101,12 +105,15 @@ class ConnectionsManager:
 
     def start(self) -> None:
         self.lc_reconnect.start(5)
+        self.lc_steal.start(Downloader.STEAL_CHECK_INTERVAL, now=False)
         if settings.ENABLE_PEER_WHITELIST:
             self.wl_reconnect.start(30)
 
     def stop(self) -> None:
         if self.lc_reconnect.running:
             self.lc_reconnect.stop()
+        if self.lc_steal.running:
+            self.lc_steal.stop()
 
     def has_synced_peer(self) -> bool:
         """ Return whether we are synced to at least one peer.
@@ -363,6 +370,11 @@ class ConnectionsManager:
         """
         return self.downloader.get_tx(hash_bytes, node_sync)
 
+    def get_txs(self, hashes: List[bytes], node_sync: 'NodeSyncTimestamp') -> List[Deferred]:
+        """ Request many txs from the downloader, so they can be downloaded in batches
+        """
+        return self.downloader.get_txs(hashes, node_sync)
+
     def retry_get_tx(self, hash_bytes: bytes) -> None:
         """ Execute a retry of a request of a tx in the downloader
         """
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, NamedTuple
+from typing import List, NamedTuple, Optional
 
 
 class GetNextPayload(NamedTuple):
@@ -15,9 +15,10 @@ class NextPayload(NamedTuple):
 
 
 class GetTipsPayload(NamedTuple):
-    timestamp: int
+    timestamp: Optional[int]
     include_hashes: bool
     offset: int = 0
+    commitment: bool = False
 
 
 class TipsPayload(NamedTuple):
@@ -28,6 +29,11 @@ class TipsPayload(NamedTuple):
     has_more: bool
 
 
+class GetBlocksPayload(NamedTuple):
+    locator: List[str]
+    count: int
+
+
 class ProtocolMessages(Enum):
     # ---
     # General Error Messages
@@ -68,7 +74,12 @@ class ProtocolMessages(Enum):
     # ---
     GET_DATA = 'GET-DATA'  # Request the data for a specific transaction.
     DATA = 'DATA'  # Send the data for a specific transaction.
-    NOT_FOUND = 'NOT-FOUND'  # Used when a requested tx from GET-DATA is not found in the peer
+    NOT_FOUND = 'NOT-FOUND'  # Used when requested txs from GET-DATA or GET-DATA-BATCH are not found in the peer
+
+    INV = 'INV'  # Announce new transactions, which are requested if needed. Payload is the concatenated hashes.
+
+    GET_DATA_BATCH = 'GET-DATA-BATCH'  # Request the data for many transactions. Payload is the concatenated hashes.
+    DATA_BATCH = 'DATA-BATCH'  # Send the data for many transactions. Payload is the data separated by spaces.
 
     GET_TIPS = 'GET-TIPS'
     TIPS = 'TIPS'
@@ -76,8 +87,8 @@ class ProtocolMessages(Enum):
     GET_NEXT = 'GET-NEXT'
     NEXT = 'NEXT'
 
-    GET_BLOCKS = 'GET-BLOCKS'  # Request a list of hashes for blocks. Payload is the current latest block.
-    BLOCKS = 'BLOCKS'  # Send a list of hashes for blocks. Payload is a list of hashes.
+    GET_BLOCKS = 'GET-BLOCKS'  # Request the blocks of the best chain after the last one in a block locator.
+    BLOCKS = 'BLOCKS'  # Send the data of the blocks requested by GET-BLOCKS, the first one is the oldest.
 
     GET_TRANSACTIONS = 'GET-TRANSACTIONS'  # Request a list of hashes for transactions.
     TRANSACTIONS = 'TRANSACTIONS'  # Send a list of hashes for transactions.
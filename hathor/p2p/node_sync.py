@@ -17,22 +17,46 @@ limitations under the License.
 import base64
 import json
 import struct
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from math import inf
-from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 from weakref import WeakSet
 
 from structlog import get_logger
-from twisted.internet.defer import Deferred, inlineCallbacks
+from twisted.internet.defer import Deferred, DeferredList, inlineCallbacks
 from twisted.internet.interfaces import IDelayedCall, IProtocol, IPushProducer, IReactorCore
 from twisted.internet.task import Clock
 from zope.interface import implementer
 
 from hathor.conf import HathorSettings
-from hathor.p2p.messages import GetNextPayload, GetTipsPayload, NextPayload, ProtocolMessages, TipsPayload
+from hathor.exception import InvalidNewTransaction
+from hathor.p2p.messages import (
+    GetBlocksPayload,
+    GetNextPayload,
+    GetTipsPayload,
+    NextPayload,
+    ProtocolMessages,
+    TipsPayload,
+)
+from hathor.p2p.outbound import MessagePriority
 from hathor.p2p.plugin import Plugin
-from hathor.transaction import BaseTransaction
+from hathor.transaction import BaseTransaction, Block
 from hathor.transaction.base_transaction import tx_or_block_from_bytes
+from hathor.transaction.exceptions import TxValidationError
 from hathor.transaction.storage.exceptions import TransactionDoesNotExist
 
 settings = HathorSettings()
@@ -53,6 +77,38 @@ def _get_deps(tx: BaseTransaction) -> Iterator[bytes]:
         yield txin.tx_id
 
 
+class BlockHeader(NamedTuple):
+    """ What the block headers sync needs of a validated block, see `NodeSyncTimestamp.validated_blocks` for its data.
+    """
+    hash: bytes
+    timestamp: int
+    weight: float
+
+
+class KnownInventory:
+    """ Bounded set of the hashes that a peer is known to have, the oldest ones are forgotten first.
+    """
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._hashes: OrderedDict[bytes, None] = OrderedDict()
+
+    def __contains__(self, hash_bytes: bytes) -> bool:
+        return hash_bytes in self._hashes
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, hash_bytes: bytes) -> None:
+        """ Add a hash, forgetting the oldest one if the set is full.
+        """
+        if hash_bytes in self._hashes:
+            self._hashes.move_to_end(hash_bytes)
+            return
+        self._hashes[hash_bytes] = None
+        if len(self._hashes) > self.max_size:
+            self._hashes.popitem(last=False)
+
+
 @implementer(IPushProducer)
 class SendDataPush:
     """ Prioritize blocks over transactions when pushing data to peers.
@@ -60,7 +116,8 @@ class SendDataPush:
     def __init__(self, node_sync: 'NodeSyncTimestamp'):
         self.node_sync = node_sync
         self.protocol: IProtocol = node_sync.protocol
-        self.consumer = self.protocol.transport
+        # The outbound queue pauses us along with the transport.
+        self.consumer = node_sync.protocol.outbound
 
         self.is_running: bool = False
         self.is_producing: bool = False
@@ -134,17 +191,19 @@ class SendDataPush:
         if len(self.priority_queue) > 0:
             # Send blocks first.
             _, (tx, _) = self.priority_queue.popitem(last=False)
+            priority = MessagePriority.BLOCKS
 
         elif len(self.queue) > 0:
             # Otherwise, send in order.
             _, (tx, _) = self.queue.popitem(last=False)
+            priority = MessagePriority.TX_RELAY
 
         else:
             # Nothing to send.
             self.delayed_call = None
             return
 
-        self.node_sync.send_data(tx)
+        self.node_sync.send_data(tx, priority)
         self.schedule_if_needed()
 
     def resumeProducing(self) -> None:
@@ -177,6 +236,16 @@ class NodeSyncTimestamp(Plugin):
 
     MAX_HASHES = 40
 
+    # Maximum number of blocks sent in a BLOCKS message.
+    MAX_BLOCKS = 100
+
+    # Maximum number of blocks validated by each round of the block headers sync, when the peer is further ahead the
+    # next round starts after they are downloaded.
+    MAX_BLOCK_HEADERS = 100000
+
+    # Maximum number of hashes of a block locator received in a GET-BLOCKS message.
+    MAX_BLOCK_LOCATOR = 100
+
     def __init__(self, protocol: 'HathorProtocol', reactor: Clock = None) -> None:
         """
         :param protocol: Protocol of the connection.
@@ -205,6 +274,16 @@ class NodeSyncTimestamp(Plugin):
 
         self.send_data_queue: SendDataPush = SendDataPush(self)
 
+        # Hashes that the peer already has, they are neither announced nor sent to it.
+        self.known_inventory = KnownInventory(settings.KNOWN_INVENTORY_MAX_SIZE)
+
+        # Hashes waiting to be announced in the next INV message.
+        self.inv_queue: List[bytes] = []
+        self.inv_call_later_id: Optional[IDelayedCall] = None
+
+        # Hashes requested because the peer announced them, they do not change the synced timestamp.
+        self.announced_requests: Set[bytes] = set()
+
         # Latest data timestamp of the peer.
         self.peer_merkle_hash: Optional[int] = None
         self.previous_timestamp: int = 0
@@ -219,16 +298,37 @@ class NodeSyncTimestamp(Plugin):
         # Indicate whether the synchronization is running.
         self.is_running: bool = False
 
+        # Whether the block headers sync has reached the peer's best block in this connection, see
+        # `sync_block_headers`.
+        self.block_headers_synced: bool = False
+
+        # Blocks of the peer's best chain that were validated by the block headers sync and are still missing in our
+        # storage, in chain order. They are the checkpoints of the timestamp sync.
+        self.block_headers: Deque[BlockHeader] = deque()
+
+        # Data of the blocks in `block_headers`, the timestamp sync adds them to the DAG instead of downloading them
+        # again, see `get_missing_data`.
+        self.validated_blocks: Dict[bytes, bytes] = {}
+
         # Create logger with context
         self.log = logger.new(peer_id_short=self.short_peer_id)
 
     def get_status(self):
         """ Return the status of the sync.
         """
-        return {
+        status: Dict[str, Any] = {
             'latest_timestamp': self.peer_timestamp,
             'synced_timestamp': self.synced_timestamp,
         }
+        if self.block_headers_synced or self.block_headers:
+            status['block_headers'] = {
+                'synced': self.block_headers_synced,
+                'pending': len(self.block_headers),
+                'best_block': self.block_headers[-1].hash.hex() if self.block_headers else None,
+            }
+        if self.protocol.connections is not None:
+            status['download'] = self.protocol.connections.downloader.get_peer_stats(self).to_json()
+        return status
 
     @property
     def short_peer_id(self) -> str:
@@ -249,6 +349,11 @@ class NodeSyncTimestamp(Plugin):
             ProtocolMessages.GET_NEXT: self.handle_get_next,
             ProtocolMessages.NEXT: self.handle_next,
             ProtocolMessages.NOT_FOUND: self.handle_not_found,
+            ProtocolMessages.GET_DATA_BATCH: self.handle_get_data_batch,
+            ProtocolMessages.DATA_BATCH: self.handle_data_batch,
+            ProtocolMessages.INV: self.handle_inv,
+            ProtocolMessages.GET_BLOCKS: self.handle_get_blocks,
+            ProtocolMessages.BLOCKS: self.handle_blocks,
         }
 
     def start(self) -> None:
@@ -265,6 +370,8 @@ class NodeSyncTimestamp(Plugin):
             self.send_data_queue.stop()
         if self.call_later_id and self.call_later_id.active():
             self.call_later_id.cancel()
+        if self.inv_call_later_id and self.inv_call_later_id.active():
+            self.inv_call_later_id.cancel()
 
     # XXX[jansegre]: maybe we should rename this to `out_of_sync` and invert the condition, would be easier to
     #                understand its usage on `send_tx_to_peer_if_possible` IMO
@@ -296,10 +403,16 @@ class NodeSyncTimestamp(Plugin):
                 if parent.timestamp > self.synced_timestamp:
                     return
 
-        if self.send_data_queue:
+        if tx.hash in self.known_inventory:
+            # The peer already has it, usually because it has sent it to us.
+            return
+
+        if self.supports_inv():
+            self.announce_tx(tx)
+        elif self.send_data_queue:
             self.send_data_queue.add(tx)
         else:
-            self.send_data(tx)
+            self.send_data(tx, MessagePriority.BLOCKS if tx.is_block else MessagePriority.TX_RELAY)
 
     def get_peer_next(self, timestamp: Optional[int] = None, offset: int = 0) -> Deferred:
         """ A helper that returns a deferred that is called when the peer replies.
@@ -337,6 +450,21 @@ class NodeSyncTimestamp(Plugin):
         self.deferred_by_key[key] = deferred
         return deferred
 
+    def get_peer_blocks(self, locator: List[bytes]) -> Deferred:
+        """ A helper that returns a deferred that is called when the peer replies.
+
+        :param locator: Hashes of blocks, the peer sends the ones after the first that is in its best chain
+
+        :rtype: Deferred
+        """
+        key = 'blocks'
+        if self.deferred_by_key.get(key, None) is not None:
+            raise Exception('latest_deferred is not None')
+        self.send_get_blocks(locator, self.MAX_BLOCKS)
+        deferred = Deferred()
+        self.deferred_by_key[key] = deferred
+        return deferred
+
     def get_data(self, hash_bytes: bytes) -> Deferred:
         """ A helper that returns a deferred that is called when the peer replies.
 
@@ -345,17 +473,91 @@ class NodeSyncTimestamp(Plugin):
 
         :rtype: Deferred
         """
+        return self.get_data_batch([hash_bytes])[0]
+
+    def get_data_batch(self, hashes: List[bytes]) -> List[Deferred]:
+        """ Same as `get_data` for many hashes, which lets the downloader request them in batches.
+        """
         assert self.protocol.connections is not None
-        d = self.protocol.connections.get_tx(hash_bytes, self)
-        d.addCallback(self.on_tx_success)
-        d.addErrback(self.on_get_data_failed, hash_bytes)
-        return d
+        deferreds = self.protocol.connections.get_txs(hashes, self)
+        for hash_bytes, d in zip(hashes, deferreds):
+            d.addCallback(self.on_tx_success)
+            d.addErrback(self.on_get_data_failed, hash_bytes)
+        return deferreds
+
+    def supports_data_batch(self) -> bool:
+        """ Whether the peer understands the GET-DATA-BATCH message.
+        """
+        return (settings.CAPABILITY_DATA_BATCH in self.manager.capabilities
+                and settings.CAPABILITY_DATA_BATCH in self.protocol.peer_capabilities)
+
+    def supports_tips_commitment(self) -> bool:
+        """ Whether the peer compares the tips by their commitment, see `TransactionStorage.get_tips_commitment`.
+        """
+        return (settings.CAPABILITY_TIPS_COMMITMENT in self.manager.capabilities
+                and settings.CAPABILITY_TIPS_COMMITMENT in self.protocol.peer_capabilities)
+
+    def supports_block_headers(self) -> bool:
+        """ Whether the peer understands the GET-BLOCKS message, see `sync_block_headers`.
+        """
+        return (settings.CAPABILITY_BLOCK_HEADERS in self.manager.capabilities
+                and settings.CAPABILITY_BLOCK_HEADERS in self.protocol.peer_capabilities)
+
+    def get_local_merkle_tree(self, timestamp: int) -> bytes:
+        """ Return the hash of our tips at a timestamp, to be compared to the one received in a TIPS message.
+        """
+        if self.supports_tips_commitment():
+            commitment, _ = self.manager.tx_storage.get_tips_commitment(timestamp)
+            return commitment
+        merkle_tree, _ = self.manager.tx_storage.get_merkle_tree(timestamp)
+        return merkle_tree
+
+    def supports_inv(self) -> bool:
+        """ Whether the peer understands the INV message.
+        """
+        return (settings.CAPABILITY_INV in self.manager.capabilities
+                and settings.CAPABILITY_INV in self.protocol.peer_capabilities)
+
+    def announce_tx(self, tx: BaseTransaction) -> None:
+        """ Add a tx to the next INV message, which is sent as soon as possible.
+        """
+        assert tx.hash is not None
+        self.known_inventory.add(tx.hash)
+        self.inv_queue.append(tx.hash)
+        if self.inv_call_later_id is None or not self.inv_call_later_id.active():
+            self.inv_call_later_id = self.reactor.callLater(0, self.flush_inv_queue)
+
+    def flush_inv_queue(self) -> None:
+        """ Send the INV messages of all txs waiting to be announced.
+        """
+        hashes = self.inv_queue
+        self.inv_queue = []
+        self.inv_call_later_id = None
+        max_hashes = settings.GET_DATA_BATCH_MAX_HASHES
+        for i in range(0, len(hashes), max_hashes):
+            self.send_inv(hashes[i:i + max_hashes])
 
     def request_data(self, hash_bytes: bytes) -> Deferred:
+        deferred = self._add_data_deferred(hash_bytes)
+        self.send_get_data(hash_bytes.hex())
+        return deferred
+
+    def request_data_batch(self, hashes: List[bytes]) -> List[Deferred]:
+        """ Request many txs in a single GET-DATA-BATCH message, it returns one deferred for each hash.
+
+        The peer must support it, see `supports_data_batch`.
+        """
+        assert len(hashes) <= settings.GET_DATA_BATCH_MAX_HASHES
+        deferreds = [self._add_data_deferred(hash_bytes) for hash_bytes in hashes]
+        self.send_get_data_batch(hashes)
+        return deferreds
+
+    def _add_data_deferred(self, hash_bytes: bytes) -> Deferred:
+        """ Create the deferred that is called when the data of `hash_bytes` arrives.
+        """
         key = self.get_data_key(hash_bytes)
         if self.deferred_by_key.get(key, None) is not None:
             raise Exception('latest_deferred is not None')
-        self.send_get_data(hash_bytes.hex())
         deferred = Deferred()
         self.deferred_by_key[key] = deferred
         # In case the deferred fails we just remove it from the dictionary
@@ -372,16 +574,21 @@ class NodeSyncTimestamp(Plugin):
         self.log.debug('sync start', ts=next_timestamp)
         assert next_timestamp < inf
         pending: WeakSet[Deferred] = WeakSet()
+        waiting: Dict[bytes, Deferred] = {}
         next_offset = 0
+        max_timestamp = self.peer_timestamp
+        if not self.block_headers_synced and self.block_headers:
+            # Only the blocks validated so far are downloaded, the next round of the block headers sync validates
+            # the ones after them.
+            max_timestamp = min(max_timestamp, self.block_headers[-1].timestamp)
         while True:
             payload = cast(NextPayload, (yield self.get_peer_next(next_timestamp, offset=next_offset)))
             self.log.debug('next payload', ts=payload.timestamp, next_ts=payload.next_timestamp,
                            next_offset=payload.next_offset, hashes=len(payload.hashes))
-            count = 0
-            for h in payload.hashes:
-                if not self.manager.tx_storage.transaction_exists(h):
-                    pending.add(self.get_data(h))
-                    count += 1
+            missing = [h for h in payload.hashes if not self.manager.tx_storage.transaction_exists(h)]
+            for deferred in self.get_missing_data(missing, waiting):
+                pending.add(deferred)
+            count = len(missing)
             self.log.debug('...', next_ts=next_timestamp, count=count, pending=len(pending))
             if next_timestamp != payload.next_timestamp and count == 0:
                 break
@@ -389,11 +596,64 @@ class NodeSyncTimestamp(Plugin):
             next_offset = payload.next_offset
             if next_timestamp == inf:
                 break
-            if next_timestamp > self.peer_timestamp:
+            if next_timestamp > max_timestamp:
                 break
         for deferred in pending:
             yield deferred
 
+    def get_missing_data(self, hashes: List[bytes], waiting: Dict[bytes, Deferred]) -> List[Deferred]:
+        """ Download the missing txs found by the timestamp sync, in this order.
+
+        The blocks validated by the block headers sync are not downloaded again, they are added to the DAG right
+        after their parents. So all their parents must be either in our storage or in `waiting`, which has the txs of
+        the current timestamp sync that have not been added yet. Otherwise, they are downloaded like the other txs.
+        """
+        tx_storage = self.manager.tx_storage
+        known = set(waiting)
+        blocks: List[Block] = []
+        to_download: List[bytes] = []
+        for hash_bytes in hashes:
+            known.add(hash_bytes)
+            data = self.validated_blocks.get(hash_bytes)
+            if data is not None:
+                block = cast(Block, tx_or_block_from_bytes(data))
+                if all(h in known or tx_storage.transaction_exists(h) for h in block.parents):
+                    blocks.append(block)
+                    continue
+            to_download.append(hash_bytes)
+
+        deferreds = self.get_data_batch(to_download)
+        for hash_bytes, deferred in zip(to_download, deferreds):
+            self._add_waiting(waiting, hash_bytes, deferred)
+        for block in blocks:
+            assert block.hash is not None
+            parents = [waiting[h] for h in block.parents if h in waiting]
+            deferred = DeferredList(parents)
+            deferred.addCallback(self._add_validated_block, block)
+            self._add_waiting(waiting, block.hash, deferred)
+            deferreds.append(deferred)
+        return deferreds
+
+    def _add_waiting(self, waiting: Dict[bytes, Deferred], hash_bytes: bytes, deferred: Deferred) -> None:
+        """ Keep the deferred of a tx in `waiting` until it is added to the DAG (or it fails).
+        """
+        waiting[hash_bytes] = deferred
+        deferred.addBoth(self._remove_waiting, waiting, hash_bytes)
+
+    def _remove_waiting(self, result: Any, waiting: Dict[bytes, Deferred], hash_bytes: bytes) -> Any:
+        """ Callback used to forget a tx of `waiting`.
+        """
+        waiting.pop(hash_bytes, None)
+        return result
+
+    def _add_validated_block(self, result: Any, block: Block) -> Block:
+        """ Callback used to add a block validated by the block headers sync to the DAG, once its parents are added.
+        """
+        block.storage = self.manager.tx_storage
+        assert block.timestamp is not None
+        self.requested_data_arrived(block.timestamp)
+        return cast(Block, self.on_tx_success(block))
+
     @inlineCallbacks
     def find_synced_timestamp(self) -> Iterator[Union[Iterator, Iterator[Deferred]]]:
         """ Search for the highest timestamp in which we are synced.
@@ -414,7 +674,13 @@ class NodeSyncTimestamp(Plugin):
         # Maximum of ceil(log(k)), where k is the number of items between the new one and the latest item.
         prev_cur = None
         cur = self.peer_timestamp
-        local_merkle_tree, _ = self.manager.tx_storage.get_merkle_tree(cur)
+        checkpoint = self.get_next_checkpoint()
+        if checkpoint is not None and checkpoint.timestamp <= cur:
+            # The peer has a block at this timestamp that we do not have, so the search starts below it.
+            prev_cur = checkpoint.timestamp
+            cur = max(prev_cur - 1, self.manager.tx_storage.first_timestamp)
+            tips = cast(TipsPayload, (yield self.get_peer_tips(cur)))
+        local_merkle_tree = self.get_local_merkle_tree(cur)
         step = 1
         while tips.merkle_tree != local_merkle_tree:
             if cur <= self.manager.tx_storage.first_timestamp:
@@ -423,7 +689,7 @@ class NodeSyncTimestamp(Plugin):
             assert self.manager.tx_storage.first_timestamp > 0
             cur = max(cur - step, self.manager.tx_storage.first_timestamp)
             tips = cast(TipsPayload, (yield self.get_peer_tips(cur)))
-            local_merkle_tree, _ = self.manager.tx_storage.get_merkle_tree(cur)
+            local_merkle_tree = self.get_local_merkle_tree(cur)
             step *= 2
 
         # Here, both nodes are synced at timestamp `cur` and not synced at timestamp `prev_cur`.
@@ -439,7 +705,7 @@ class NodeSyncTimestamp(Plugin):
         while high - low > 1:
             mid = (low + high + 1) // 2
             tips = cast(TipsPayload, (yield self.get_peer_tips(mid)))
-            local_merkle_tree, _ = self.manager.tx_storage.get_merkle_tree(mid)
+            local_merkle_tree = self.get_local_merkle_tree(mid)
             if tips.merkle_tree == local_merkle_tree:
                 low = mid
             else:
@@ -457,10 +723,120 @@ class NodeSyncTimestamp(Plugin):
         self.log.debug('synced', latest_ts=self.peer_timestamp, synced_at=self.synced_timestamp)
         return self.synced_timestamp + 1
 
+    def get_next_checkpoint(self) -> Optional[BlockHeader]:
+        """ Return the first block of the block headers sync that is still missing in our storage.
+        """
+        tx_storage = self.manager.tx_storage
+        while self.block_headers and tx_storage.transaction_exists(self.block_headers[0].hash):
+            header = self.block_headers.popleft()
+            self.validated_blocks.pop(header.hash, None)
+        return self.block_headers[0] if self.block_headers else None
+
+    @inlineCallbacks
+    def sync_block_headers(self) -> Iterator[Deferred]:
+        """ Download and validate the peer's best chain, from the last block that our best chain also has forward.
+
+        Only the blocks are downloaded, so a bad chain is found (and the connection is closed) before downloading the
+        rest of the DAG. Everything that does not need the transactions is checked, see `validate_block_headers`.
+        The validated blocks are kept in `self.block_headers` and `self.validated_blocks`. The timestamp sync uses them
+        as checkpoints and adds them to the DAG once their parents are there, instead of downloading them again. The
+        blocks cannot be added before, because their parents include txs.
+
+        Each round validates up to `MAX_BLOCK_HEADERS` blocks. When the peer is further ahead, the timestamp sync stops
+        at the last one and the next round starts from it once they are all downloaded.
+
+        It returns False when the chain is invalid.
+        """
+        self.log.debug('sync block headers')
+        tx_storage = self.manager.tx_storage
+        locator = tx_storage.get_block_locator()
+        headers: List[BlockHeader] = []
+        validated_blocks: Dict[bytes, bytes] = {}
+        ancestor: Optional[Block] = None
+        while len(headers) < self.MAX_BLOCK_HEADERS:
+            blocks = cast(List[Block], (yield self.get_peer_blocks(locator)))
+            if not blocks:
+                break
+            for block in blocks:
+                assert block.hash is not None
+                try:
+                    if not block.parents:
+                        raise InvalidNewTransaction('Invalid new block {}: no parents'.format(block.hash_hex))
+                    block.verify_without_storage()
+                except (InvalidNewTransaction, TxValidationError) as e:
+                    self.protocol.send_error_and_close_connection('Invalid block: {}'.format(e))
+                    return False
+                parent_hash = block.get_block_parent_hash()
+                if ancestor is None and parent_hash in locator:
+                    ancestor = cast(Block, tx_storage.get_transaction(parent_hash))
+                elif not headers or parent_hash != headers[-1].hash:
+                    self.protocol.send_error_and_close_connection('Unexpected block {}.'.format(block.hash_hex))
+                    return False
+                headers.append(BlockHeader(block.hash, block.timestamp, block.weight))
+                validated_blocks[block.hash] = block.get_struct()
+            locator = [headers[-1].hash]
+
+        if ancestor is not None:
+            try:
+                self.validate_block_headers(ancestor, headers)
+            except InvalidNewTransaction as e:
+                self.protocol.send_error_and_close_connection('Invalid block: {}'.format(e))
+                return False
+        self.log.debug('block headers synced', count=len(headers))
+        self.block_headers = deque(headers)
+        self.validated_blocks = validated_blocks
+        self.block_headers_synced = len(headers) < self.MAX_BLOCK_HEADERS
+        return True
+
+    def validate_block_headers(self, ancestor: Block, headers: List[BlockHeader]) -> None:
+        """ Check the timestamps and the weights (according to the DAA) of a chain of blocks, starting at a block of
+        our storage.
+
+        :raises InvalidNewTransaction: when a block is invalid
+        """
+        max_window_size = 2 * settings.BLOCK_DIFFICULTY_N_BLOCKS + 1
+        window: List[Tuple[int, float]] = []
+        block = ancestor
+        while len(window) < max_window_size:
+            window.append((block.timestamp, block.weight))
+            if block.is_genesis:
+                break
+            block = block.get_block_parent()
+        window.reverse()
+
+        height = ancestor.get_metadata().height
+        parent_timestamp = ancestor.timestamp
+        parent_is_genesis = ancestor.is_genesis
+        for header in headers:
+            if header.timestamp <= parent_timestamp:
+                raise InvalidNewTransaction('Invalid new block {}: timestamp is not greater than the parent\'s'.format(
+                    header.hash.hex()))
+            if not parent_is_genesis and header.timestamp - parent_timestamp > settings.MAX_DISTANCE_BETWEEN_BLOCKS:
+                raise InvalidNewTransaction('Invalid new block {}: too far from the parent'.format(header.hash.hex()))
+            min_weight = self.manager.calculate_next_weight_from_window(height, window, header.timestamp)
+            if header.weight < min_weight - settings.WEIGHT_TOL:
+                raise InvalidNewTransaction(
+                    'Invalid new block {}: weight ({}) is smaller than the minimum weight ({})'.format(
+                        header.hash.hex(), header.weight, min_weight
+                    )
+                )
+            window.append((header.timestamp, header.weight))
+            if len(window) > 2 * max_window_size:
+                del window[:-max_window_size]
+            height += 1
+            parent_timestamp = header.timestamp
+            parent_is_genesis = False
+
     @inlineCallbacks
     def _next_step(self) -> Iterator[Union[Iterator, Iterator[Deferred]]]:
         """ Run the next step to keep nodes synced.
         """
+        if (not self.block_headers_synced and self.supports_block_headers()
+                and self.get_next_checkpoint() is None):
+            valid = yield self.sync_block_headers()
+            if not valid:
+                return
+
         next_timestamp = yield self.find_synced_timestamp()
         self.log.debug('_next_step', next_timestamp=next_timestamp)
         if next_timestamp is None:
@@ -490,11 +866,12 @@ class NodeSyncTimestamp(Plugin):
         finally:
             self.is_running = False
 
-    def send_message(self, cmd: ProtocolMessages, payload: Optional[str] = None) -> None:
+    def send_message(self, cmd: ProtocolMessages, payload: Optional[str] = None,
+                     priority: Optional[MessagePriority] = None) -> None:
         """ Helper to send a message.
         """
         assert self.protocol.state is not None
-        self.protocol.state.send_message(cmd, payload)
+        self.protocol.state.send_message(cmd, payload, priority)
 
     def send_get_next(self, timestamp: Optional[int], offset: int = 0) -> None:
         """ Send a GET-NEXT message.
@@ -518,20 +895,23 @@ class NodeSyncTimestamp(Plugin):
         """
         count = self.MAX_HASHES
 
-        all_sorted = self.manager.tx_storage.get_all_sorted_txs(timestamp, count, offset)
-        ret_txs = all_sorted[offset:offset+count]
-        hashes = [tx.hash.hex() for tx in ret_txs]
-
-        if len(ret_txs) < count:
+        # The offset is counted from the first tx at the timestamp, and the next offset from the first tx at the
+        # next timestamp, so we go through the skipped txs too, counting how many there are at each timestamp.
+        hashes = []
+        next_timestamp: float = timestamp
+        next_offset = 0
+        for index, element in enumerate(self.manager.tx_storage.iter_sorted_txs(timestamp, offset + count)):
+            if element.timestamp != next_timestamp:
+                next_timestamp = element.timestamp
+                next_offset = 0
+            next_offset += 1
+            if index >= offset:
+                hashes.append(element.hash.hex())
+
+        if len(hashes) < count:
             # this means we've reached the end and there's nothing else to sync
             next_offset = 0
             next_timestamp = inf
-        else:
-            next_offset = offset + count
-            next_timestamp = ret_txs[-1].timestamp
-            if next_timestamp != timestamp:
-                next_idx = all_sorted.find_first_at_timestamp(next_timestamp)
-                next_offset -= next_idx
 
         data = {
             'timestamp': timestamp,
@@ -555,16 +935,21 @@ class NodeSyncTimestamp(Plugin):
 
     def send_get_tips(self, timestamp: Optional[int] = None, include_hashes: bool = False, offset: int = 0) -> None:
         """ Send a GET-TIPS message.
+
+        When the peer supports it, the commitment of the tips is requested instead of the merkle tree.
         """
-        if timestamp is None:
+        commitment = self.supports_tips_commitment()
+        if timestamp is None and not commitment:
             self.send_message(ProtocolMessages.GET_TIPS)
         else:
-            payload = json.dumps(dict(
+            data: Dict[str, Any] = dict(
                 timestamp=timestamp,
                 include_hashes=include_hashes,
                 offset=offset,
-            ))
-            self.send_message(ProtocolMessages.GET_TIPS, payload)
+            )
+            if commitment:
+                data['commitment'] = True
+            self.send_message(ProtocolMessages.GET_TIPS, json.dumps(data))
 
     def handle_get_tips(self, payload: str) -> None:
         """ Handle a received GET-TIPS message.
@@ -574,10 +959,13 @@ class NodeSyncTimestamp(Plugin):
         else:
             data = json.loads(payload)
             args = GetTipsPayload(**data)
-            self.send_tips(args.timestamp, args.include_hashes, args.offset)
+            self.send_tips(args.timestamp, args.include_hashes, args.offset, commitment=args.commitment)
 
-    def send_tips(self, timestamp: Optional[int] = None, include_hashes: bool = False, offset: int = 0) -> None:
+    def send_tips(self, timestamp: Optional[int] = None, include_hashes: bool = False, offset: int = 0, *,
+                  commitment: bool = False) -> None:
         """ Send a TIPS message.
+
+        :param commitment: whether to send the commitment of the tips and their number instead of the merkle tree
         """
         if timestamp is None:
             timestamp = self.manager.tx_storage.latest_timestamp
@@ -587,8 +975,16 @@ class NodeSyncTimestamp(Plugin):
         # if len(intervals) == 0:
         #     raise Exception('No tips for timestamp {}'.format(timestamp))
 
-        # Calculate list of hashes to be sent
-        merkle_tree, hashes = self.manager.tx_storage.get_merkle_tree(timestamp)
+        length = 0  # len(intervals)
+        hashes: List[bytes] = []
+        if commitment:
+            # The tips themselves are only needed when their hashes are requested.
+            merkle_tree, length = self.manager.tx_storage.get_tips_commitment(timestamp)
+            if include_hashes:
+                _, hashes = self.manager.tx_storage.get_merkle_tree(timestamp)
+        else:
+            # Calculate list of hashes to be sent
+            merkle_tree, hashes = self.manager.tx_storage.get_merkle_tree(timestamp)
         has_more = False
 
         if not include_hashes:
@@ -600,7 +996,7 @@ class NodeSyncTimestamp(Plugin):
                 has_more = True
 
         data = {
-            'length': 0,  # len(intervals),
+            'length': length,
             'timestamp': timestamp,
             'merkle_tree': merkle_tree.hex(),
             'hashes': [h.hex() for h in hashes],
@@ -622,6 +1018,59 @@ class NodeSyncTimestamp(Plugin):
         if deferred:
             deferred.callback(args)
 
+    def send_get_blocks(self, locator: List[bytes], count: int) -> None:
+        """ Send a GET-BLOCKS message.
+        """
+        payload = json.dumps(dict(
+            locator=[h.hex() for h in locator],
+            count=count,
+        ))
+        self.send_message(ProtocolMessages.GET_BLOCKS, payload)
+
+    def handle_get_blocks(self, payload: str) -> None:
+        """ Handle a received GET-BLOCKS message.
+        """
+        data = json.loads(payload)
+        args = GetBlocksPayload(**data)
+        locator = [bytes.fromhex(h) for h in args.locator[:self.MAX_BLOCK_LOCATOR]]
+        self.send_blocks(locator, args.count)
+
+    def send_blocks(self, locator: List[bytes], count: int) -> None:
+        """ Send a BLOCKS message with the blocks of our best chain after the first block of the locator that is in it,
+        from the oldest to the newest.
+
+        The list is empty when none of them is in our best chain or there is no block after it.
+        """
+        blocks = self.manager.tx_storage.get_best_chain_after(locator, min(count, self.MAX_BLOCKS))
+        items: List[str] = []
+        size = 0
+        for block in blocks:
+            item = base64.b64encode(block.get_struct()).decode('ascii')
+            if items and size + len(item) > settings.DATA_BATCH_MAX_SIZE:
+                break
+            items.append(item)
+            size += len(item) + 1
+        self.send_message(ProtocolMessages.BLOCKS, ' '.join(items))
+
+    def handle_blocks(self, payload: str) -> None:
+        """ Handle a received BLOCKS message.
+        """
+        blocks: List[Block] = []
+        for item in payload.split():
+            try:
+                block = tx_or_block_from_bytes(base64.b64decode(item))
+            except (struct.error, ValueError):
+                block = None
+            if not isinstance(block, Block):
+                self.protocol.send_error_and_close_connection('Invalid BLOCKS payload.')
+                return
+            blocks.append(block)
+
+        key = 'blocks'
+        deferred = self.deferred_by_key.pop(key, None)
+        if deferred:
+            deferred.callback(blocks)
+
     def send_get_data(self, hash_hex: str) -> None:
         """ Send a GET-DATA message, requesting the data of a given hash.
         """
@@ -640,19 +1089,98 @@ class NodeSyncTimestamp(Plugin):
             self.send_message(ProtocolMessages.NOT_FOUND, hash_hex)
 
     def handle_not_found(self, payload: str) -> None:
-        """ Handle a received NOT-FOUND message.
+        """ Handle a received NOT-FOUND message, which may have many concatenated hashes.
         """
-        hash_hex = payload
-        # We ask for the downloader to retry the request
+        data = bytes.fromhex(payload)
+        # We ask for the downloader to retry the requests
         assert self.protocol.connections is not None
-        self.protocol.connections.retry_get_tx(bytes.fromhex(hash_hex))
+        for i in range(0, len(data), 32):
+            self.protocol.connections.retry_get_tx(data[i:i + 32])
+
+    def send_inv(self, hashes: List[bytes]) -> None:
+        """ Send an INV message, announcing the given hashes.
+        """
+        self.send_message(ProtocolMessages.INV, b''.join(hashes).hex())
 
-    def send_data(self, tx: BaseTransaction) -> None:
+    def handle_inv(self, payload: str) -> None:
+        """ Handle a received INV message, requesting the txs we do not have yet.
+
+        The txs are requested through the downloader, so a tx announced by many peers is downloaded only once.
+        """
+        data = bytes.fromhex(payload)
+        if len(data) % 32 != 0 or len(data) // 32 > settings.GET_DATA_BATCH_MAX_HASHES:
+            self.protocol.send_error_and_close_connection('Invalid INV payload.')
+            return
+        missing = []
+        for i in range(0, len(data), 32):
+            hash_bytes = data[i:i + 32]
+            self.known_inventory.add(hash_bytes)
+            if not self.manager.tx_storage.transaction_exists(hash_bytes):
+                missing.append(hash_bytes)
+        self.announced_requests.update(missing)
+        for hash_bytes, deferred in zip(missing, self.get_data_batch(missing)):
+            deferred.addBoth(self._remove_announced_request, hash_bytes)
+
+    def _remove_announced_request(self, result: Any, hash_bytes: bytes) -> Any:
+        """ Callback used to forget an announced tx after it is downloaded (or it fails).
+        """
+        self.announced_requests.discard(hash_bytes)
+        return result
+
+    def send_get_data_batch(self, hashes: List[bytes]) -> None:
+        """ Send a GET-DATA-BATCH message, requesting the data of many hashes.
+        """
+        self.send_message(ProtocolMessages.GET_DATA_BATCH, b''.join(hashes).hex())
+
+    def handle_get_data_batch(self, payload: str) -> None:
+        """ Handle a received GET-DATA-BATCH message.
+
+        The txs that are found are sent in DATA-BATCH messages and the missing ones in a single NOT-FOUND message.
+        """
+        data = bytes.fromhex(payload)
+        if len(data) % 32 != 0 or len(data) // 32 > settings.GET_DATA_BATCH_MAX_HASHES:
+            self.protocol.send_error_and_close_connection('Invalid GET-DATA-BATCH payload.')
+            return
+        hashes = [data[i:i + 32] for i in range(0, len(data), 32)]
+        txs = self.manager.tx_storage.get_transactions(hashes)
+
+        items: List[str] = []
+        size = 0
+        not_found: List[bytes] = []
+        for hash_bytes in hashes:
+            tx = txs.get(hash_bytes)
+            if tx is None:
+                not_found.append(hash_bytes)
+                continue
+            self.known_inventory.add(hash_bytes)
+            item = base64.b64encode(tx.get_struct()).decode('ascii')
+            if items and size + len(item) > settings.DATA_BATCH_MAX_SIZE:
+                self.send_message(ProtocolMessages.DATA_BATCH, ' '.join(items))
+                items = []
+                size = 0
+            items.append(item)
+            size += len(item) + 1
+        if items:
+            self.send_message(ProtocolMessages.DATA_BATCH, ' '.join(items))
+        if not_found:
+            self.send_message(ProtocolMessages.NOT_FOUND, b''.join(not_found).hex())
+
+    def handle_data_batch(self, payload: str) -> None:
+        """ Handle a received DATA-BATCH message, each tx is handled just like a DATA message.
+        """
+        for item in payload.split():
+            self.handle_data(item)
+
+    def send_data(self, tx: BaseTransaction, priority: Optional[MessagePriority] = None) -> None:
         """ Send a DATA message.
+
+        :param priority: priority in the outbound queue, it is given when the tx is pushed instead of requested
         """
         self.log.debug('send tx', tx=tx.hash_hex)
+        assert tx.hash is not None
+        self.known_inventory.add(tx.hash)
         payload = base64.b64encode(tx.get_struct()).decode('ascii')
-        self.send_message(ProtocolMessages.DATA, payload)
+        self.send_message(ProtocolMessages.DATA, payload, priority)
 
     def handle_data(self, payload: str) -> None:
         """ Handle a received DATA message.
@@ -675,13 +1203,15 @@ class NodeSyncTimestamp(Plugin):
             return
         tx.storage = self.protocol.node.tx_storage
         assert tx.hash is not None
+        self.known_inventory.add(tx.hash)
 
         key = self.get_data_key(tx.hash)
         deferred = self.deferred_by_key.pop(key, None)
         if deferred:
             # Adding to the DAG will be done after the downloader validates the correct order
             assert tx.timestamp is not None
-            self.requested_data_arrived(tx.timestamp)
+            if tx.hash not in self.announced_requests:
+                self.requested_data_arrived(tx.timestamp)
             deferred.callback(tx)
         else:
             # If we have not requested the data, it is a new transaction being propagated
@@ -0,0 +1,201 @@
+from collections import deque
+from enum import IntEnum
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional
+
+from structlog import get_logger
+from twisted.internet.interfaces import IPushProducer, ITransport
+from zope.interface import implementer
+
+from hathor.p2p.messages import ProtocolMessages
+
+if TYPE_CHECKING:
+    from hathor.p2p.protocol import HathorProtocol  # noqa: F401
+
+logger = get_logger()
+
+
+class MessagePriority(IntEnum):
+    """ Priority classes of the outbound messages, the lower values are sent first.
+    """
+    # Handshake, errors and keepalive.
+    CONTROL = 0
+
+    # Block headers and pushed blocks (with the txs they depend on).
+    BLOCKS = 1
+
+    # Requests and replies of the sync and peer discovery.
+    SYNC = 2
+
+    # Announced and pushed txs, they are dropped when the queue is full because the sync gets them anyway.
+    TX_RELAY = 3
+
+
+# Priority of each message when the sender does not give one, the missing ones are `MessagePriority.SYNC`.
+MESSAGE_PRIORITIES: Dict[ProtocolMessages, MessagePriority] = {
+    ProtocolMessages.ERROR: MessagePriority.CONTROL,
+    ProtocolMessages.THROTTLE: MessagePriority.CONTROL,
+    ProtocolMessages.HELLO: MessagePriority.CONTROL,
+    ProtocolMessages.PEER_ID: MessagePriority.CONTROL,
+    ProtocolMessages.READY: MessagePriority.CONTROL,
+    ProtocolMessages.PING: MessagePriority.CONTROL,
+    ProtocolMessages.PONG: MessagePriority.CONTROL,
+    ProtocolMessages.GET_BLOCKS: MessagePriority.BLOCKS,
+    ProtocolMessages.BLOCKS: MessagePriority.BLOCKS,
+    ProtocolMessages.INV: MessagePriority.TX_RELAY,
+}
+
+
+@implementer(IPushProducer)
+class OutboundQueue:
+    """ Schedule the messages sent to a peer, it is the producer of the connection's transport.
+
+    The messages are written right away while the transport accepts them. When the transport pushes back, they wait
+    in one queue per `MessagePriority` and are written in priority order once it resumes. The bytes waiting are
+    limited by `max_bytes`: above it, tx relay messages are dropped and the messages of the peer are not read (so no
+    new replies are generated) until half of them are sent.
+
+    A push producer, like `SendDataPush`, may be registered here instead of in the transport, which only takes one.
+    It is paused while the transport is.
+    """
+
+    def __init__(self, protocol: 'HathorProtocol', max_bytes: int) -> None:
+        self.protocol = protocol
+        self.max_bytes = max_bytes
+
+        self.transport: Optional[ITransport] = None
+
+        # Whether the transport has paused us.
+        self.is_paused: bool = False
+
+        # Whether we have stopped reading the messages of the peer.
+        self.is_reading_paused: bool = False
+
+        self.queues: List[Deque[bytes]] = [deque() for _ in MessagePriority]
+        self.queued_bytes: int = 0
+
+        self.producer: Optional[IPushProducer] = None
+
+        self.log = logger.new()
+
+    def start(self, transport: ITransport) -> None:
+        """ Register as the producer of the transport.
+        """
+        self.transport = transport
+        transport.registerProducer(self, True)
+
+    def stop(self) -> None:
+        """ Unregister from the transport, the messages still queued are discarded.
+        """
+        if self.transport is None:
+            return
+        self.clear()
+        self.transport.unregisterProducer()
+        self.transport = None
+
+    def clear(self) -> None:
+        for queue in self.queues:
+            queue.clear()
+        self.queued_bytes = 0
+        self._update_metrics()
+
+    def registerProducer(self, producer: IPushProducer, streaming: bool) -> None:
+        """ Register a push producer that is paused along with the transport.
+        """
+        assert streaming
+        assert self.producer is None
+        self.producer = producer
+        if self.is_paused:
+            producer.pauseProducing()
+
+    def unregisterProducer(self) -> None:
+        self.producer = None
+
+    def write(self, data: bytes, priority: MessagePriority) -> None:
+        """ Write a message to the transport, or queue it when the transport is paused.
+        """
+        if self.transport is None:
+            return
+        if not self.is_paused and self.queued_bytes == 0:
+            self.transport.write(data)
+            return
+
+        if self.queued_bytes + len(data) > self.max_bytes:
+            self._drop_tx_relay(len(data))
+            if priority == MessagePriority.TX_RELAY and self.queued_bytes + len(data) > self.max_bytes:
+                self.protocol.metrics.dropped_messages += 1
+                return
+
+        self.queues[priority].append(data)
+        self.queued_bytes += len(data)
+        if self.queued_bytes > self.max_bytes:
+            self._pause_reading()
+        self._update_metrics()
+
+    def _drop_tx_relay(self, size: int) -> None:
+        """ Drop the oldest tx relay messages until `size` more bytes fit in the queue.
+        """
+        queue = self.queues[MessagePriority.TX_RELAY]
+        while queue and self.queued_bytes + size > self.max_bytes:
+            data = queue.popleft()
+            self.queued_bytes -= len(data)
+            self.protocol.metrics.dropped_messages += 1
+
+    def _flush(self) -> None:
+        """ Write the queued messages in priority order until the transport pauses us again.
+        """
+        assert self.transport is not None
+        for queue in self.queues:
+            while queue and not self.is_paused:
+                data = queue.popleft()
+                self.queued_bytes -= len(data)
+                self.transport.write(data)
+        if self.queued_bytes <= self.max_bytes // 2:
+            self._resume_reading()
+        self._update_metrics()
+
+    def _pause_reading(self) -> None:
+        if self.is_reading_paused or self.transport is None:
+            return
+        self.log.debug('outbound queue is full, pause reading', queued_bytes=self.queued_bytes)
+        self.is_reading_paused = True
+        self.transport.pauseProducing()
+
+    def _resume_reading(self) -> None:
+        if not self.is_reading_paused or self.transport is None:
+            return
+        self.is_reading_paused = False
+        self.transport.resumeProducing()
+
+    def _update_metrics(self) -> None:
+        metrics = self.protocol.metrics
+        metrics.queued_messages = sum(len(queue) for queue in self.queues)
+        metrics.queued_bytes = self.queued_bytes
+
+    def pauseProducing(self) -> None:
+        """ Called by the transport when its buffer is full.
+        """
+        self.is_paused = True
+        if self.producer is not None:
+            self.producer.pauseProducing()
+
+    def resumeProducing(self) -> None:
+        """ Called by the transport when its buffer has been sent.
+        """
+        self.is_paused = False
+        if self.transport is None:
+            return
+        self._flush()
+        if self.transport.disconnecting:
+            # The transport only closes the connection after its producer is unregistered.
+            self.stop()
+            return
+        if not self.is_paused and self.producer is not None:
+            self.producer.resumeProducing()
+
+    def stopProducing(self) -> None:
+        """ Called by the transport when the connection is lost.
+        """
+        self.is_paused = True
+        self.clear()
+        if self.producer is not None:
+            self.producer.stopProducing()
@@ -8,7 +8,10 @@ from twisted.internet.interfaces import ITransport
 from twisted.protocols.basic import LineReceiver
 from twisted.python.failure import Failure
 
+from hathor.conf import HathorSettings
+from hathor.p2p.framing import FrameDecoder, FramingError, encode_frame
 from hathor.p2p.messages import ProtocolMessages
+from hathor.p2p.outbound import MESSAGE_PRIORITIES, MessagePriority, OutboundQueue
 from hathor.p2p.peer_id import PeerId
 from hathor.p2p.rate_limiter import RateLimiter
 from hathor.p2p.states import BaseState, HelloState, PeerIdState, ReadyState
@@ -18,6 +21,7 @@ if TYPE_CHECKING:
     from hathor.p2p.manager import ConnectionsManager  # noqa: F401
 
 logger = get_logger()
+settings = HathorSettings()
 
 
 class HathorProtocol:
@@ -54,6 +58,10 @@ class HathorProtocol:
             self.discarded_txs: int = 0
             self.received_blocks: int = 0
             self.discarded_blocks: int = 0
+            # Messages waiting in the outbound queue and the ones it dropped, see `OutboundQueue`.
+            self.queued_messages: int = 0
+            self.queued_bytes: int = 0
+            self.dropped_messages: int = 0
 
         def format_bytes(self, value: int) -> str:
             """ Format bytes in MB and kB.
@@ -79,6 +87,12 @@ class HathorProtocol:
                 self.sent_messages,
                 self.format_bytes(self.sent_bytes))
             )
+            print('{}Outbound queue: {:8d} messages  {}  {:8d} dropped'.format(
+                prefix,
+                self.queued_messages,
+                self.format_bytes(self.queued_bytes),
+                self.dropped_messages)
+            )
             print('{}Blocks:         {:8d} received  {:8d} discarded ({:2.0f}%)'.format(
                 prefix,
                 self.received_blocks,
@@ -105,6 +119,7 @@ class HathorProtocol:
     connections: Optional['ConnectionsManager']
     node: 'HathorManager'
     app_version: str
+    peer_capabilities: Set[str]
     last_message: float
     peer: Optional[PeerId]
     transport: ITransport
@@ -128,6 +143,9 @@ class HathorProtocol:
 
         self.app_version = 'Unknown'
 
+        # Capabilities of the peer, they are known after its HELLO message.
+        self.peer_capabilities = set()
+
         # The peer on the other side of the connection.
         self.peer = None
 
@@ -135,6 +153,9 @@ class HathorProtocol:
         self.last_message = 0
         self.metrics = self.Metrics()
 
+        # Scheduler of the messages sent to the peer, it applies the backpressure of the transport.
+        self.outbound = OutboundQueue(self, settings.P2P_OUTBOUND_QUEUE_MAX_BYTES)
+
         # The last time a request was send to this peer.
         self.last_request = 0
 
@@ -168,6 +189,12 @@ class HathorProtocol:
 
         self.log = logger.new()
 
+    def use_binary_framing(self) -> bool:
+        """ Whether both peers support the binary framing, which is used after each one sends its READY message.
+        """
+        return (settings.CAPABILITY_BINARY_FRAMING in self.node.capabilities
+                and settings.CAPABILITY_BINARY_FRAMING in self.peer_capabilities)
+
     def change_state(self, state_enum: PeerState) -> None:
         if state_enum not in self._state_instances:
             state_cls = state_enum.value
@@ -190,6 +217,8 @@ class HathorProtocol:
 
         self.connection_time = time.time()
 
+        self.outbound.start(self.transport)
+
         # The initial state is HELLO.
         self.change_state(self.PeerState.HELLO)
 
@@ -206,16 +235,26 @@ class HathorProtocol:
         self.connected = False
         if self.state:
             self.state.on_exit()
+        self.outbound.stop()
         if self.connections:
             self.connections.on_peer_disconnect(self)
 
-    def send_message(self, cmd: ProtocolMessages, payload: Optional[str] = None) -> None:
+    def send_message(self, cmd: ProtocolMessages, payload: Optional[str] = None,
+                     priority: Optional[MessagePriority] = None) -> None:
         """ A generic message which must be implemented to send a message
         to the peer. It depends on the underlying protocol in which
         HathorProtocol is running.
+
+        :param priority: priority of the message in the outbound queue, by default it depends on the command (see
+            `MESSAGE_PRIORITIES`)
         """
         raise NotImplementedError
 
+    def get_message_priority(self, cmd: ProtocolMessages, priority: Optional[MessagePriority]) -> MessagePriority:
+        if priority is not None:
+            return priority
+        return MESSAGE_PRIORITIES.get(cmd, MessagePriority.SYNC)
+
     def recv_message(self, cmd: ProtocolMessages, payload: str) -> Optional[Generator[Any, Any, None]]:
         """ Executed when a new message arrives.
         """
@@ -252,7 +291,8 @@ class HathorProtocol:
         self.log.warn('close connection due to previous error')
         # from twisted docs: "If a producer is being used with the transport, loseConnection will only close
         # the connection once the producer is unregistered." We call on_exit to make sure any producers (like
-        # the one from node_sync) are unregistered
+        # the one from node_sync) are unregistered. The outbound queue unregisters itself after it sends the
+        # messages still queued, like this ERROR.
         if self.state:
             self.state.on_exit()
         self.transport.loseConnection()
@@ -266,11 +306,17 @@ class HathorProtocol:
 class HathorLineReceiver(HathorProtocol, LineReceiver):
     """ Implements HathorProtocol in a LineReceiver protocol.
     It is simply a TCP connection which sends one message per line.
+
+    When both peers have the binary framing capability, the messages after the READY message are sent in binary
+    frames instead (see `hathor.p2p.framing`). Each direction switches on its own: the sender right after sending
+    its READY and the receiver right after receiving it.
     """
     MAX_LENGTH = 65536
 
     def connectionMade(self) -> None:
         super(HathorLineReceiver, self).connectionMade()
+        self._binary_sending = False
+        self._frame_decoder: Optional[FrameDecoder] = None
         self.setLineMode()
         self.on_connect()
 
@@ -299,18 +345,45 @@ class HathorLineReceiver(HathorProtocol, LineReceiver):
             self.transport.loseConnection()
             return None
         else:
+            if cmd == ProtocolMessages.READY and self.use_binary_framing():
+                # The remaining data is handled by `rawDataReceived`.
+                self._frame_decoder = FrameDecoder(self.MAX_LENGTH)
+                self.setRawMode()
             self.recv_message(cmd, msgdata)
             return None
 
-    def send_message(self, cmd_enum: ProtocolMessages, payload: Optional[str] = None) -> None:
+    def rawDataReceived(self, data: bytes) -> None:
+        assert self._frame_decoder is not None
+        try:
+            for frame_size, cmd, payload in self._frame_decoder.feed(data):
+                self.metrics.received_messages += 1
+                self.metrics.received_bytes += frame_size
+                self.recv_message(cmd, payload)
+                if self.transport.disconnecting:
+                    break
+        except FramingError as e:
+            self.log.warn('invalid frame', reason=str(e))
+            self.transport.loseConnection()
+
+    def send_message(self, cmd_enum: ProtocolMessages, payload: Optional[str] = None,
+                     priority: Optional[MessagePriority] = None) -> None:
+        self.metrics.sent_messages += 1
+        priority = self.get_message_priority(cmd_enum, priority)
+        if self._binary_sending:
+            frame = encode_frame(cmd_enum, payload)
+            self.metrics.sent_bytes += len(frame)
+            self.outbound.write(frame, priority)
+            return
+
         cmd = cmd_enum.value
         if payload:
             line = '{} {}'.format(cmd, payload).encode('utf-8')
         else:
             line = cmd.encode('utf-8')
-        self.metrics.sent_messages += 1
         self.metrics.sent_bytes += len(line)
-        self.sendLine(line)
+        self.outbound.write(line + self.delimiter, priority)
+        if cmd_enum == ProtocolMessages.READY and self.use_binary_framing():
+            self._binary_sending = True
 
 
 class HathorWebSocketServerProtocol(WebSocketServerProtocol, HathorProtocol):  # pragma: no cover
@@ -83,6 +83,7 @@ class StatusResource(resource.Resource):
                 'handshaking_peers': handshaking_peers,
                 'connecting_peers': connecting_peers,
             },
+            'downloader': self.manager.connections.downloader.get_status(),
             'dag': {
                 'first_timestamp': self.manager.tx_storage.first_timestamp,
                 'latest_timestamp': self.manager.tx_storage.latest_timestamp,
@@ -154,6 +155,12 @@ StatusResource.openapi = {
                                                 }
                                             ]
                                         },
+                                        'downloader': {
+                                            'window_size': 100,
+                                            'waiting': 0,
+                                            'downloading': 0,
+                                            'downloaded': 0
+                                        },
                                         'dag': {
                                             'first_timestamp': 1539271481,
                                             'latest_timestamp': 1539271483
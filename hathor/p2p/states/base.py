@@ -3,6 +3,7 @@ from typing import TYPE_CHECKING, Callable, Dict, Optional
 from structlog import get_logger
 
 from hathor.p2p.messages import ProtocolMessages
+from hathor.p2p.outbound import MessagePriority
 
 if TYPE_CHECKING:
     from hathor.p2p.protocol import HathorProtocol  # noqa: F401
@@ -33,8 +34,9 @@ class BaseState:
     def handle_throttle(self, payload: str) -> None:
         self.log.info('throttled', payload=payload)
 
-    def send_message(self, cmd: ProtocolMessages, payload: Optional[str] = None) -> None:
-        self.protocol.send_message(cmd, payload)
+    def send_message(self, cmd: ProtocolMessages, payload: Optional[str] = None,
+                     priority: Optional[MessagePriority] = None) -> None:
+        self.protocol.send_message(cmd, payload, priority)
 
     def send_throttle(self, key: str) -> None:
         limit = self.protocol.ratelimit.get_limit(key)
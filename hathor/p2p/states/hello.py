@@ -97,4 +97,5 @@ class HelloState(BaseState):
             return
 
         protocol.app_version = data['app']
+        protocol.peer_capabilities = set(data['capabilities'])
         protocol.change_state(protocol.PeerState.PEER_ID)
@@ -0,0 +1,68 @@
+"""
+Copyright 2019 Hathor Labs
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from functools import lru_cache
+from hashlib import sha256
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from _hashlib import HASH
+
+# Number of nonces tried by the mining loops between checks of their control variables (time, stop signals, etc).
+NONCE_BATCH_SIZE = 10000
+
+
+@lru_cache(maxsize=1024, typed=True)
+def weight_to_target(weight: float) -> int:
+    """ Target to be achieved by a hash to solve the proof-of-work of the given weight, `2**(256 - weight) - 1`.
+
+    Results are cached because the same few weights are used over and over. The cache is typed because an integer
+    weight is computed with integer arithmetic, which is not the same as the float one.
+
+    >>> weight_to_target(1) == 2**255 - 1
+    True
+    >>> weight_to_target(1.0) == 2**255
+    True
+    """
+    return int(2**(256 - weight) - 1)
+
+
+def hash_to_int(hash_bytes: bytes) -> int:
+    """ Numeric value of a hash (in big-endian, the same order as `tx.hash`) to be compared against a target.
+
+    >>> hash_to_int(bytes.fromhex('00ff'))
+    255
+    """
+    return int.from_bytes(hash_bytes, 'big')
+
+
+def find_nonce(midstate: 'HASH', target: int, start: int, end: int, nonce_size: int) -> Optional[int]:
+    """ Return the first nonce in `[start, end)` that solves the proof-of-work, or None if there is none.
+
+    The hash of a nonce is `sha256(midstate + nonce)` hashed once more, which is reversed to big-endian when compared
+    to the target; reading the digest as little-endian does the same without copying it.
+
+    :param midstate: sha256 of the data that comes before the nonce, it is not changed
+    :param nonce_size: number of bytes of the nonce, which is encoded in big-endian
+    """
+    copy = midstate.copy
+    from_bytes = int.from_bytes
+    for nonce in range(start, end):
+        part = copy()
+        part.update(nonce.to_bytes(nonce_size, 'big'))
+        if from_bytes(sha256(part.digest()).digest(), 'little') < target:
+            return nonce
+    return None
@@ -21,6 +21,8 @@ METRIC_INFO = {
     'blocks_found': 'Number of blocks found by the miner in stratum',
     'estimated_hash_rate': 'Estimated hash rate for stratum miners',
     'send_token_timeouts': 'Number of times send_token API has timed-out',
+    'response_cache_hits': 'Number of API requests answered with a cached response',
+    'response_cache_misses': 'Number of API requests whose response was not cached',
 }
 
 
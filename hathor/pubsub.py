@@ -135,6 +135,11 @@ class PubSubManager:
         if fn in self._subscribers[key]:
             self._subscribers[key].remove(fn)
 
+    def has_subscribers(self, key: HathorEvents) -> bool:
+        """Return whether any function is subscribed to an event, so publishers can skip building its arguments.
+        """
+        return bool(self._subscribers.get(key))
+
     def publish(self, key: HathorEvents, **kwargs: Any) -> None:
         """Publish a new event.
 
@@ -0,0 +1,82 @@
+import hashlib
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from twisted.web.http import NOT_MODIFIED, Request
+
+from hathor.conf import HathorSettings
+
+if TYPE_CHECKING:
+    from hathor.metrics import Metrics  # noqa: F401
+
+settings = HathorSettings()
+
+CacheKey = Tuple[str, Tuple[Tuple[bytes, Tuple[bytes, ...]], ...]]
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: bytes
+    headers: List[Tuple[bytes, List[bytes]]]
+
+
+def _get_cache_key(name: str, args: Dict[bytes, List[bytes]]) -> CacheKey:
+    """ Return the key of a response, the query arguments are sorted so their order does not matter.
+    """
+    return name, tuple(sorted((key, tuple(values)) for key, values in args.items()))
+
+
+class ResponseCache:
+    """ Cache of the responses of the GET resources that only change when the DAG changes, like the ones polled by the
+    explorers. They are kept by resource and query arguments, and they are all dropped by `HathorManager.on_new_tx`
+    after the consensus runs, which is when txs are added, voided or become winners.
+
+    Each response has an ETag, the requests whose If-None-Match has it get a 304 without the body.
+    """
+
+    def __init__(self, metrics: Optional['Metrics'] = None, max_size: int = settings.RESPONSE_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.metrics = metrics
+        self._responses: 'OrderedDict[CacheKey, CachedResponse]' = OrderedDict()
+
+    def clear(self) -> None:
+        self._responses.clear()
+
+    def render(self, name: str, request: Request, render: Callable[[Request], bytes]) -> bytes:
+        """ Return the cached response of a resource to the request arguments, `render` is only called when there is
+        none. It must only be used for successful responses (status 200).
+
+        :param name: name of the resource, usually its path
+        """
+        key = _get_cache_key(name, request.args)
+        response = self._responses.get(key)
+        if response is None:
+            self._count(hit=False)
+            body = render(request)
+            etag = '"{}"'.format(hashlib.sha256(body).hexdigest()[:32]).encode('ascii')
+            response = CachedResponse(body, etag, list(request.responseHeaders.getAllRawHeaders()))
+            self._responses[key] = response
+            if len(self._responses) > self.max_size:
+                self._responses.popitem(last=False)
+        else:
+            self._count(hit=True)
+            self._responses.move_to_end(key)
+            for header, values in response.headers:
+                request.responseHeaders.setRawHeaders(header, values)
+
+        request.setHeader(b'etag', response.etag)
+        if_none_match = request.getHeader(b'if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(b',')]
+            if response.etag in tags or b'*' in tags:
+                request.setResponseCode(NOT_MODIFIED)
+                return b''
+        return response.body
+
+    def _count(self, *, hit: bool) -> None:
+        if self.metrics is None:
+            return
+        if hit:
+            self.metrics.response_cache_hits += 1
+        else:
+            self.metrics.response_cache_misses += 1
@@ -0,0 +1,287 @@
+"""
+Copyright 2019 Hathor Labs
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import json
+import struct
+from enum import IntEnum
+from typing import IO, Any, Dict, Iterator, Optional, Tuple
+
+from structlog import get_logger
+
+from hathor.conf import HathorSettings
+from hathor.transaction import BaseTransaction, TransactionMetadata
+from hathor.transaction.base_transaction import tx_or_block_from_bytes
+from hathor.transaction.exceptions import TxValidationError
+from hathor.transaction.storage import TransactionStorage
+
+logger = get_logger()
+settings = HathorSettings()
+
+# First bytes of a snapshot file, followed by the version byte.
+SNAPSHOT_MAGIC = b'HATHOR-SNAPSHOT'
+
+SNAPSHOT_VERSION = 1
+
+# Header of each record: its kind and the length of its payload.
+RECORD_HEADER = struct.Struct('!BI')
+
+# Length of the tx struct at the beginning of a TX record, it is followed by the metadata in JSON.
+_STRUCT_LENGTH = struct.Struct('!I')
+
+
+class RecordKind(IntEnum):
+    # JSON with the version and the network of the snapshot, it is always the first record.
+    HEADER = 0
+
+    # A tx (or block) and its metadata, they come in topological order.
+    TX = 1
+
+    # JSON with the number of txs so far and the digest of everything before the record.
+    CHECKPOINT = 2
+
+    # Same as a checkpoint, plus the number of blocks and txs, it is always the last record.
+    END = 3
+
+
+class InvalidSnapshot(Exception):
+    """ Raised when a snapshot file is invalid or it cannot be imported into the storage.
+    """
+
+
+class SnapshotWriter:
+    """ Write the records of a snapshot to a binary stream, keeping the digest of everything written.
+    """
+
+    def __init__(self, fp: IO[bytes]) -> None:
+        self.fp = fp
+        self.digest = hashlib.sha256()
+        self._write(SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]))
+
+    def _write(self, data: bytes) -> None:
+        self.fp.write(data)
+        self.digest.update(data)
+
+    def write_record(self, kind: RecordKind, payload: bytes) -> None:
+        self._write(RECORD_HEADER.pack(kind, len(payload)) + payload)
+
+    def write_json(self, kind: RecordKind, data: Dict[str, Any]) -> None:
+        self.write_record(kind, json.dumps(data).encode('utf-8'))
+
+    def write_tx(self, tx: BaseTransaction) -> None:
+        tx_struct = tx.get_struct()
+        metadata = json.dumps(tx.get_metadata().to_json()).encode('utf-8')
+        self.write_record(RecordKind.TX, _STRUCT_LENGTH.pack(len(tx_struct)) + tx_struct + metadata)
+
+
+class SnapshotReader:
+    """ Read the records of a snapshot from a binary stream, keeping the digest of everything read.
+    """
+
+    def __init__(self, fp: IO[bytes]) -> None:
+        self.fp = fp
+        self.digest = hashlib.sha256()
+        magic = self._read(len(SNAPSHOT_MAGIC) + 1)
+        if magic[:-1] != SNAPSHOT_MAGIC:
+            raise InvalidSnapshot('not a snapshot file')
+        if magic[-1] != SNAPSHOT_VERSION:
+            raise InvalidSnapshot('unsupported snapshot version: {}'.format(magic[-1]))
+
+    def _read(self, size: int, *, update_digest: bool = True) -> bytes:
+        data = self.fp.read(size)
+        if len(data) != size:
+            raise InvalidSnapshot('truncated snapshot file')
+        if update_digest:
+            self.digest.update(data)
+        return data
+
+    def read_record(self) -> Tuple[RecordKind, bytes, Optional[str]]:
+        """ Return the kind and the payload of the next record. Checkpoints also get the digest of everything before
+        them, it is None for the other records.
+        """
+        header = self._read(RECORD_HEADER.size, update_digest=False)
+        kind, length = RECORD_HEADER.unpack(header)
+        try:
+            record_kind = RecordKind(kind)
+        except ValueError:
+            raise InvalidSnapshot('invalid record kind: {}'.format(kind))
+        digest = None
+        if record_kind in (RecordKind.CHECKPOINT, RecordKind.END):
+            digest = self.digest.hexdigest()
+        self.digest.update(header)
+        return record_kind, self._read(length), digest
+
+    def read_json(self, kind: RecordKind) -> Dict[str, Any]:
+        """ Return the JSON payload of the next record, which must be of the given kind.
+        """
+        record_kind, payload, _ = self.read_record()
+        if record_kind != kind:
+            raise InvalidSnapshot('expected a {} record, got {}'.format(kind.name, record_kind.name))
+        return _parse_json(payload)
+
+
+def _parse_json(payload: bytes) -> Dict[str, Any]:
+    try:
+        data = json.loads(payload)
+    except ValueError as e:
+        raise InvalidSnapshot('invalid JSON record: {!r}'.format(e))
+    if not isinstance(data, dict):
+        raise InvalidSnapshot('invalid JSON record')
+    return data
+
+
+def _parse_tx(payload: bytes) -> BaseTransaction:
+    """ Return the tx of a TX record, with its metadata.
+    """
+    try:
+        length, = _STRUCT_LENGTH.unpack_from(payload)
+        tx_struct = payload[_STRUCT_LENGTH.size:_STRUCT_LENGTH.size + length]
+        tx = tx_or_block_from_bytes(tx_struct)
+        metadata = TransactionMetadata.create_from_json(json.loads(payload[_STRUCT_LENGTH.size + length:]))
+    except (struct.error, ValueError, KeyError) as e:
+        raise InvalidSnapshot('invalid tx record: {!r}'.format(e))
+    if metadata.hash != tx.hash:
+        raise InvalidSnapshot('metadata does not match tx {}'.format(tx.hash_hex))
+    tx._metadata = metadata
+    return tx
+
+
+def export_snapshot(tx_storage: TransactionStorage, fp: IO[bytes]) -> int:
+    """ Write all txs of the storage, in topological order and with their metadata, to a snapshot file.
+
+    The storage must not change while it is exported, the node must be stopped.
+
+    :return: the number of txs written
+    """
+    log = logger.new()
+    writer = SnapshotWriter(fp)
+    writer.write_json(RecordKind.HEADER, {
+        'version': SNAPSHOT_VERSION,
+        'network': settings.NETWORK_NAME,
+    })
+    count = 0
+    blocks = 0
+    for tx in tx_storage._topological_sort():
+        if count and count % settings.SNAPSHOT_CHECKPOINT_INTERVAL == 0:
+            writer.write_json(RecordKind.CHECKPOINT, {'count': count, 'digest': writer.digest.hexdigest()})
+            log.info('export snapshot...', count=count)
+        writer.write_tx(tx)
+        count += 1
+        if tx.is_block:
+            blocks += 1
+    writer.write_json(RecordKind.END, {
+        'count': count,
+        'blocks': blocks,
+        'txs': count - blocks,
+        'digest': writer.digest.hexdigest(),
+    })
+    log.info('snapshot exported', count=count, blocks=blocks)
+    return count
+
+
+def _iter_snapshot_txs(reader: SnapshotReader, end: Dict[str, Any]) -> Iterator[BaseTransaction]:
+    """ Yield the txs of a snapshot, checking the checkpoints, and fill `end` with the END record.
+    """
+    count = 0
+    while True:
+        kind, payload, digest = reader.read_record()
+        if kind == RecordKind.TX:
+            count += 1
+            yield _parse_tx(payload)
+            continue
+        if kind not in (RecordKind.CHECKPOINT, RecordKind.END):
+            raise InvalidSnapshot('unexpected {} record'.format(kind.name))
+        checkpoint = _parse_json(payload)
+        if checkpoint.get('count') != count or checkpoint.get('digest') != digest:
+            raise InvalidSnapshot('checkpoint does not match after {} txs'.format(count))
+        if kind == RecordKind.END:
+            end.update(checkpoint)
+            return
+
+
+def _with_storage(txs: Iterator[BaseTransaction], tx_storage: TransactionStorage) -> Iterator[BaseTransaction]:
+    for tx in txs:
+        tx.storage = tx_storage
+        yield tx
+
+
+def import_snapshot(tx_storage: TransactionStorage, fp: IO[bytes], *, verification_processes: int = 0) -> int:
+    """ Save all txs of a snapshot file to an empty storage.
+
+    The metadata in the file is trusted, just like the one of the storage when the node starts without a full
+    verification. When `verification_processes` is not zero, the checks that do not depend on the DAG (proof-of-work,
+    outputs and input scripts, see `VerificationPool`) are run again on that many processes.
+
+    The txs are saved as they are read, so the import is marked in the storage like a full verification while it runs.
+    When it stops in the middle, e.g. because the file is truncated, the node does not start from the storage without
+    a full verification.
+
+    :return: the number of txs read
+    :raises InvalidSnapshot: when the file is invalid or the storage is not empty
+    """
+    log = logger.new()
+    genesis_count = len(tx_storage.get_all_genesis())
+    if tx_storage.get_count_tx_blocks() != genesis_count:
+        raise InvalidSnapshot('the storage is not empty')
+
+    reader = SnapshotReader(fp)
+    header = reader.read_json(RecordKind.HEADER)
+    network = header.get('network')
+    if network != settings.NETWORK_NAME:
+        raise InvalidSnapshot('snapshot of network {}, expected {}'.format(network, settings.NETWORK_NAME))
+
+    tx_storage.start_full_verification()
+    end: Dict[str, Any] = {}
+    txs = _iter_snapshot_txs(reader, end)
+    tx_results: Iterator[Tuple[BaseTransaction, Optional[TxValidationError]]]
+    if verification_processes:
+        from hathor.verification_pool import VerificationPool
+        verification_pool = VerificationPool(verification_processes)
+        tx_results = verification_pool.run(_with_storage(txs, tx_storage))
+    else:
+        tx_results = ((tx, None) for tx in _with_storage(txs, tx_storage))
+
+    count = 0
+    blocks = 0
+    for tx, verification_error in tx_results:
+        assert tx.hash is not None
+        if verification_error is not None:
+            raise InvalidSnapshot('tx {} is invalid: {!r}'.format(tx.hash_hex, verification_error))
+        count += 1
+        if tx.is_block:
+            blocks += 1
+        if count % settings.SNAPSHOT_CHECKPOINT_INTERVAL == 0:
+            log.info('import snapshot...', count=count)
+        if tx.is_genesis:
+            # The genesis are already in the storage, only their metadata changes.
+            genesis = tx_storage.get_genesis(tx.hash)
+            if genesis is None or genesis.get_struct() != tx.get_struct():
+                raise InvalidSnapshot('invalid genesis {}'.format(tx.hash_hex))
+            genesis._metadata = tx.get_metadata()
+            tx_storage.save_transaction(genesis, only_metadata=True)
+            continue
+        tx_storage.save_transaction(tx)
+
+    if end.get('blocks') != blocks or end.get('txs') != count - blocks:
+        raise InvalidSnapshot('the number of blocks and txs does not match the END record')
+    stored = tx_storage.get_count_tx_blocks()
+    if stored != end['count']:
+        raise InvalidSnapshot('{} txs in the storage, {} expected'.format(stored, end['count']))
+    # The snapshot was exported from a clean storage, see `HathorManager._initialize_components`.
+    tx_storage.set_db_clean()
+    tx_storage.finish_full_verification()
+    log.info('snapshot imported', count=count, blocks=end['blocks'])
+    return count
@@ -22,6 +22,7 @@ from twisted.python.failure import Failure
 from hathor.conf import HathorSettings
 from hathor.crypto.util import decode_address
 from hathor.exception import InvalidNewTransaction
+from hathor.pow import NONCE_BATCH_SIZE, find_nonce, weight_to_target
 from hathor.pubsub import EventArguments, HathorEvents
 from hathor.transaction import BaseTransaction, BitcoinAuxPow, Block, MergeMinedBlock, Transaction, sum_weights
 from hathor.transaction.exceptions import PowError, ScriptError, TxValidationError
@@ -904,7 +905,7 @@ def miner_job(index: int, process_num: int, job_data: MinerJob, signal: Value, q
             sleep(StratumClient.NAP_DURATION)
         return (
             job_data.job_id[:],  # current_job
-            int(2**(256 - job_data.weight.value)) - 1,  # target
+            weight_to_target(job_data.weight.value),  # target
             sha256(bytes(job_data.data[:job_data.data_size.value])),  # midstate
             int(index * (1 << (8 * job_data.nonce_size.value)) / process_num),  # start_nonce
             job_data.nonce_size.value  # nonce_size
@@ -912,12 +913,15 @@ def miner_job(index: int, process_num: int, job_data: MinerJob, signal: Value, q
 
     while signal.value != StratumClient.STOP:
         current_job, target, base, nonce, nonce_size = update_job()
+        # the signal and the job are shared between processes, so they are only checked between batches of nonces
         while signal.value == StratumClient.WORK and current_job == job_data.job_id[:]:
-            hash = base.copy()
-            hash.update(nonce.to_bytes(nonce_size, 'big'))
-            if int(sha256(hash.digest()).digest()[::-1].hex(), 16) < target:
-                queue.put(MinerSubmit(job_id=bytes(current_job).hex(), nonce=hex(nonce)))
-            nonce += 1
+            batch_end = nonce + NONCE_BATCH_SIZE
+            found = find_nonce(base, target, nonce, batch_end, nonce_size)
+            if found is not None:
+                queue.put(MinerSubmit(job_id=bytes(current_job).hex(), nonce=hex(found)))
+                nonce = found + 1
+            else:
+                nonce = batch_end
 
 
 def supervisor_job(client: StratumClient) -> None:
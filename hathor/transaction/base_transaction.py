@@ -29,6 +29,7 @@ from structlog import get_logger
 
 from hathor import protos
 from hathor.conf import HathorSettings
+from hathor.pow import NONCE_BATCH_SIZE, find_nonce, hash_to_int, weight_to_target
 from hathor.transaction.exceptions import (
     DuplicatedParents,
     IncorrectParents,
@@ -181,6 +182,10 @@ class BaseTransaction(ABC):
         self.storage = storage
         self.hash = hash  # Stored as bytes.
 
+        # JSON of the fields that never change once the tx is hashed, see `_get_cached_json`.
+        self._json_cache: Dict[Any, Dict[str, Any]] = {}
+        self._json_cache_hash: Optional[bytes] = None
+
     @classproperty
     def log(cls):
         """ This is a workaround because of a bug on structlog (or abc).
@@ -313,7 +318,7 @@ class BaseTransaction(ABC):
         """Target to be achieved in the mining process"""
         if not isfinite(self.weight):
             raise WeightError
-        return int(2**(256 - (override_weight or self.weight)) - 1)
+        return weight_to_target(override_weight or self.weight)
 
     def get_time_from_now(self, now: Optional[Any] = None) -> str:
         """ Return a the time difference between now and the tx's timestamp
@@ -419,22 +424,38 @@ class BaseTransaction(ABC):
         return struct_bytes
 
     @abstractmethod
-    def verify(self) -> None:
+    def verify(self, *, pre_verified: bool = False) -> None:
+        """ Run all verifications of this tx.
+
+        :param pre_verified: skip the checks that do not depend on the storage (pow, outputs and input scripts)
+                             because they have already been run, usually by `hathor.verification_pool`
+        """
         raise NotImplementedError
 
-    def verify_parents(self) -> None:
+    def get_dependencies(self) -> Dict[bytes, 'BaseTransaction']:
+        """Fetch the parents and the txs spent by the inputs with a single storage lookup.
+
+        The result can be passed to `verify_parents` and `verify_inputs` so they do not query the storage one tx at a
+        time. Missing txs are not in the returned dict.
+        """
+        assert self.storage is not None
+        hashes = list(self.parents)
+        hashes.extend(txin.tx_id for txin in self.inputs)
+        return self.storage.get_transactions(hashes)
+
+    def verify_parents(self, *, dependencies: Optional[Dict[bytes, 'BaseTransaction']] = None) -> None:
         """All parents must exist and their timestamps must be smaller than ours.
 
         Also, txs should have 2 other txs as parents, while blocks should have 2 txs + 1 block.
 
         Parents must be ordered with blocks first, followed by transactions.
 
+        :param dependencies: txs already fetched by `get_dependencies`, the parents are fetched when it is None
+
         :raises TimestampError: when our timestamp is less or equal than our parent's timestamp
         :raises ParentDoesNotExist: when at least one of our parents does not exist
         :raises IncorrectParents: when tx does not confirm the correct number/type of parent txs
         """
-        from hathor.transaction.storage.exceptions import TransactionDoesNotExist
-
         assert self.storage is not None
 
         # check if parents are duplicated
@@ -442,49 +463,53 @@ class BaseTransaction(ABC):
         if len(self.parents) > len(parents_set):
             raise DuplicatedParents('Tx has duplicated parents: {}', [tx_hash.hex() for tx_hash in self.parents])
 
+        if dependencies is None:
+            dependencies = self.storage.get_transactions(self.parents)
+
         my_parents_txs = 0      # number of tx parents
         my_parents_blocks = 0   # number of block parents
         min_timestamp = None
 
         for parent_hash in self.parents:
-            try:
-                parent = self.storage.get_transaction(parent_hash)
-                assert parent.hash is not None
-                if self.timestamp <= parent.timestamp:
-                    raise TimestampError('tx={} timestamp={}, parent={} timestamp={}'.format(
+            parent = dependencies.get(parent_hash)
+            if parent is None:
+                raise ParentDoesNotExist('tx={} parent={}'.format(self.hash_hex, parent_hash.hex()))
+            assert parent.hash is not None
+            if self.timestamp <= parent.timestamp:
+                raise TimestampError('tx={} timestamp={}, parent={} timestamp={}'.format(
+                    self.hash_hex,
+                    self.timestamp,
+                    parent.hash_hex,
+                    parent.timestamp,
+                ))
+
+            if parent.is_block:
+                if self.is_block and not parent.is_genesis:
+                    if self.timestamp - parent.timestamp > settings.MAX_DISTANCE_BETWEEN_BLOCKS:
+                        raise TimestampError('Distance between blocks is too big'
+                                             ' ({} seconds)'.format(self.timestamp - parent.timestamp))
+                if my_parents_txs > 0:
+                    raise IncorrectParents('Parents which are blocks must come before transactions')
+                for pi_hash in parent.parents:
+                    # XXX: this has always looked up `parent_hash` instead of `pi_hash`, so the grandparents are
+                    #      never loaded; it is kept this way because changing it changes which txs are valid
+                    pi = parent
+                    if not pi.is_block:
+                        min_timestamp = (
+                            min(min_timestamp, pi.timestamp) if min_timestamp is not None
+                            else pi.timestamp
+                        )
+                my_parents_blocks += 1
+            else:
+                if min_timestamp and parent.timestamp < min_timestamp:
+                    raise TimestampError('tx={} timestamp={}, parent={} timestamp={}, min_timestamp={}'.format(
                         self.hash_hex,
                         self.timestamp,
                         parent.hash_hex,
                         parent.timestamp,
+                        min_timestamp
                     ))
-
-                if parent.is_block:
-                    if self.is_block and not parent.is_genesis:
-                        if self.timestamp - parent.timestamp > settings.MAX_DISTANCE_BETWEEN_BLOCKS:
-                            raise TimestampError('Distance between blocks is too big'
-                                                 ' ({} seconds)'.format(self.timestamp - parent.timestamp))
-                    if my_parents_txs > 0:
-                        raise IncorrectParents('Parents which are blocks must come before transactions')
-                    for pi_hash in parent.parents:
-                        pi = self.storage.get_transaction(parent_hash)
-                        if not pi.is_block:
-                            min_timestamp = (
-                                min(min_timestamp, pi.timestamp) if min_timestamp is not None
-                                else pi.timestamp
-                            )
-                    my_parents_blocks += 1
-                else:
-                    if min_timestamp and parent.timestamp < min_timestamp:
-                        raise TimestampError('tx={} timestamp={}, parent={} timestamp={}, min_timestamp={}'.format(
-                            self.hash_hex,
-                            self.timestamp,
-                            parent.hash_hex,
-                            parent.timestamp,
-                            min_timestamp
-                        ))
-                    my_parents_txs += 1
-            except TransactionDoesNotExist:
-                raise ParentDoesNotExist('tx={} parent={}'.format(self.hash_hex, parent_hash.hex()))
+                my_parents_txs += 1
 
         # check for correct number of parents
         if self.is_block:
@@ -506,7 +531,7 @@ class BaseTransaction(ABC):
         :raises PowError: when the hash is equal or greater than the target
         """
         assert self.hash is not None
-        numeric_hash = int(self.hash_hex, self.HEX_BASE)
+        numeric_hash = hash_to_int(self.hash)
         minimum_target = self.get_target(override_weight)
         if numeric_hash >= minimum_target:
             raise PowError(f'Transaction has invalid data ({numeric_hash} < {minimum_target})')
@@ -633,6 +658,9 @@ class BaseTransaction(ABC):
         """
         pow_part1 = self.calculate_hash1()
         target = self.get_target()
+        # nonces are searched in batches and the timestamp is only checked between them, when sleeping after each
+        # attempt there is no point in batching
+        batch_size = 1 if sleep_seconds > 0 else NONCE_BATCH_SIZE
         self.nonce = start
         last_time = time.time()
         while self.nonce < end:
@@ -646,10 +674,12 @@ class BaseTransaction(ABC):
                     last_time = now
                     self.nonce = start
 
-            result = self.calculate_hash2(pow_part1.copy())
-            if int(result.hex(), self.HEX_BASE) < target:
-                return result
-            self.nonce += 1
+            batch_end = min(self.nonce + batch_size, end)
+            nonce = find_nonce(pow_part1, target, self.nonce, batch_end, self.HASH_NONCE_SIZE)
+            if nonce is not None:
+                self.nonce = nonce
+                return self.calculate_hash2(pow_part1.copy())
+            self.nonce = batch_end
             if sleep_seconds > 0:
                 time.sleep(sleep_seconds)
                 if should_stop():
@@ -779,9 +809,32 @@ class BaseTransaction(ABC):
         assert self.storage is not None
         return self.storage.get_transaction(input_tx.tx_id)
 
+    def _get_cached_json(self, key: Any, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """ Return a copy of the JSON built by `build`, which must only use fields that do not change once the tx is
+        hashed (no metadata). It is built again when the hash changes, and it is not kept while there is no hash.
+
+        The callers get their own copy because they usually add or change fields.
+        """
+        if self.hash is None:
+            return build()
+        if self._json_cache_hash != self.hash:
+            self._json_cache = {}
+            self._json_cache_hash = self.hash
+        data = self._json_cache.get(key)
+        if data is None:
+            data = build()
+            self._json_cache[key] = data
+        return _copy_json(data)
+
     def to_json(self, decode_script: bool = False, include_metadata: bool = False) -> Dict[str, Any]:
         """ Creates a json serializable Dict object from self
         """
+        data = self._get_cached_json(('to_json', decode_script), lambda: self._build_json(decode_script))
+        if include_metadata:
+            data['metadata'] = self.get_metadata().to_json()
+        return data
+
+    def _build_json(self, decode_script: bool) -> Dict[str, Any]:
         data: Dict[str, Any] = {}
         data['hash'] = self.hash_hex or None
         data['nonce'] = self.nonce
@@ -805,12 +858,23 @@ class BaseTransaction(ABC):
         for output in self.outputs:
             data['outputs'].append(output.to_json(decode_script=decode_script))
 
-        if include_metadata:
-            data['metadata'] = self.get_metadata().to_json()
-
         return data
 
     def to_json_extended(self) -> Dict[str, Any]:
+        """ Same as `_build_json_extended` plus the fields that come from the metadata: whether the tx is voided and
+        the tx spending each output.
+        """
+        ret = self._get_cached_json('to_json_extended', self._build_json_extended)
+        meta = self.get_metadata()
+        ret['is_voided'] = bool(meta.voided_by)
+        for index, output in enumerate(ret['outputs']):
+            spent_by = meta.get_output_spent_by(index)
+            output['spent_by'] = spent_by.hex() if spent_by else None
+        return ret
+
+    def _build_json_extended(self) -> Dict[str, Any]:
+        """ JSON used by the explorers and the wallets, the inputs have the outputs they spend.
+        """
         assert self.hash is not None
         assert self.storage is not None
 
@@ -821,13 +885,12 @@ class BaseTransaction(ABC):
             data['decoded'].pop('value', None)
             return data
 
-        meta = self.get_metadata()
         ret: Dict[str, Any] = {
             'tx_id': self.hash_hex,
             'version': int(self.version),
             'weight': self.weight,
             'timestamp': self.timestamp,
-            'is_voided': bool(meta.voided_by),
+            'is_voided': False,
             'inputs': [],
             'outputs': [],
             'parents': [],
@@ -849,10 +912,7 @@ class BaseTransaction(ABC):
             ret['inputs'].append(output)
 
         for index, tx_out in enumerate(self.outputs):
-            spent_by = meta.get_output_spent_by(index)
-            output = serialize_output(self, tx_out)
-            output['spent_by'] = spent_by.hex() if spent_by else None
-            ret['outputs'].append(output)
+            ret['outputs'].append(serialize_output(self, tx_out))
 
         return ret
 
@@ -901,6 +961,16 @@ class BaseTransaction(ABC):
         raise NotImplementedError
 
 
+def _copy_json(data: Any) -> Any:
+    """ Copy of a JSON object, faster than `copy.deepcopy` because it only has dicts, lists and immutable values.
+    """
+    if isinstance(data, dict):
+        return {key: _copy_json(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_copy_json(value) for value in data]
+    return data
+
+
 class TxInput:
     _tx: BaseTransaction  # XXX: used for caching on hathor.transaction.Transaction.get_spent_tx
 
@@ -255,7 +255,7 @@ class Block(BaseTransaction):
         from hathor.merged_mining.bitcoin import sha256d_hash
         return sha256d_hash(self.get_header_without_nonce())
 
-    def verify(self) -> None:
+    def verify(self, *, pre_verified: bool = False) -> None:
         """
             (1) confirms at least two pending transactions and references last block
             (2) solves the pow with the correct weight (done in HathorManager)
@@ -268,7 +268,8 @@ class Block(BaseTransaction):
             # TODO do genesis validation
             return
 
-        self.verify_without_storage()
+        if not pre_verified:
+            self.verify_without_storage()
 
         # (1) and (4)
         self.verify_parents()
@@ -1,13 +1,14 @@
 from hathor.transaction.resources.create_tx import CreateTxResource
 from hathor.transaction.resources.dashboard import DashboardTransactionResource
 from hathor.transaction.resources.decode_tx import DecodeTxResource
-from hathor.transaction.resources.graphviz import GraphvizFullResource, GraphvizNeighboursResource
+from hathor.transaction.resources.graphviz import GraphvizFullResource, GraphvizNeighboursResource, GraphvizRenderer
 from hathor.transaction.resources.mining import GetBlockTemplateResource, SubmitBlockResource
 from hathor.transaction.resources.push_tx import PushTxResource
 from hathor.transaction.resources.tips import TipsResource
 from hathor.transaction.resources.tips_histogram import TipsHistogramResource
 from hathor.transaction.resources.transaction import TransactionResource
 from hathor.transaction.resources.transaction_confirmation import TransactionAccWeightResource
+from hathor.transaction.resources.transactions import TransactionsResource
 from hathor.transaction.resources.tx_parents import TxParentsResource
 from hathor.transaction.resources.validate_address import ValidateAddressResource
 
@@ -18,9 +19,11 @@ __all__ = [
     'GetBlockTemplateResource',
     'GraphvizFullResource',
     'GraphvizNeighboursResource',
+    'GraphvizRenderer',
     'SubmitBlockResource',
     'TransactionAccWeightResource',
     'TransactionResource',
+    'TransactionsResource',
     'DashboardTransactionResource',
     'TipsHistogramResource',
     'TipsResource',
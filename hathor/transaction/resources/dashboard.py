@@ -25,6 +25,11 @@ class DashboardTransactionResource(resource.Resource):
         self.manager = manager
 
     def render_GET(self, request):
+        """ Cached responses of `_render_GET`, they are dropped when the DAG changes (see `ResponseCache`)
+        """
+        return self.manager.response_cache.render('dashboard_tx', request, self._render_GET)
+
+    def _render_GET(self, request):
         """ Get request to /dashboard-tx/ that return a list of blocks and tx
             We expect two GET parameters: 'block' and 'tx'
 
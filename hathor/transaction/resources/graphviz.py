@@ -1,8 +1,11 @@
 import json
+from collections import OrderedDict
 from enum import Enum
-from typing import TYPE_CHECKING, Union
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, List, Optional, Union
 
 from twisted.internet import threads
+from twisted.internet.defer import Deferred, DeferredSemaphore, fail, succeed
+from twisted.python.failure import Failure
 from twisted.web import resource
 from twisted.web.http import Request
 
@@ -39,31 +42,115 @@ class FileFormat(Enum):
         return self.value
 
 
+class RendererBusy(Exception):
+    """ Raised when there are too many graphs waiting to be generated.
+    """
+
+
+class GraphvizRenderer:
+    """ Generate the graphs in at most `max_workers` threads and keep the last `cache_size` ones.
+
+    The keys must include everything the graph depends on, including the state of the DAG. Requests of a graph that
+    is being generated wait for it instead of generating it again. Above `max_pending` different graphs waiting, the
+    new ones fail with `RendererBusy`.
+    """
+
+    def __init__(self, *, max_workers: int = settings.GRAPHVIZ_MAX_WORKERS,
+                 max_pending: int = settings.GRAPHVIZ_MAX_PENDING,
+                 cache_size: int = settings.GRAPHVIZ_CACHE_SIZE) -> None:
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self._semaphore = DeferredSemaphore(max_workers)
+        self._cache: 'OrderedDict[Hashable, bytes]' = OrderedDict()
+        self._pending: Dict[Hashable, List[Deferred]] = {}
+
+    def render(self, key: Hashable, render: Callable[[], bytes]) -> Deferred:
+        """ Return a deferred with the graph of the key, `render` is called in a thread when it is not cached.
+        """
+        data = self._cache.get(key)
+        if data is not None:
+            self._cache.move_to_end(key)
+            return succeed(data)
+
+        deferred: Deferred = Deferred()
+        waiting = self._pending.get(key)
+        if waiting is not None:
+            waiting.append(deferred)
+            return deferred
+        if len(self._pending) >= self.max_pending:
+            return fail(RendererBusy())
+
+        self._pending[key] = [deferred]
+        job = self._semaphore.run(threads.deferToThread, render)
+        job.addBoth(self._finish, key)
+        return deferred
+
+    def _finish(self, result: Union[bytes, Failure], key: Hashable) -> None:
+        waiting = self._pending.pop(key)
+        if isinstance(result, Failure):
+            for deferred in waiting:
+                deferred.errback(result)
+            return
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        for deferred in waiting:
+            deferred.callback(result)
+
+
 class _BaseGraphvizResource(resource.Resource):
     isLeaf = True
 
-    def __init__(self, manager: 'HathorManager', *, format: Union[FileFormat, str]):
+    def __init__(self, manager: 'HathorManager', *, format: Union[FileFormat, str],
+                 renderer: Optional[GraphvizRenderer] = None):
         # Important to have the manager so we can know the tx_storage
         self.manager = manager
         self.format: FileFormat = FileFormat(format)
+        # It should be shared by all graphviz resources, so the workers limit applies to all of them
+        self.renderer = renderer or GraphvizRenderer()
 
     def render_GET(self, request):
-        deferred = threads.deferToThread(self._render_GET_thread, request)
+        set_cors(request, 'GET')
+        deferred = self._render_GET_deferred(request)
+        if isinstance(deferred, bytes):
+            # The request is invalid, the response is an error.
+            return deferred
         deferred.addCallback(self._cb_tx_resolve, request)
         deferred.addErrback(self._err_tx_resolve, request)
 
         from twisted.web.server import NOT_DONE_YET
         return NOT_DONE_YET
 
+    def _render_GET_deferred(self, request: Request) -> Union[bytes, Deferred]:
+        raise NotImplementedError
+
+    def _get_dag_version(self) -> Hashable:
+        """ Return a value that changes whenever the DAG changes, it is part of the keys of the graphs.
+        """
+        return self.manager.tx_storage.get_tips_commitment()
+
+    def _render_dot(self, dot) -> bytes:
+        """ Called in a thread to generate the file of a graph.
+        """
+        if self.format is FileFormat.DOT:
+            return str(dot).encode('utf-8')
+        return dot.pipe()
+
     def _cb_tx_resolve(self, result, request):
-        """ Called when `_render_GET_thread` finishes
+        """ Called when the graph is generated
         """
+        request.setHeader(b'content-type', self.format.content_type)
         request.write(result)
         request.finish()
 
     def _err_tx_resolve(self, reason, request):
-        """ Called when an error occur in `_render_GET_thread`
+        """ Called when an error occur when generating the graph
         """
+        if isinstance(reason, Failure) and reason.check(RendererBusy):
+            request.setResponseCode(503)
+            request.write(json.dumps({'success': False, 'message': 'Too many graphs being generated'}).encode('utf-8'))
+            request.finish()
+            return
         request.processingFailed(reason)
 
 
@@ -74,12 +161,10 @@ class GraphvizFullResource(_BaseGraphvizResource):
     You must run with option `--status <PORT>`.
     """
 
-    def _render_GET_thread(self, request: Request) -> bytes:
+    def _render_GET_deferred(self, request: Request) -> Union[bytes, Deferred]:
         """ GET request /graphviz/full.{format}
             Returns the rendered graph file
         """
-        set_cors(request, 'GET')
-
         tx_storage = self.manager.tx_storage
 
         graphviz = GraphvizVisualizer(tx_storage)
@@ -93,12 +178,20 @@ class GraphvizFullResource(_BaseGraphvizResource):
             graphviz.include_funds = self.parse_bool_arg(request.args[b'funds'][0].decode('utf-8'))
         if b'only_blocks' in request.args:
             graphviz.only_blocks = self.parse_bool_arg(request.args[b'only_blocks'][0].decode('utf-8'))
-        dot = graphviz.dot(format=self.format.dot)
 
-        request.setHeader(b'content-type', self.format.content_type)
-        if self.format is FileFormat.DOT:
-            return str(dot).encode('utf-8')
-        return dot.pipe()
+        # The counters of the indexes, counting the txs in the storage may scan all of them
+        count = tx_storage.get_block_count()
+        if not graphviz.only_blocks:
+            count += tx_storage.get_tx_count()
+        if count > settings.GRAPHVIZ_FULL_MAX_NODES:
+            return json.dumps({
+                'success': False,
+                'message': 'The graph is too large, it has more than {} nodes'.format(settings.GRAPHVIZ_FULL_MAX_NODES)
+            }).encode('utf-8')
+
+        key = ('full', self.format, graphviz.show_weight, graphviz.show_acc_weight, graphviz.include_verifications,
+               graphviz.include_funds, graphviz.only_blocks, self._get_dag_version())
+        return self.renderer.render(key, lambda: self._render_dot(graphviz.dot(format=self.format.dot)))
 
     def parse_bool_arg(self, arg: str) -> bool:
         """Returns a boolean object for the given parameter
@@ -209,12 +302,10 @@ class GraphvizNeighboursResource(_BaseGraphvizResource):
     You must run with option `--status <PORT>`.
     """
 
-    def _render_GET_thread(self, request: Request) -> bytes:
+    def _render_GET_deferred(self, request: Request) -> Union[bytes, Deferred]:
         """ GET request /graphviz/neighbours.{format}
             Returns the rendered graph file
         """
-        set_cors(request, 'GET')
-
         tx_storage = self.manager.tx_storage
 
         tx_hex = request.args[b'tx'][0].decode('utf-8')
@@ -226,13 +317,14 @@ class GraphvizNeighboursResource(_BaseGraphvizResource):
         max_level = min(int(request.args[b'max_level'][0]), settings.MAX_GRAPH_LEVEL)
         tx = tx_storage.get_transaction(bytes.fromhex(tx_hex))
 
-        graphviz = GraphvizVisualizer(tx_storage)
-        dot = graphviz.tx_neighborhood(tx, format=self.format.dot, max_level=max_level, graph_type=graph_type)
+        def render() -> bytes:
+            graphviz = GraphvizVisualizer(tx_storage)
+            dot = graphviz.tx_neighborhood(tx, format=self.format.dot, max_level=max_level, graph_type=graph_type,
+                                           max_nodes=settings.GRAPHVIZ_NEIGHBORHOOD_MAX_NODES)
+            return self._render_dot(dot)
 
-        request.setHeader(b'content-type', self.format.content_type)
-        if self.format is FileFormat.DOT:
-            return str(dot).encode('utf-8')
-        return dot.pipe()
+        key = ('neighbours', self.format, tx.hash, graph_type, max_level, self._get_dag_version())
+        return self.renderer.render(key, render)
 
 
 GraphvizNeighboursResource.openapi = {
@@ -19,6 +19,11 @@ class TipsResource(resource.Resource):
         self.manager = manager
 
     def render_GET(self, request):
+        """ Cached responses of `_render_GET`, they are dropped when the DAG changes (see `ResponseCache`)
+        """
+        return self.manager.response_cache.render('tips', request, self._render_GET)
+
+    def _render_GET(self, request):
         """ Get request to /tips/ that return a list of tips hashes
 
             'timestamp' is an optional parameter to be used in the get_tx_tips method
@@ -26,6 +26,8 @@ class TipsHistogramResource(resource.Resource):
 
             'begin': int that indicates the beginning of the interval
             'end': int that indicates the end of the interval
+            'bucket' (optional): int with the seconds of each bucket, each one has the maximum number of tips at its
+                timestamps (default 1)
 
             :rtype: string (json)
         """
@@ -58,10 +60,21 @@ class TipsHistogramResource(resource.Resource):
                 'message': 'Invalid parameter, cannot convert to int: end'
             }).encode('utf-8')
 
-        v = []
-        for timestamp in range(begin, end + 1):
-            tx_tips = self.manager.tx_storage.get_tx_tips(timestamp)
-            v.append((timestamp, len(tx_tips)))
+        try:
+            bucket = int(request.args[b'bucket'][0]) if b'bucket' in request.args else 1
+        except ValueError:
+            return json.dumps({
+                'success': False,
+                'message': 'Invalid parameter, cannot convert to int: bucket'
+            }).encode('utf-8')
+
+        if bucket < 1:
+            return json.dumps({
+                'success': False,
+                'message': 'Invalid parameter, must be positive: bucket'
+            }).encode('utf-8')
+
+        v = self.manager.tx_storage.get_tx_tips_histogram(begin, end, bucket)
 
         return json.dumps({'success': True, 'tips': v}).encode('utf-8')
 
@@ -93,6 +106,16 @@ TipsHistogramResource.openapi = {
                     'schema': {
                         'type': 'int'
                     }
+                },
+                {
+                    'name': 'bucket',
+                    'in': 'query',
+                    'description': ('Seconds of each element of the list, which has the maximum number of tips '
+                                    'in them. Default is 1'),
+                    'required': False,
+                    'schema': {
+                        'type': 'int'
+                    }
                 }
             ],
             'responses': {
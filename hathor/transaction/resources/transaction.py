@@ -1,5 +1,5 @@
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from twisted.web import resource
 
@@ -24,10 +24,24 @@ def update_serialized_tokens_array(tx: BaseTransaction, serialized: Dict[str, An
         serialized['tokens'] = [h.hex() for h in tx.tokens]
 
 
-def get_tx_extra_data(tx: BaseTransaction) -> Dict[str, Any]:
+def get_tx_extra_data(tx: BaseTransaction, txs: Optional[Dict[bytes, BaseTransaction]] = None) -> Dict[str, Any]:
     """ Get the data of a tx to be returned to the frontend
         Returns success, tx serializes, metadata and spent outputs
+
+        :param txs: txs already loaded from the storage, the ones loaded here are added to it, so it can be shared by
+            the calls for many txs
     """
+    if txs is None:
+        txs = {}
+
+    def get_transaction(hash_bytes: bytes) -> BaseTransaction:
+        assert tx.storage is not None
+        other = txs.get(hash_bytes)
+        if other is None:
+            other = tx.storage.get_transaction(hash_bytes)
+            txs[hash_bytes] = other
+        return other
+
     serialized = tx.to_json(decode_script=True)
     serialized['raw'] = tx.get_struct().hex()
     serialized['nonce'] = str(tx.nonce)
@@ -48,7 +62,7 @@ def get_tx_extra_data(tx: BaseTransaction) -> Dict[str, Any]:
     for index, spent_set in meta.spent_outputs.items():
         for spent in spent_set:
             if tx.storage:
-                spent_tx = tx.storage.get_transaction(spent)
+                spent_tx = get_transaction(spent)
                 spent_meta = spent_tx.get_metadata()
                 if not spent_meta.voided_by:
                     spent_outputs[index] = spent_tx.hash_hex
@@ -58,7 +72,7 @@ def get_tx_extra_data(tx: BaseTransaction) -> Dict[str, Any]:
     inputs = []
     for index, tx_in in enumerate(tx.inputs):
         if tx.storage:
-            tx2 = tx.storage.get_transaction(tx_in.tx_id)
+            tx2 = get_transaction(tx_in.tx_id)
             tx2_out = tx2.outputs[tx_in.index]
             output = tx2_out.to_json(decode_script=True)
             assert tx2.hash is not None
@@ -114,6 +128,14 @@ class TransactionResource(resource.Resource):
         self.manager = manager
 
     def render_GET(self, request):
+        """ Cached responses of `_render_GET`, they are dropped when the DAG changes (see `ResponseCache`)
+        """
+        if b'id' in request.args and not self.manager.tx_storage.tokens_index:
+            # The response is an error, which is not cached
+            return self._render_GET(request)
+        return self.manager.response_cache.render('transaction', request, self._render_GET)
+
+    def _render_GET(self, request):
         """ Get request /transaction/ that returns list of tx or a single one
 
             If receive 'id' (hash) as GET parameter we return the tx with this hash
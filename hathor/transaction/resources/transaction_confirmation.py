@@ -1,11 +1,11 @@
 import json
-from math import log
 from typing import Any, Dict
 
 from twisted.web import resource
 
 from hathor.api_util import get_missing_params_msg, set_cors, validate_tx_hash
 from hathor.cli.openapi_files.register import register_resource
+from hathor.confirmation_tracker import get_confirmation_stop_value
 
 
 @register_resource
@@ -31,20 +31,23 @@ class TransactionAccWeightResource(resource.Resource):
         if tx.is_block:
             return {'success': False, 'message': 'not allowed on blocks'}
 
-        meta = tx.get_metadata()
         data: Dict[str, Any] = {'success': True}
 
-        if meta.first_block:
-            block = self.manager.tx_storage.get_transaction(meta.first_block)
-            stop_value = block.weight + log(6, 2)
-            meta = tx.update_accumulated_weight(stop_value=stop_value)
-            data['accumulated_weight'] = meta.accumulated_weight
-            data['accumulated_bigger'] = meta.accumulated_weight > stop_value
+        # The recent txs are kept up to date by the tracker, the others are calculated (and saved) when requested.
+        accumulated_weight = self.manager.confirmation_tracker.get_accumulated_weight(hash_bytes)
+        stop_value = get_confirmation_stop_value(tx)
+
+        if stop_value is not None:
+            if accumulated_weight is None:
+                accumulated_weight = tx.update_accumulated_weight(stop_value=stop_value).accumulated_weight
+            data['accumulated_weight'] = accumulated_weight
+            data['accumulated_bigger'] = accumulated_weight > stop_value
             data['stop_value'] = stop_value
-            data['confirmation_level'] = min(meta.accumulated_weight / stop_value, 1)
+            data['confirmation_level'] = min(accumulated_weight / stop_value, 1)
         else:
-            meta = tx.update_accumulated_weight()
-            data['accumulated_weight'] = meta.accumulated_weight
+            if accumulated_weight is None:
+                accumulated_weight = tx.update_accumulated_weight().accumulated_weight
+            data['accumulated_weight'] = accumulated_weight
             data['accumulated_bigger'] = False
             data['confirmation_level'] = 0
         return data
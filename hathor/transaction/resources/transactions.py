@@ -0,0 +1,245 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Set
+
+from structlog import get_logger
+from twisted.internet.task import TaskStopped, cooperate
+from twisted.python.failure import Failure
+from twisted.web import resource
+from twisted.web.http import Request
+
+from hathor.api_util import set_cors
+from hathor.cli.openapi_files.register import register_resource
+from hathor.conf import HathorSettings
+from hathor.transaction import BaseTransaction
+from hathor.transaction.resources.transaction import get_tx_extra_data
+from hathor.util import json_dumpb, json_loadb
+
+if TYPE_CHECKING:
+    from hathor.manager import HathorManager  # noqa: F401
+
+settings = HathorSettings()
+logger = get_logger()
+
+# Fields of each tx that may be requested, they are the same of `GET /transaction?id=`.
+FIELDS = ['tx', 'meta', 'spent_outputs']
+
+
+def _error(message: str) -> bytes:
+    return json_dumpb({'success': False, 'message': message})
+
+
+def _parse_hash(tx_id: str) -> Optional[bytes]:
+    if len(tx_id) != 64:
+        return None
+    try:
+        return bytes.fromhex(tx_id)
+    except ValueError:
+        return None
+
+
+@register_resource
+class TransactionsResource(resource.Resource):
+    """ Implements a web server API to return many txs at once, each one just like `GET /transaction?id=`.
+
+    You must run with option `--status <PORT>`.
+    """
+    isLeaf = True
+
+    def __init__(self, manager: 'HathorManager'):
+        self.manager = manager
+        self.log = logger.new()
+
+    def render_POST(self, request: Request) -> Any:
+        """ Post request /transactions/ that returns the txs in the same order of the ids
+
+            Expects {"ids": [<hex encoded>], "fields": <optional, subset of FIELDS>} as POST data
+
+            The response is written as the txs are serialized, so it does not have to be kept in memory. That is why
+            `success` comes after the txs: it is false, with a message, when the response fails in the middle.
+        """
+        request.setHeader(b'content-type', b'application/json; charset=utf-8')
+        set_cors(request, 'POST')
+
+        if not self.manager.tx_storage.tokens_index:
+            request.setResponseCode(503)
+            return json_dumpb({'success': False})
+
+        try:
+            body = json_loadb(request.content.read())
+        except ValueError:
+            return _error('Invalid JSON')
+        if not isinstance(body, dict):
+            return _error('Invalid JSON')
+
+        ids = body.get('ids')
+        if not isinstance(ids, list) or not all(isinstance(tx_id, str) for tx_id in ids):
+            return _error('Invalid \'ids\' parameter, expected a list of hashes')
+        if len(ids) > settings.MAX_TX_LOOKUP_COUNT:
+            return _error('Too many ids, the maximum is {}'.format(settings.MAX_TX_LOOKUP_COUNT))
+
+        fields = body.get('fields', FIELDS)
+        if not isinstance(fields, list) or not set(fields).issubset(FIELDS):
+            return _error('Invalid \'fields\' parameter, expected a list with some of: {}'.format(', '.join(FIELDS)))
+
+        hashes = [_parse_hash(tx_id) for tx_id in ids]
+        # Loaded at once, the txs they spend are added as they are needed and shared by all of them
+        txs = self.manager.tx_storage.get_transactions(hash_bytes for hash_bytes in hashes if hash_bytes is not None)
+
+        task = cooperate(self._write_transactions(request, ids, hashes, set(fields), txs))
+        request.notifyFinish().addErrback(lambda _: task.stop())
+        task.whenDone().addCallbacks(lambda _: request.finish(), self._on_write_error, errbackArgs=(request,))
+
+        from twisted.web.server import NOT_DONE_YET
+        return NOT_DONE_YET
+
+    def _write_transactions(self, request: Request, ids: List[str], hashes: List[Optional[bytes]], fields: Set[str],
+                            txs: Dict[bytes, BaseTransaction]) -> Iterator[None]:
+        """ Write the response, one tx at a time, yielding to the reactor between them.
+        """
+        request.write(b'{"transactions":[')
+        for index, (tx_id, hash_bytes) in enumerate(zip(ids, hashes)):
+            data: Dict[str, Any] = {'id': tx_id}
+            tx = txs.get(hash_bytes) if hash_bytes is not None else None
+            if hash_bytes is None:
+                data.update(success=False, message='Invalid hash')
+            elif tx is None:
+                data.update(success=False, message='Transaction not found')
+            else:
+                tx_data = get_tx_extra_data(tx, txs)
+                data['success'] = True
+                data.update((field, tx_data[field]) for field in FIELDS if field in fields)
+            request.write((b',' if index else b'') + json_dumpb(data))
+            yield None
+        request.write(b'],"success":true}')
+
+    def _on_write_error(self, failure: Failure, request: Request) -> None:
+        """ Close the response when writing it fails, unless it stopped because the connection was lost.
+        """
+        if failure.check(TaskStopped):
+            return
+        self.log.error('error writing the transactions', reason=failure)
+        if request.finished:
+            return
+        request.write(b'],"success":false,"message":"Internal error"}')
+        request.finish()
+
+
+TransactionsResource.openapi = {
+    '/transactions': {
+        'x-visibility': 'public',
+        'x-rate-limit': {
+            'global': [
+                {
+                    'rate': '100r/s',
+                    'burst': 50,
+                    'delay': 20
+                }
+            ],
+            'per-ip': [
+                {
+                    'rate': '5r/s',
+                    'burst': 10,
+                    'delay': 3
+                }
+            ],
+            # Enough for MAX_TX_LOOKUP_COUNT ids
+            'max-body-size': '16k',
+        },
+        'post': {
+            'tags': ['transaction'],
+            'operationId': 'transactions',
+            'summary': 'Transactions by ids',
+            'description': ('Returns many transactions at once, each one with the same data of '
+                            '`/transaction?id=`. At most {} ids are accepted.'.format(settings.MAX_TX_LOOKUP_COUNT)),
+            'requestBody': {
+                'description': 'Ids of the transactions and the fields to return',
+                'required': True,
+                'content': {
+                    'application/json': {
+                        'schema': {
+                            'type': 'object',
+                            'required': ['ids'],
+                            'properties': {
+                                'ids': {
+                                    'type': 'array',
+                                    'items': {
+                                        'type': 'string'
+                                    }
+                                },
+                                'fields': {
+                                    'type': 'array',
+                                    'items': {
+                                        'type': 'string',
+                                        'enum': FIELDS
+                                    }
+                                }
+                            }
+                        },
+                        'examples': {
+                            'transactions': {
+                                'summary': 'Metadata of two transactions',
+                                'value': {
+                                    'ids': [
+                                        '0002bb171de3490828028ec5eef3325956acb6bcffa6a50466bb9a81d38363c2',
+                                        '00000b8792cb13e8adb51cc7d866541fc29b532e8dec95ae4661cf3da4d42cb4'
+                                    ],
+                                    'fields': ['meta']
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            'responses': {
+                '200': {
+                    'description': 'Success',
+                    'content': {
+                        'application/json': {
+                            'examples': {
+                                'success': {
+                                    'summary': 'Success',
+                                    'value': {
+                                        'success': True,
+                                        'transactions': [
+                                            {
+                                                'id': '0002bb171de3490828028ec5eef3325956acb6bcffa6a50466bb9a81'
+                                                      'd38363c2',
+                                                'success': True,
+                                                'meta': {
+                                                    'hash': '0002bb171de3490828028ec5eef3325956acb6bcffa6a50466bb9a81'
+                                                            'd38363c2',
+                                                    'spent_outputs': [],
+                                                    'received_by': [],
+                                                    'children': [],
+                                                    'conflict_with': [],
+                                                    'voided_by': [],
+                                                    'twins': [],
+                                                    'accumulated_weight': 10,
+                                                    'score': 0,
+                                                    'height': 0,
+                                                    'first_block': None
+                                                }
+                                            },
+                                            {
+                                                'id': '00000b8792cb13e8adb51cc7d866541fc29b532e8dec95ae4661cf3d'
+                                                      'a4d42cb4',
+                                                'success': False,
+                                                'message': 'Transaction not found'
+                                            }
+                                        ]
+                                    }
+                                },
+                                'error': {
+                                    'summary': 'Too many ids',
+                                    'value': {
+                                        'success': False,
+                                        'message': 'Too many ids, the maximum is 100'
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
@@ -1,5 +1,5 @@
 from collections import OrderedDict
-from typing import TYPE_CHECKING, Any, Generator, Iterator, Optional, Set
+from typing import TYPE_CHECKING, Any, Dict, Generator, Iterator, Optional, Set
 
 from twisted.internet import threads
 from twisted.internet.defer import Deferred, inlineCallbacks, succeed
@@ -166,6 +166,35 @@ class TransactionCacheStorage(BaseTransactionStorage):
         assert tx is not None
         return tx
 
+    def _get_transactions(self, hashes: Set[bytes]) -> Dict[bytes, BaseTransaction]:
+        txs: Dict[bytes, BaseTransaction] = {}
+        missing: Set[bytes] = set()
+        for hash_bytes in hashes:
+            tx: Optional[BaseTransaction]
+            if hash_bytes in self.cache:
+                tx = self._clone(self.cache[hash_bytes])
+                self.cache.move_to_end(hash_bytes, last=True)
+                self.stats['hit'] += 1
+                self._save_to_weakref(tx)
+                txs[hash_bytes] = tx
+                continue
+            tx = self.get_transaction_from_weakref(hash_bytes)
+            if tx is not None:
+                self.stats['hit'] += 1
+                self._update_cache(tx)
+                txs[hash_bytes] = tx
+            else:
+                missing.add(hash_bytes)
+
+        if missing:
+            for hash_bytes, tx in self.store.get_transactions(missing).items():
+                tx.storage = self
+                self.stats['miss'] += 1
+                self._update_cache(tx)
+                self._save_to_weakref(tx)
+                txs[hash_bytes] = tx
+        return txs
+
     def get_all_transactions(self):
         self._flush_to_storage(self.dirty_txs.copy())
         for tx in self.store.get_all_transactions():
@@ -9,7 +9,7 @@ from twisted.internet.defer import Deferred, inlineCallbacks
 
 from hathor import protos
 from hathor.exception import HathorError
-from hathor.indexes import TransactionIndexElement, TransactionsIndex
+from hathor.indexes import TransactionIndexElement
 from hathor.transaction import Block
 from hathor.transaction.storage.exceptions import TransactionDoesNotExist
 from hathor.transaction.storage.transaction_storage import AllTipsCache, TransactionStorage
@@ -583,22 +583,16 @@ class TransactionRemoteStorage(TransactionStorage):
             tx_list.append(block)
         return tx_list
 
-    @convert_grpc_exceptions
-    def get_all_sorted_txs(self, timestamp: int, count: int, offset: int) -> TransactionsIndex:
+    @convert_grpc_exceptions_generator
+    def iter_sorted_txs(self, timestamp: int, count: int) -> Iterator[TransactionIndexElement]:
         self._check_connection()
         request = protos.SortedTxsRequest(
             timestamp=timestamp,
             count=count,
-            offset=offset
         )
         result = self._stub.SortedTxs(request)
-        tx_list = []
         for tx_proto in result:
-            tx_list.append(TransactionIndexElement(tx_proto.timestamp, tx_proto.hash))
-
-        all_sorted = TransactionsIndex()
-        all_sorted.update(tx_list)
-        return all_sorted
+            yield TransactionIndexElement(tx_proto.timestamp, tx_proto.hash)
 
     @convert_grpc_exceptions
     def add_value(self, key: str, value: str) -> None:
@@ -826,8 +820,10 @@ class TransactionStorageServicer(protos.TransactionStorageServicer):
         offset = request.offset
         count = request.count
 
-        txs_index = self.storage.get_all_sorted_txs(timestamp, count, offset)
-        for tx_element in txs_index[:]:
+        # The elements before the offset are sent too, as the offset is counted from the first one at the timestamp.
+        # The page is copied before it is streamed, because the reactor thread keeps changing the index meanwhile.
+        tx_elements = list(self.storage.iter_sorted_txs(timestamp, offset + count))
+        for tx_element in tx_elements:
             yield protos.Transaction(timestamp=tx_element.timestamp, hash=tx_element.hash)
 
     @convert_hathor_exceptions
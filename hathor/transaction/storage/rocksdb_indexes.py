@@ -0,0 +1,471 @@
+"""
+Copyright 2019 Hathor Labs
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import struct
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Generic, Iterator, List, Optional, Tuple, TypeVar
+
+from hathor.conf import HathorSettings
+from hathor.indexes import TokensIndex, TransactionIndexElement, WalletIndex
+
+if TYPE_CHECKING:  # pragma: no cover
+    from hathor.pubsub import PubSubManager  # noqa: F401
+
+settings = HathorSettings()
+
+# Prefixes of the keys of each index, they take the place of column families, which python-rocksdb 0.7 does not have.
+_ADDRESS_PREFIX = b'a'  # address, timestamp, hash
+_ADDRESS_TOKEN_PREFIX = b'b'  # address, token uid, timestamp, hash
+_TOKEN_PREFIX = b't'  # token uid, timestamp, hash
+_COUNT_PREFIX = b'n'  # key prefix of one of the lists above -> number of elements
+_TOKEN_STATUS_PREFIX = b's'  # token uid -> name, symbol, total, mint and melt in JSON
+_BALANCE_PREFIX = b'm'  # address, token uid -> amounts received and spent
+_UTXO_PREFIX = b'u'  # address, token uid, hash, index -> value
+_COUNTED_PREFIX = b'c'  # hash of the txs counted in the balances
+
+# Greater than all other keys, so seeking past the keys of a prefix always lands on a key.
+_LAST_KEY = b'\xff'
+
+# Number of keys deleted in each batch when the indexes are cleared.
+_CLEAR_BATCH_SIZE = 10000
+
+_ELEMENT = struct.Struct('!I32s')  # timestamp and hash
+_COUNT = struct.Struct('!Q')
+_BALANCE = struct.Struct('!qq')  # received and spent
+_UTXO = struct.Struct('!32sB')  # hash and index
+_VALUE = struct.Struct('!Q')
+
+
+def _encode(*parts: bytes) -> bytes:
+    """ Join the parts of a key, each one prefixed by its length so it never runs into the next one.
+
+    >>> _encode(b'ab', b'c').hex()
+    '0261620163'
+    """
+    return b''.join(bytes([len(part)]) + part for part in parts)
+
+
+def _decode(key: bytes, offset: int) -> Tuple[bytes, int]:
+    """ Return a part of a key written by `_encode` and the offset of the next one.
+
+    >>> _decode(bytes.fromhex('0261620163'), 3)
+    (b'c', 5)
+    """
+    length = key[offset]
+    return key[offset + 1:offset + 1 + length], offset + 1 + length
+
+
+class IndexDB:
+    """ RocksDB database of the persistent wallet and tokens indexes, with an LRU cache of the values in front of it.
+
+    The writes made inside `batch()` are written at once when it ends. The point reads see them before that, the
+    iterations do not.
+    """
+
+    def __init__(self, path: str, cache_size: int = settings.ROCKSDB_INDEXES_CACHE_SIZE) -> None:
+        import rocksdb
+        self._rocksdb = rocksdb
+        self._db = rocksdb.DB(path, rocksdb.Options(create_if_missing=True))
+        self._db.put(_LAST_KEY, b'')
+
+        self.cache_size = cache_size
+        # Values read or written recently, None when the key does not exist
+        self._cache: 'OrderedDict[bytes, Optional[bytes]]' = OrderedDict()
+
+        self._batch: Optional[Any] = None
+        self._pending: Dict[bytes, Optional[bytes]] = {}
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """ Put the writes in one batch. A batch inside another one is part of the outer one.
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = self._rocksdb.WriteBatch()
+        try:
+            yield
+        except BaseException:
+            # The cache may have values that were never written
+            self._cache.clear()
+            raise
+        else:
+            self._db.write(self._batch)
+        finally:
+            self._batch = None
+            self._pending.clear()
+
+    def _cache_value(self, key: bytes, value: Optional[bytes]) -> None:
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        if key in self._pending:
+            return self._pending[key]
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        value = self._db.get(key)
+        self._cache_value(key, value)
+        return value
+
+    def put(self, key: bytes, value: bytes) -> None:
+        if self._batch is None:
+            self._db.put(key, value)
+        else:
+            self._batch.put(key, value)
+            self._pending[key] = value
+        self._cache_value(key, value)
+
+    def delete(self, key: bytes) -> None:
+        if self._batch is None:
+            self._db.delete(key)
+        else:
+            self._batch.delete(key)
+            self._pending[key] = None
+        self._cache_value(key, None)
+
+    def iterkeys(self, prefix: bytes, start: bytes = b'') -> Iterator[bytes]:
+        """ Iterate over the keys with a prefix in ascending order, from `prefix + start` (included).
+        """
+        it = self._db.iterkeys()
+        it.seek(prefix + start)
+        for key in it:
+            if not key.startswith(prefix):
+                break
+            yield key
+
+    def iterkeys_reversed(self, prefix: bytes, end: Optional[bytes] = None) -> Iterator[bytes]:
+        """ Iterate over the keys with a prefix in descending order, from `prefix + end` (excluded) or from the last
+        one when `end` is None.
+        """
+        if end is None:
+            # The first key after all keys of the prefix
+            upper = prefix.rstrip(b'\xff')
+            upper = upper[:-1] + bytes([upper[-1] + 1])
+        else:
+            upper = prefix + end
+        it = self._db.iterkeys()
+        it.seek(upper)
+        for key in reversed(it):
+            if key >= upper:
+                continue
+            if not key.startswith(prefix):
+                break
+            yield key
+
+    def clear(self) -> None:
+        """ Remove everything from the indexes.
+        """
+        assert self._batch is None
+        it = self._db.iterkeys()
+        it.seek_to_first()
+        batch = self._rocksdb.WriteBatch()
+        count = 0
+        for key in it:
+            if key == _LAST_KEY:
+                continue
+            batch.delete(key)
+            count += 1
+            if count % _CLEAR_BATCH_SIZE == 0:
+                self._db.write(batch)
+                batch = self._rocksdb.WriteBatch()
+        self._db.write(batch)
+        self._cache.clear()
+
+
+class RocksDBKeyList:
+    """ Persistent counterpart of the `SortedKeyList` of `TransactionIndexElement` used by the indexes, sorted by
+    timestamp and hash. Its length is kept in another key.
+    """
+
+    def __init__(self, db: IndexDB, prefix: bytes) -> None:
+        self.db = db
+        self.prefix = prefix
+        self._count_key = _COUNT_PREFIX + prefix
+
+    def _get_key(self, element: TransactionIndexElement) -> bytes:
+        return self.prefix + _ELEMENT.pack(element.timestamp, element.hash)
+
+    def _get_element(self, key: bytes) -> TransactionIndexElement:
+        timestamp, hash_bytes = _ELEMENT.unpack_from(key, len(self.prefix))
+        return TransactionIndexElement(timestamp, hash_bytes)
+
+    def __contains__(self, element: TransactionIndexElement) -> bool:
+        return self.db.get(self._get_key(element)) is not None
+
+    def __len__(self) -> int:
+        data = self.db.get(self._count_key)
+        if data is None:
+            return 0
+        count, = _COUNT.unpack(data)
+        return count
+
+    def _set_len(self, count: int) -> None:
+        if count:
+            self.db.put(self._count_key, _COUNT.pack(count))
+        else:
+            self.db.delete(self._count_key)
+
+    def add(self, element: TransactionIndexElement) -> None:
+        if element in self:
+            return
+        self.db.put(self._get_key(element), b'')
+        self._set_len(len(self) + 1)
+
+    def discard(self, element: TransactionIndexElement) -> None:
+        if element not in self:
+            return
+        self.db.delete(self._get_key(element))
+        self._set_len(len(self) - 1)
+
+    def __iter__(self) -> Iterator[TransactionIndexElement]:
+        return self.irange_key()
+
+    def irange_key(self, min_key: Tuple[int, bytes] = (0, b'')) -> Iterator[TransactionIndexElement]:
+        """ Iterate from the oldest to the newest, starting at `min_key` (included).
+        """
+        for key in self.db.iterkeys(self.prefix, _ELEMENT.pack(*min_key)):
+            yield self._get_element(key)
+
+    def _take(self, keys: Iterator[bytes], count: int) -> Tuple[List[bytes], bool]:
+        """ Return the hashes of the first `count` keys and whether there are more.
+        """
+        hashes: List[bytes] = []
+        for key in keys:
+            if len(hashes) == count:
+                return hashes, True
+            hashes.append(self._get_element(key).hash)
+        return hashes, False
+
+    def get_newest(self, count: int) -> Tuple[List[bytes], bool]:
+        """ Same as `get_newest_sorted_key_list`.
+        """
+        return self._take(self.db.iterkeys_reversed(self.prefix), count)
+
+    def get_older(self, timestamp: int, hash_bytes: bytes, count: int) -> Tuple[List[bytes], bool]:
+        """ Same as `get_older_sorted_key_list`.
+        """
+        return self._take(self.db.iterkeys_reversed(self.prefix, _ELEMENT.pack(timestamp, hash_bytes)), count)
+
+    def get_newer(self, timestamp: int, hash_bytes: bytes, count: int) -> Tuple[List[bytes], bool]:
+        """ Same as `get_newer_sorted_key_list`.
+        """
+        start = _ELEMENT.pack(timestamp, hash_bytes)
+        keys = (key for key in self.db.iterkeys(self.prefix, start) if key != self.prefix + start)
+        hashes, has_more = self._take(keys, count)
+        # Reverse because we want the newest first
+        hashes.reverse()
+        return hashes, has_more
+
+
+KT = TypeVar('KT')
+
+
+class RocksDBKeyListMap(Generic[KT]):
+    """ A `RocksDBKeyList` for each key, like the dicts of `SortedKeyList` of the indexes.
+    """
+
+    def __init__(self, db: IndexDB, prefix: bytes, encode: Callable[[KT], bytes]) -> None:
+        self.db = db
+        self.prefix = prefix
+        self.encode = encode
+
+    def __getitem__(self, key: KT) -> RocksDBKeyList:
+        return RocksDBKeyList(self.db, self.prefix + self.encode(key))
+
+    def get(self, key: KT, default: Any = None) -> Any:
+        """ Get the list of a key, or the default when it is empty.
+        """
+        key_list = self[key]
+        if not len(key_list):
+            return default
+        return key_list
+
+
+class RocksDBSet:
+    """ Persistent set of bytes.
+    """
+
+    def __init__(self, db: IndexDB, prefix: bytes) -> None:
+        self.db = db
+        self.prefix = prefix
+
+    def __contains__(self, item: bytes) -> bool:
+        return self.db.get(self.prefix + item) is not None
+
+    def add(self, item: bytes) -> None:
+        self.db.put(self.prefix + item, b'')
+
+    def discard(self, item: bytes) -> None:
+        self.db.delete(self.prefix + item)
+
+
+def _encode_address(address: str) -> bytes:
+    return _encode(address.encode('utf-8'))
+
+
+def _encode_address_token(address_and_token: Tuple[str, bytes]) -> bytes:
+    address, token_uid = address_and_token
+    return _encode(address.encode('utf-8'), token_uid)
+
+
+class RocksDBWalletIndex(WalletIndex):
+    """ `WalletIndex` saved in an `IndexDB`, so it is not built again every time the node starts.
+    """
+
+    def __init__(self, db: IndexDB, pubsub: Optional['PubSubManager'] = None) -> None:
+        super().__init__(pubsub)
+        self.db = db
+        self.index = RocksDBKeyListMap(db, _ADDRESS_PREFIX, _encode_address)  # type: ignore
+        self.token_index = RocksDBKeyListMap(db, _ADDRESS_TOKEN_PREFIX, _encode_address_token)  # type: ignore
+        self.counted_txs = RocksDBSet(db, _COUNTED_PREFIX)  # type: ignore
+
+    def _get_key_list(self, address: str, token_uid: Optional[bytes] = None) -> RocksDBKeyList:  # type: ignore
+        if token_uid is None:
+            return self.index[address]
+        return self.token_index[(address, token_uid)]
+
+    def get_newest_transactions(self, address: str, count: int, token_uid: Optional[bytes] = None
+                                ) -> Tuple[List[bytes], bool]:
+        return self._get_key_list(address, token_uid).get_newest(count)
+
+    def get_older_transactions(self, address: str, timestamp: int, hash_bytes: bytes, count: int,
+                               token_uid: Optional[bytes] = None) -> Tuple[List[bytes], bool]:
+        return self._get_key_list(address, token_uid).get_older(timestamp, hash_bytes, count)
+
+    def get_newer_transactions(self, address: str, timestamp: int, hash_bytes: bytes, count: int,
+                               token_uid: Optional[bytes] = None) -> Tuple[List[bytes], bool]:
+        return self._get_key_list(address, token_uid).get_newer(timestamp, hash_bytes, count)
+
+    def is_address_empty(self, address: str) -> bool:
+        return not len(self.index[address])
+
+    def _add_to_balance(self, address: str, token_uid: bytes, received: int, spent: int) -> None:
+        key = _BALANCE_PREFIX + _encode(address.encode('utf-8'), token_uid)
+        data = self.db.get(key)
+        old_received, old_spent = (0, 0) if data is None else _BALANCE.unpack(data)
+        received += old_received
+        spent += old_spent
+        if not received and not spent:
+            self.db.delete(key)
+        else:
+            self.db.put(key, _BALANCE.pack(received, spent))
+
+    def _get_utxo_key(self, address: str, token_uid: bytes, key: Tuple[bytes, int]) -> bytes:
+        return _UTXO_PREFIX + _encode(address.encode('utf-8'), token_uid) + _UTXO.pack(*key)
+
+    def _add_utxo(self, address: str, token_uid: bytes, key: Tuple[bytes, int], value: int) -> None:
+        self.db.put(self._get_utxo_key(address, token_uid, key), _VALUE.pack(value))
+
+    def _remove_utxo(self, address: str, token_uid: bytes, key: Tuple[bytes, int]) -> None:
+        self.db.delete(self._get_utxo_key(address, token_uid, key))
+
+    def get_balances(self, address: str) -> Dict[bytes, WalletIndex.TokenBalance]:
+        """ Get the balance of each token of an address, indexed by token uid. The utxos are not loaded, see
+        `get_utxos`.
+        """
+        prefix = _BALANCE_PREFIX + _encode_address(address)
+        balances: Dict[bytes, WalletIndex.TokenBalance] = {}
+        for key in self.db.iterkeys(prefix):
+            token_uid, _ = _decode(key, len(prefix))
+            data = self.db.get(key)
+            assert data is not None
+            balance = self.TokenBalance()
+            balance.received, balance.spent = _BALANCE.unpack(data)
+            balances[token_uid] = balance
+        return balances
+
+    def get_utxos(self, address: str, token_uid: bytes) -> Dict[Tuple[bytes, int], int]:
+        prefix = _UTXO_PREFIX + _encode(address.encode('utf-8'), token_uid)
+        utxos: Dict[Tuple[bytes, int], int] = {}
+        for key in self.db.iterkeys(prefix):
+            data = self.db.get(key)
+            assert data is not None
+            utxos[_UTXO.unpack_from(key, len(prefix))] = _VALUE.unpack(data)[0]
+        return utxos
+
+
+class RocksDBTokensIndex(TokensIndex):
+    """ `TokensIndex` saved in an `IndexDB`, so it is not built again every time the node starts.
+    """
+
+    def __init__(self, db: IndexDB) -> None:
+        super().__init__()
+        self.db = db
+
+    def _load_status(self, token_uid: bytes) -> Optional[TokensIndex.TokenStatus]:
+        data = self.db.get(_TOKEN_STATUS_PREFIX + token_uid)
+        if data is None:
+            return None
+        status_json = json.loads(data)
+        return self.TokenStatus(
+            name=status_json['name'],
+            symbol=status_json['symbol'],
+            total=status_json['total'],
+            mint={(bytes.fromhex(tx_id), index) for tx_id, index in status_json['mint']},
+            melt={(bytes.fromhex(tx_id), index) for tx_id, index in status_json['melt']},
+        )
+
+    def _get_status(self, token_uid: bytes) -> TokensIndex.TokenStatus:
+        return self._load_status(token_uid) or self.TokenStatus()
+
+    def _save_status(self, token_uid: bytes, status: TokensIndex.TokenStatus) -> None:
+        status_json = {
+            'name': status.name,
+            'symbol': status.symbol,
+            'total': status.total,
+            'mint': [[tx_id.hex(), index] for tx_id, index in sorted(status.mint)],
+            'melt': [[tx_id.hex(), index] for tx_id, index in sorted(status.melt)],
+        }
+        self.db.put(_TOKEN_STATUS_PREFIX + token_uid, json.dumps(status_json).encode('utf-8'))
+
+    def _delete_status(self, token_uid: bytes) -> None:
+        self.db.delete(_TOKEN_STATUS_PREFIX + token_uid)
+
+    def _get_transactions(self, token_uid: bytes) -> RocksDBKeyList:  # type: ignore
+        return RocksDBKeyList(self.db, _TOKEN_PREFIX + _encode(token_uid))
+
+    def get_token_info(self, token_uid: bytes) -> TokensIndex.TokenStatus:
+        status = self._load_status(token_uid)
+        if status is None:
+            raise KeyError('unknown token')
+        return status
+
+    def get_all_tokens(self) -> Iterator[Tuple[bytes, TokensIndex.TokenStatus]]:
+        for key in self.db.iterkeys(_TOKEN_STATUS_PREFIX):
+            token_uid = key[len(_TOKEN_STATUS_PREFIX):]
+            status = self._load_status(token_uid)
+            assert status is not None
+            yield token_uid, status
+
+    def get_transactions_count(self, token_uid: bytes) -> int:
+        return len(self._get_transactions(token_uid))
+
+    def get_newest_transactions(self, token_uid: bytes, count: int) -> Tuple[List[bytes], bool]:
+        return self._get_transactions(token_uid).get_newest(count)
+
+    def get_older_transactions(self, token_uid: bytes, timestamp: int, hash_bytes: bytes, count: int
+                               ) -> Tuple[List[bytes], bool]:
+        return self._get_transactions(token_uid).get_older(timestamp, hash_bytes, count)
+
+    def get_newer_transactions(self, token_uid: bytes, timestamp: int, hash_bytes: bytes, count: int
+                               ) -> Tuple[List[bytes], bool]:
+        return self._get_transactions(token_uid).get_newer(timestamp, hash_bytes, count)
@@ -1,10 +1,14 @@
 import os
-from typing import TYPE_CHECKING, Iterator, Optional
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Set, Tuple
 
+from hathor.indexes import TokensIndex, WalletIndex
 from hathor.transaction.storage.exceptions import TransactionDoesNotExist
+from hathor.transaction.storage.rocksdb_indexes import IndexDB, RocksDBTokensIndex, RocksDBWalletIndex
 from hathor.transaction.storage.transaction_storage import BaseTransactionStorage, TransactionStorageAsyncFromSync
 
 if TYPE_CHECKING:
+    from hathor.pubsub import PubSubManager  # noqa: F401
     from hathor.transaction import BaseTransaction
 
 
@@ -12,16 +16,61 @@ class TransactionRocksDBStorage(BaseTransactionStorage, TransactionStorageAsyncF
     """This storage saves tx and metadata to the same key on RocksDB
 
     It uses Protobuf serialization internally.
+
+    With `with_persistent_indexes`, the wallet and tokens indexes are saved in another database (see `IndexDB`), so
+    they are not built again every time the node starts. Whether they have all txs is saved with the other attributes
+    of the storage, and it is cleared whenever the storage is used without them.
     """
 
-    def __init__(self, path='./', with_index=True):
+    def __init__(self, path='./', with_index=True, with_persistent_indexes=False):
         import rocksdb
         tx_dir = os.path.join(path, 'tx.db')
         self._db = rocksdb.DB(tx_dir, rocksdb.Options(create_if_missing=True))
 
         attributes_dir = os.path.join(path, 'attributes.db')
         self.attributes_db = rocksdb.DB(attributes_dir, rocksdb.Options(create_if_missing=True))
+
+        self._index_db: Optional[IndexDB] = None
+        if with_persistent_indexes:
+            self._index_db = IndexDB(os.path.join(path, 'index.db'))
         super().__init__(with_index=with_index)
+        if self._index_db is None or not with_index:
+            # The txs saved from now on are not added to the persistent indexes
+            self.remove_value(self._wallet_indexes_built_attribute)
+
+    def create_wallet_indexes(self, pubsub: Optional['PubSubManager'] = None) -> Tuple[WalletIndex, TokensIndex]:
+        if self._index_db is None:
+            return super().create_wallet_indexes(pubsub)
+        return RocksDBWalletIndex(self._index_db, pubsub), RocksDBTokensIndex(self._index_db)
+
+    def are_wallet_indexes_built(self) -> bool:
+        return self._index_db is not None and self.get_value(self._wallet_indexes_built_attribute) == '1'
+
+    def set_wallet_indexes_built(self, built: bool) -> None:
+        if not built:
+            self.remove_value(self._wallet_indexes_built_attribute)
+            if self._index_db is not None:
+                self._index_db.clear()
+        elif self._index_db is not None:
+            self.add_value(self._wallet_indexes_built_attribute, '1')
+
+    def remove_cache(self) -> None:
+        super().remove_cache()
+        # The cache storage in front of this one does not update the persistent indexes
+        self.remove_value(self._wallet_indexes_built_attribute)
+
+    @contextmanager
+    def _index_batch(self) -> Iterator[None]:
+        """ Put the writes to the persistent indexes of a tx in one batch.
+
+        It is not the batch of the tx itself, which is in another database. When the node stops in between, it needs a
+        full verification anyway, which builds the indexes again.
+        """
+        if self._index_db is None:
+            yield
+            return
+        with self._index_db.batch():
+            yield
 
     def _load_from_bytes(self, data: bytes) -> 'BaseTransaction':
         from hathor import protos
@@ -35,14 +84,24 @@ class TransactionRocksDBStorage(BaseTransactionStorage, TransactionStorageAsyncF
         tx_proto = tx.to_proto()
         return tx_proto.SerializeToString()
 
+    def _add_to_cache(self, tx: 'BaseTransaction') -> None:
+        with self._index_batch():
+            super()._add_to_cache(tx)
+
+    def _del_from_cache(self, tx: 'BaseTransaction', *, relax_assert: bool = False) -> None:
+        with self._index_batch():
+            super()._del_from_cache(tx, relax_assert=relax_assert)
+
     def remove_transaction(self, tx: 'BaseTransaction') -> None:
-        super().remove_transaction(tx)
-        self._db.delete(tx.hash)
+        with self._index_batch():
+            super().remove_transaction(tx)
+            self._db.delete(tx.hash)
         self._remove_from_weakref(tx)
 
     def save_transaction(self, tx: 'BaseTransaction', *, only_metadata: bool = False) -> None:
-        super().save_transaction(tx, only_metadata=only_metadata)
-        self._save_transaction(tx, only_metadata=only_metadata)
+        with self._index_batch():
+            super().save_transaction(tx, only_metadata=only_metadata)
+            self._save_transaction(tx, only_metadata=only_metadata)
         self._save_to_weakref(tx)
 
     def _save_transaction(self, tx: 'BaseTransaction', *, only_metadata: bool = False) -> None:
@@ -71,6 +130,26 @@ class TransactionRocksDBStorage(BaseTransactionStorage, TransactionStorageAsyncF
         self._save_to_weakref(tx)
         return tx
 
+    def _get_transactions(self, hashes: Set[bytes]) -> Dict[bytes, 'BaseTransaction']:
+        txs: Dict[bytes, 'BaseTransaction'] = {}
+        missing: List[bytes] = []
+        for hash_bytes in hashes:
+            tx = self.get_transaction_from_weakref(hash_bytes)
+            if tx is not None:
+                txs[hash_bytes] = tx
+            else:
+                missing.append(hash_bytes)
+
+        if missing:
+            for hash_bytes, data in self._db.multi_get(missing).items():
+                if data is None:
+                    continue
+                tx = self._load_from_bytes(data)
+                assert tx.hash == hash_bytes
+                self._save_to_weakref(tx)
+                txs[hash_bytes] = tx
+        return txs
+
     def _get_transaction_from_db(self, hash_bytes: bytes) -> Optional['BaseTransaction']:
         key = hash_bytes
         data = self._db.get(key)
@@ -1,8 +1,10 @@
 import hashlib
 from abc import ABC, abstractmethod, abstractproperty
 from collections import deque
+from contextlib import ExitStack
+from itertools import islice
 from threading import Lock
-from typing import Any, Dict, Generator, Iterator, List, NamedTuple, Optional, Set, Tuple, cast
+from typing import Any, Dict, Generator, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, cast
 from weakref import WeakValueDictionary
 
 from intervaltree.interval import Interval
@@ -10,7 +12,15 @@ from structlog import get_logger
 from twisted.internet.defer import Deferred, inlineCallbacks, succeed
 
 from hathor.conf import HathorSettings
-from hathor.indexes import IndexesManager, TokensIndex, TransactionsIndex, WalletIndex
+from hathor.indexes import (
+    BestChainIndex,
+    IndexesManager,
+    TipsCommitment,
+    TokensIndex,
+    TransactionIndexElement,
+    TwinsIndex,
+    WalletIndex,
+)
 from hathor.pubsub import HathorEvents, PubSubManager
 from hathor.transaction.block import Block
 from hathor.transaction.storage.exceptions import TransactionDoesNotExist, TransactionIsNotABlock
@@ -38,6 +48,8 @@ class TransactionStorage(ABC):
     block_index: Optional[IndexesManager]
     tx_index: Optional[IndexesManager]
     all_index: Optional[IndexesManager]
+    best_chain_index: Optional[BestChainIndex]
+    twins_index: Optional[TwinsIndex]
     log = get_logger()
 
     def __init__(self):
@@ -59,6 +71,13 @@ class TransactionStorage(ABC):
         # This cache is updated in the consensus algorithm.
         self._best_block_tips = None
 
+        # Index of the best chain by height, it is created with the other indexes when they are enabled.
+        self.best_chain_index = None
+
+        # Index of the txs with conflicts by twin fingerprint, it is created with the other indexes when they are
+        # enabled and it is updated in the consensus algorithm.
+        self.twins_index = None
+
         # If should create lock when getting a transaction
         self._should_lock = False
 
@@ -82,6 +101,9 @@ class TransactionStorage(ABC):
         # Key storage attribute to save if the node has clean db
         self._clean_db_attribute: str = 'clean_db'
 
+        # Key storage attribute to save if the persistent wallet and tokens indexes have all txs
+        self._wallet_indexes_built_attribute: str = 'wallet_indexes_built'
+
     def _save_or_verify_genesis(self) -> None:
         """Save all genesis in the storage."""
         for tx in self._get_genesis_from_settings():
@@ -174,6 +196,13 @@ class TransactionStorage(ABC):
             if self.wallet_index:
                 self.wallet_index.remove_tx(tx)
 
+            if self.best_chain_index is not None and tx.is_block:
+                assert isinstance(tx, Block)
+                self.best_chain_index.del_block(tx)
+
+            if self.twins_index is not None:
+                self.twins_index.del_tx(tx)
+
     @abstractmethod
     def transaction_exists(self, hash_bytes: bytes) -> bool:
         """Returns `True` if transaction with hash `hash_bytes` exists.
@@ -227,6 +256,40 @@ class TransactionStorage(ABC):
             tx = self._get_transaction(hash_bytes)
         return tx
 
+    def _get_transactions(self, hashes: Set[bytes]) -> Dict[bytes, BaseTransaction]:
+        """Returns the transactions with the given hashes, the ones that do not exist are left out.
+
+        Storages that can fetch many transactions at once should override it, by default it is one lookup per hash.
+
+        :param hashes: Hashes in bytes that will be fetched.
+        """
+        txs: Dict[bytes, BaseTransaction] = {}
+        for hash_bytes in hashes:
+            try:
+                txs[hash_bytes] = self._get_transaction(hash_bytes)
+            except TransactionDoesNotExist:
+                pass
+        return txs
+
+    def get_transactions(self, hashes: Iterable[bytes]) -> Dict[bytes, BaseTransaction]:
+        """Acquire the locks and get the transactions with the given hashes in a single storage lookup.
+
+        Unlike `get_transaction`, it does not raise `TransactionDoesNotExist`, the missing transactions are just not
+        in the returned dict.
+
+        :param hashes: Hashes in bytes that will be fetched, repeated hashes are fetched only once.
+        """
+        hashes_set = set(hashes)
+        if not self._should_lock:
+            return self._get_transactions(hashes_set)
+        with ExitStack() as stack:
+            # the locks are always acquired in the same order to avoid deadlocks between concurrent calls
+            for hash_bytes in sorted(hashes_set):
+                lock = self._get_lock(hash_bytes)
+                assert lock is not None
+                stack.enter_context(lock)
+            return self._get_transactions(hashes_set)
+
     def get_metadata(self, hash_bytes: bytes) -> Optional[TransactionMetadata]:
         """Returns the transaction metadata with hash `hash_bytes`.
 
@@ -385,9 +448,27 @@ class TransactionStorage(ABC):
 
         return highest_weight
 
+    def _get_best_chain_index(self) -> Optional[BestChainIndex]:
+        """ Return the best chain index updated to the current best block tips, or None if it is not enabled.
+
+        The index is kept up to date by the consensus algorithm, this only rebuilds it when the tips were set by
+        someone else, e.g., when the storage is loaded without running the consensus.
+        """
+        if self.best_chain_index is None:
+            return None
+        tips = self.get_best_block_tips()
+        if self.best_chain_index.heads != tips:
+            heads = [cast(Block, self.get_transaction(h)) for h in tips]
+            self.best_chain_index.update(heads)
+        return self.best_chain_index
+
     def get_height_best_block(self) -> int:
         """ Iterate over best block tips and get the highest height
         """
+        best_chain_index = self._get_best_chain_index()
+        if best_chain_index is not None:
+            return best_chain_index.get_height()
+
         heads = [self.get_transaction(h) for h in self.get_best_block_tips()]
         highest_height = 0
         for head in heads:
@@ -397,6 +478,75 @@ class TransactionStorage(ABC):
 
         return highest_height
 
+    def get_height_best_block_at(self, timestamp: float) -> int:
+        """ Height of the best chain at the given timestamp, i.e., the height of its last block at or before it.
+
+        :param timestamp: Timestamp of the point in the best chain, usually `tx.timestamp - 1`
+        """
+        best_chain_index = self._get_best_chain_index()
+        if best_chain_index is not None:
+            height = best_chain_index.get_height_at_timestamp(timestamp)
+            assert height >= 0
+            return height
+
+        tips = self.get_best_block_tips(timestamp)
+        assert len(tips) > 0
+        tip = self.get_transaction(tips[0])
+        assert timestamp >= tip.timestamp
+        return tip.get_metadata().height
+
+    def get_block_locator(self) -> List[bytes]:
+        """ Hashes of blocks of the best chain, from the best block back to the genesis. The latest blocks are all
+        there, then the distance between them doubles at each step. A peer uses it to find the last block that both
+        best chains have, see `get_best_chain_after`.
+
+        Without the best chain index, only the latest blocks and the genesis are there, so the chain is not walked.
+        """
+        best_chain_index = self._get_best_chain_index()
+        if best_chain_index is None:
+            heads = [cast(Block, self.get_transaction(h)) for h in self.get_best_block_tips()]
+            block = max(heads, key=lambda blk: blk.get_metadata().height)
+            locator: List[bytes] = []
+            while not block.is_genesis and len(locator) < 10:
+                assert block.hash is not None
+                locator.append(block.hash)
+                block = block.get_block_parent()
+            locator.append(settings.GENESIS_BLOCK_HASH)
+            return locator
+
+        height = best_chain_index.get_height()
+        heights: List[int] = []
+        step = 1
+        while height > 0:
+            heights.append(height)
+            if len(heights) >= 10:
+                step *= 2
+            height -= step
+        heights.append(0)
+        return [cast(bytes, best_chain_index.get_hash(h)) for h in heights]
+
+    def get_best_chain_after(self, locator: List[bytes], count: int) -> List[Block]:
+        """ Return up to `count` blocks of the best chain right after the first block of the `locator` that is in it,
+        from the oldest to the newest. It is empty when none of them is in the best chain.
+
+        It is also empty without the best chain index, as any peer could make us walk the whole chain otherwise.
+
+        :param locator: Hashes of blocks from the newest to the oldest, usually `get_block_locator()` of a peer
+        """
+        best_chain_index = self._get_best_chain_index()
+        if best_chain_index is None:
+            return []
+
+        for hash_bytes in locator:
+            if not self.transaction_exists(hash_bytes):
+                continue
+            block = self.get_transaction(hash_bytes)
+            if isinstance(block, Block) and best_chain_index.is_in_best_chain(block):
+                hashes = best_chain_index.get_hashes_after(block.get_metadata().height, count)
+                blocks = self.get_transactions(hashes)
+                return [cast(Block, blocks[h]) for h in hashes]
+        return []
+
     def get_merkle_tree(self, timestamp: int) -> Tuple[bytes, List[bytes]]:
         """ Generate a hash to check whether the DAG is the same at that timestamp.
 
@@ -427,6 +577,27 @@ class TransactionStorage(ABC):
 
         return merkle.digest(), hashes
 
+    def get_tips_commitment(self, timestamp: Optional[float] = None) -> Tuple[bytes, int]:
+        """ Return an order-independent commitment of the tips at the timestamp and the number of tips.
+
+        Unlike `get_merkle_tree`, the storages with indexes do not need to find the tips, see `TipsCommitment`.
+        """
+        intervals = self.get_all_tips(timestamp)
+        return TipsCommitment.calculate(x.data for x in intervals), len(intervals)
+
+    def get_tx_tips_histogram(self, begin: int, end: int, bucket: int = 1) -> List[Tuple[int, int]]:
+        """ Return the number of tx tips in each bucket of `bucket` seconds of [begin, end], see
+        `TipsIndex.get_histogram`.
+
+        The storages with indexes do not query the tips of each timestamp.
+        """
+        histogram = []
+        for bucket_begin in range(begin, end + 1, bucket):
+            bucket_end = min(bucket_begin + bucket, end + 1)
+            peak = max(len(self.get_tx_tips(timestamp)) for timestamp in range(bucket_begin, bucket_end))
+            histogram.append((bucket_begin, peak))
+        return histogram
+
     @abstractmethod
     def get_block_tips(self, timestamp: Optional[float] = None) -> Set[Interval]:
         raise NotImplementedError
@@ -567,8 +738,9 @@ class TransactionStorage(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def get_all_sorted_txs(self, timestamp: int, count: int, offset: int) -> TransactionsIndex:
-        """ Returns ordered blocks and txs in a TransactionIndex
+    def iter_sorted_txs(self, timestamp: int, count: int) -> Iterator[TransactionIndexElement]:
+        """ Iterate over the blocks and txs ordered by (timestamp, hash), starting at the first one at or after
+        the given timestamp, and stopping after `count` of them.
         """
         raise NotImplementedError
 
@@ -629,6 +801,21 @@ class TransactionStorage(ABC):
         """
         return self.get_value(self._clean_db_attribute) == '1'
 
+    def create_wallet_indexes(self, pubsub: Optional[PubSubManager] = None) -> Tuple[WalletIndex, TokensIndex]:
+        """ Create the wallet and tokens indexes of this storage, they are kept in memory unless the storage saves them
+        """
+        return WalletIndex(pubsub), TokensIndex()
+
+    def are_wallet_indexes_built(self) -> bool:
+        """ Return if the wallet and tokens indexes were saved with all txs, so they do not need them again when the
+        manager starts
+        """
+        return False
+
+    def set_wallet_indexes_built(self, built: bool) -> None:
+        """ Save on storage whether the wallet and tokens indexes have all txs, they are cleared when not
+        """
+
 
 class TransactionStorageAsyncFromSync(TransactionStorage):
     """Implement async interface from sync interface, for legacy implementations."""
@@ -690,6 +877,8 @@ class BaseTransactionStorage(TransactionStorage):
         self.all_index = IndexesManager()
         self.wallet_index = None
         self.tokens_index = None
+        self.best_chain_index = BestChainIndex()
+        self.twins_index = TwinsIndex()
 
         genesis = self.get_all_genesis()
         if genesis:
@@ -705,6 +894,8 @@ class BaseTransactionStorage(TransactionStorage):
         self.block_index = None
         self.tx_index = None
         self.all_index = None
+        self.best_chain_index = None
+        self.twins_index = None
 
     def get_best_block_tips(self, timestamp: Optional[float] = None, *, skip_cache: bool = False) -> List[bytes]:
         return super().get_best_block_tips(timestamp, skip_cache=skip_cache)
@@ -754,6 +945,20 @@ class BaseTransactionStorage(TransactionStorage):
 
         return tips
 
+    def get_tx_tips_histogram(self, begin: int, end: int, bucket: int = 1) -> List[Tuple[int, int]]:
+        if not self.with_index:
+            raise NotImplementedError
+        assert self.tx_index is not None
+        return self.tx_index.tips_index.get_histogram(begin, end, bucket)
+
+    def get_tips_commitment(self, timestamp: Optional[float] = None) -> Tuple[bytes, int]:
+        if not self.with_index:
+            raise NotImplementedError
+        assert self.all_index is not None
+        if timestamp is None:
+            timestamp = self.latest_timestamp
+        return self.all_index.tips_index.get_commitment(timestamp)
+
     def get_newest_blocks(self, count: int) -> Tuple[List[Block], bool]:
         if not self.with_index:
             raise NotImplementedError
@@ -926,6 +1131,13 @@ class BaseTransactionStorage(TransactionStorage):
         ref_tx = self.get_transaction(hash_bytes)
         if not ref_tx.is_block:
             raise TransactionIsNotABlock
+        assert isinstance(ref_tx, Block)
+        best_chain_index = self._get_best_chain_index()
+        if best_chain_index is not None and best_chain_index.is_in_best_chain(ref_tx):
+            # the blocks before a block in the best chain are the ones right below it in the index
+            hashes = best_chain_index.get_hashes_before(ref_tx.get_metadata().height, num_blocks)
+            blocks = self.get_transactions(hashes)
+            return [cast(Block, blocks[h]) for h in hashes]
         result = []  # List[Block]
         pending_visits = deque(ref_tx.parents)  # List[bytes]
         used = set(pending_visits)  # Set[bytes]
@@ -944,15 +1156,6 @@ class BaseTransactionStorage(TransactionStorage):
                     pending_visits.append(parent_hash)
         return result
 
-    def get_all_sorted_txs(self, timestamp: int, count: int, offset: int) -> TransactionsIndex:
-        """ Returns ordered blocks and txs in a TransactionIndex
-        """
+    def iter_sorted_txs(self, timestamp: int, count: int) -> Iterator[TransactionIndexElement]:
         assert self.all_index is not None
-
-        idx = self.all_index.txs_index.find_first_at_timestamp(timestamp)
-        txs = self.all_index.txs_index[idx:idx+offset+count]
-
-        # merge sorted txs and blocks
-        all_sorted = TransactionsIndex()
-        all_sorted.update(txs)
-        return all_sorted
+        return islice(self.all_index.txs_index.iter_from(timestamp), count)
@@ -240,12 +240,12 @@ class TokenCreationTransaction(Transaction):
         json['tokens'] = []
         return json
 
-    def verify(self) -> None:
+    def verify(self, *, pre_verified: bool = False) -> None:
         """ Run all validations as regular transactions plus validation on token info.
 
         We also overload verify_sum to make some different checks
         """
-        super().verify()
+        super().verify(pre_verified=pre_verified)
         self.verify_token_info()
 
     def verify_sum(self) -> None:
@@ -249,7 +249,26 @@ class Transaction(BaseTransaction):
         json['tokens'] = [h.hex() for h in self.tokens]
         return json
 
-    def verify(self) -> None:
+    def get_twin_fingerprint(self) -> bytes:
+        """ Hash of the inputs and outputs regardless of their order, two different txs are twins when they have the
+        same fingerprint.
+
+        Only the fields compared by the consensus are used: the inputs' tx_id, index and data, and the outputs' value
+        and script.
+        """
+        h = hashlib.sha256()
+        h.update(pack('!II', len(self.inputs), len(self.outputs)))
+        for txin in sorted(self.inputs, key=lambda x: (x.tx_id, x.index, x.data)):
+            h.update(pack('!BI', len(txin.tx_id), txin.index))
+            h.update(txin.tx_id)
+            h.update(pack('!I', len(txin.data)))
+            h.update(txin.data)
+        for txout in sorted(self.outputs, key=lambda x: (x.script, x.value)):
+            h.update(pack('!QI', txout.value, len(txout.script)))
+            h.update(txout.script)
+        return h.digest()
+
+    def verify(self, *, pre_verified: bool = False) -> None:
         """ Common verification for all transactions:
            (i) number of inputs is at most 256
           (ii) number of outputs is at most 256
@@ -260,13 +279,18 @@ class Transaction(BaseTransaction):
          (vii) validate that both parents are valid
         (viii) validate input's timestamps
           (ix) validate inputs and outputs sum
+
+        When `pre_verified` is True, (i), (ii), (iv), (v) and (vi) are skipped.
         """
         if self.is_genesis:
             # TODO do genesis validation
             return
-        self.verify_without_storage()
-        self.verify_inputs()  # need to run verify_inputs first to check if all inputs exist
-        self.verify_parents()
+        if not pre_verified:
+            self.verify_without_storage()
+        dependencies = self.get_dependencies()
+        # need to run verify_inputs first to check if all inputs exist
+        self.verify_inputs(skip_script=pre_verified, dependencies=dependencies)
+        self.verify_parents(dependencies=dependencies)
         self.verify_sum()
 
     def verify_unsigned_skip_pow(self) -> None:
@@ -274,8 +298,10 @@ class Transaction(BaseTransaction):
         self.verify_number_of_inputs()
         self.verify_number_of_outputs()
         self.verify_outputs()
-        self.verify_inputs(skip_script=True)  # need to run verify_inputs first to check if all inputs exist
-        self.verify_parents()
+        dependencies = self.get_dependencies()
+        # need to run verify_inputs first to check if all inputs exist
+        self.verify_inputs(skip_script=True, dependencies=dependencies)
+        self.verify_parents(dependencies=dependencies)
         self.verify_sum()
 
     def verify_without_storage(self) -> None:
@@ -418,20 +444,25 @@ class Transaction(BaseTransaction):
         self.update_token_info_from_outputs(token_dict)
         self.check_authorities_and_deposit(token_dict)
 
-    def verify_inputs(self, *, skip_script: bool = False) -> None:
-        """Verify inputs signatures and ownership and all inputs actually exist"""
-        from hathor.transaction.storage.exceptions import TransactionDoesNotExist
+    def verify_inputs(self, *, skip_script: bool = False,
+                      dependencies: Optional[Dict[bytes, BaseTransaction]] = None) -> None:
+        """Verify inputs signatures and ownership and all inputs actually exist
+
+        :param dependencies: txs already fetched by `get_dependencies`, the spent txs are fetched when it is None
+        """
+        assert self.storage is not None
+        if dependencies is None:
+            dependencies = self.storage.get_transactions(txin.tx_id for txin in self.inputs)
 
         spent_outputs: Set[Tuple[bytes, int]] = set()
         for input_tx in self.inputs:
-            try:
-                spent_tx = self.get_spent_tx(input_tx)
-                assert spent_tx.hash is not None
-                if input_tx.index >= len(spent_tx.outputs):
-                    raise InexistentInput('Output spent by this input does not exist: {} index {}'.format(
-                        input_tx.tx_id.hex(), input_tx.index))
-            except TransactionDoesNotExist:
+            spent_tx = dependencies.get(input_tx.tx_id)
+            if spent_tx is None:
                 raise InexistentInput('Input tx does not exist: {}'.format(input_tx.tx_id.hex()))
+            assert spent_tx.hash is not None
+            if input_tx.index >= len(spent_tx.outputs):
+                raise InexistentInput('Output spent by this input does not exist: {} index {}'.format(
+                    input_tx.tx_id.hex(), input_tx.index))
 
             if self.timestamp <= spent_tx.timestamp:
                 raise TimestampError('tx={} timestamp={}, spent_tx={} timestamp={}'.format(
@@ -462,19 +493,13 @@ class Transaction(BaseTransaction):
         """
         assert self.storage is not None
         if self._height_cache:
-            # get_best_block_tips is a costly method because there are many orphan blocks in our blockchain
             # This method is called for each input that spends a block and, since we have many transactions
             # that consolidate blocks rewards, this is common.
             # This cache helps to decrease 90% of the verify time for those transactions.
             best_height = self._height_cache
         else:
             # using the timestamp, we get the block immediately before this transaction in the blockchain
-            tips = self.storage.get_best_block_tips(self.timestamp - 1)
-            assert len(tips) > 0
-            tip = self.storage.get_transaction(tips[0])
-            assert tip is not None
-            assert self.timestamp > tip.timestamp
-            best_height = tip.get_metadata().height
+            best_height = self.storage.get_height_best_block_at(self.timestamp - 1)
             self._height_cache = best_height
         spent_height = block.get_metadata().height
         spend_blocks = best_height - spent_height
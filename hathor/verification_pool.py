@@ -0,0 +1,145 @@
+"""
+Copyright 2019 Hathor Labs
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import multiprocessing
+from collections import deque
+from itertools import islice
+from multiprocessing.pool import AsyncResult
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from structlog import get_logger
+
+from hathor.conf import HathorSettings
+from hathor.transaction import BaseTransaction, Transaction
+from hathor.transaction.base_transaction import tx_or_block_from_bytes
+from hathor.transaction.exceptions import TxValidationError
+
+logger = get_logger()
+settings = HathorSettings()
+
+# (tx structs, spent tx structs by hash)
+_Chunk = Tuple[List[bytes], Dict[bytes, bytes]]
+
+
+def _verify_chunk(tx_structs: List[bytes], spent_structs: Dict[bytes, bytes]) -> List[Optional[TxValidationError]]:
+    """ Run the storage independent checks of each tx in the chunk, this is the function executed by the workers.
+
+    Spent txs that are missing from `spent_structs` are skipped, `Transaction.verify_inputs` will report them when
+    the tx is verified against the storage.
+    """
+    spent_txs = {tx_hash: tx_or_block_from_bytes(struct) for tx_hash, struct in spent_structs.items()}
+    results: List[Optional[TxValidationError]] = []
+    for struct in tx_structs:
+        tx = tx_or_block_from_bytes(struct)
+        if tx.is_genesis:
+            results.append(None)
+            continue
+        try:
+            tx.verify_without_storage()
+            if isinstance(tx, Transaction):
+                for txin in tx.inputs:
+                    spent_tx = spent_txs.get(txin.tx_id)
+                    if spent_tx is None or txin.index >= len(spent_tx.outputs):
+                        continue
+                    tx.verify_script(txin, spent_tx)
+        except TxValidationError as e:
+            results.append(e)
+        else:
+            results.append(None)
+    return results
+
+
+class VerificationPool:
+    """ Verify transactions on a pool of processes.
+
+    Only the checks that do not depend on the state of the DAG are executed here: proof-of-work, outputs and input
+    scripts (which includes all the signatures). These are by far the most expensive part of `tx.verify()` and can
+    run out of order. Everything else (parents, timestamps, sums, consensus and metadata) must still be done
+    sequentially by the caller, which should then call `tx.verify(pre_verified=True)`.
+
+    Transactions are sent to the workers in chunks, and the results are yielded in the same order as the input, so
+    the caller can process the topological stream sequentially while the workers run ahead.
+    """
+
+    def __init__(self, processes: int, *, chunk_size: int = settings.VERIFICATION_POOL_CHUNK_SIZE,
+                 max_pending_chunks: Optional[int] = None) -> None:
+        assert processes > 0
+        assert chunk_size > 0
+        self.log = logger.new()
+        self.processes = processes
+        self.chunk_size = chunk_size
+        # Limit how far ahead of the caller we can go, otherwise the whole stream could end up in memory.
+        self.max_pending_chunks = max_pending_chunks or 2 * processes
+
+    def run(self, txs: Iterable[BaseTransaction]) -> Iterator[Tuple[BaseTransaction, Optional[TxValidationError]]]:
+        """ Yield `(tx, error)` for each tx in `txs`, keeping the order, `error` is None when the checks passed.
+
+        Genesis txs are not verified, just like in `tx.verify()`.
+        """
+        self.log.info('start verification pool', processes=self.processes, chunk_size=self.chunk_size)
+        pool = multiprocessing.Pool(self.processes)
+        pending: Deque[Tuple[List[BaseTransaction], AsyncResult]] = deque()
+        # Structs of the txs that were sent to the workers but not yielded yet, they may not be in the storage.
+        in_flight: Dict[bytes, bytes] = {}
+        it = iter(txs)
+        try:
+            while True:
+                chunk = list(islice(it, self.chunk_size))
+                if not chunk:
+                    break
+                pending.append((chunk, pool.apply_async(_verify_chunk, self._serialize_chunk(chunk, in_flight))))
+                if len(pending) >= self.max_pending_chunks:
+                    yield from self._pop_results(pending, in_flight)
+            while pending:
+                yield from self._pop_results(pending, in_flight)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _pop_results(self, pending: Deque[Tuple[List[BaseTransaction], AsyncResult]], in_flight: Dict[bytes, bytes]
+                     ) -> Iterator[Tuple[BaseTransaction, Optional[TxValidationError]]]:
+        chunk, async_result = pending.popleft()
+        errors = async_result.get()
+        for tx in chunk:
+            assert tx.hash is not None
+            in_flight.pop(tx.hash, None)
+        yield from zip(chunk, errors)
+
+    def _serialize_chunk(self, chunk: List[BaseTransaction], in_flight: Dict[bytes, bytes]) -> _Chunk:
+        """ Serialize the txs and the txs they spend, which are looked up in `in_flight` before the storage, so the
+        txs that come from a stream (and are saved only after they are verified) can be verified too.
+        """
+        from hathor.transaction.storage.exceptions import TransactionDoesNotExist
+
+        tx_structs: List[bytes] = []
+        spent_structs: Dict[bytes, bytes] = {}
+        for tx in chunk:
+            assert tx.hash is not None
+            tx_struct = tx.get_struct()
+            tx_structs.append(tx_struct)
+            for txin in tx.inputs:
+                if txin.tx_id in spent_structs:
+                    continue
+                spent_struct = in_flight.get(txin.tx_id)
+                if spent_struct is None:
+                    try:
+                        spent_struct = tx.get_spent_tx(txin).get_struct()
+                    except TransactionDoesNotExist:
+                        continue
+                spent_structs[txin.tx_id] = spent_struct
+            in_flight[tx.hash] = tx_struct
+        return tx_structs, spent_structs
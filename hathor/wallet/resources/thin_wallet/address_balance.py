@@ -1,6 +1,6 @@
 import json
 from collections import defaultdict
-from typing import TYPE_CHECKING, Any, Dict
+from typing import Any, Dict
 
 from twisted.web import resource
 from twisted.web.http import Request
@@ -9,12 +9,8 @@ from hathor.api_util import get_missing_params_msg, set_cors
 from hathor.cli.openapi_files.register import register_resource
 from hathor.conf import HathorSettings
 from hathor.crypto.util import decode_address
-from hathor.transaction.scripts import parse_address_script
 from hathor.wallet.exceptions import InvalidAddress
 
-if TYPE_CHECKING:
-    from hathor.transaction import TxOutput
-
 settings = HathorSettings()
 
 
@@ -44,18 +40,6 @@ class AddressBalanceResource(resource.Resource):
     def __init__(self, manager):
         self.manager = manager
 
-    def has_address(self, output: 'TxOutput', requested_address: str) -> bool:
-        """ Check if output address is the same as requested_address
-        """
-        if output.is_token_authority():
-            return False
-
-        script_type_out = parse_address_script(output.script)
-        if script_type_out:
-            if script_type_out.address == requested_address:
-                return True
-        return False
-
     def render_GET(self, request: Request) -> bytes:
         """ GET request for /thin_wallet/address_balance/
             Expects 'address' as request args
@@ -86,26 +70,11 @@ class AddressBalanceResource(resource.Resource):
                 'message': 'Invalid \'address\' parameter'
             }).encode('utf-8')
 
+        # The balances are kept by the wallet index, only the txs that are not voided are counted.
         tokens_data: Dict[bytes, TokenData] = defaultdict(TokenData)
-        tx_hashes = wallet_index.get_from_address(requested_address)
-        for tx_hash in tx_hashes:
-            tx = self.manager.tx_storage.get_transaction(tx_hash)
-            meta = tx.get_metadata(force_reload=True)
-            if not meta.voided_by:
-                # We consider the spent/received values only if is not voided by
-                for tx_input in tx.inputs:
-                    tx2 = self.manager.tx_storage.get_transaction(tx_input.tx_id)
-                    tx2_output = tx2.outputs[tx_input.index]
-                    if self.has_address(tx2_output, requested_address):
-                        # We just consider the address that was requested
-                        token_uid = tx2.get_token_uid(tx2_output.get_token_index())
-                        tokens_data[token_uid].spent += tx2_output.value
-
-                for tx_output in tx.outputs:
-                    if self.has_address(tx_output, requested_address):
-                        # We just consider the address that was requested
-                        token_uid = tx.get_token_uid(tx_output.get_token_index())
-                        tokens_data[token_uid].received += tx_output.value
+        for token_uid, balance in wallet_index.get_balances(requested_address).items():
+            tokens_data[token_uid].received = balance.received
+            tokens_data[token_uid].spent = balance.spent
 
         return_tokens_data: Dict[str, Dict[str, Any]] = {}
         for token_uid in tokens_data.keys():
@@ -126,7 +95,7 @@ class AddressBalanceResource(resource.Resource):
 
         data = {
             'success': True,
-            'total_transactions': len(tx_hashes),
+            'total_transactions': len(wallet_index.get_from_address(requested_address)),
             'tokens_data': return_tokens_data
         }
         return json.dumps(data, indent=4).encode('utf-8')
@@ -8,6 +8,7 @@ from hathor.api_util import get_missing_params_msg, set_cors
 from hathor.cli.openapi_files.register import register_resource
 from hathor.conf import HathorSettings
 from hathor.crypto.util import decode_address
+from hathor.transaction.storage.exceptions import TransactionDoesNotExist
 from hathor.wallet.exceptions import InvalidAddress
 
 settings = HathorSettings()
@@ -117,12 +118,7 @@ class AddressHistoryResource(resource.Resource):
 
         history = []
         seen: Set[bytes] = set()
-        # XXX In this algorithm we need to sort all transactions of an address
-        # and find one specific (in case of a pagination request)
-        # so if this address has many txs, this could become slow
-        # I've done some tests with 10k txs in one address and the request
-        # returned in less than 50ms, so we will move forward with it for now
-        # but this could be improved in the future
+        wallet_index = self.manager.tx_storage.wallet_index
         for idx, address_to_decode in enumerate(addresses):
             address = address_to_decode.decode('utf-8')
             try:
@@ -133,25 +129,25 @@ class AddressHistoryResource(resource.Resource):
                     'message': 'The address {} is invalid'.format(address)
                 }).encode('utf-8')
 
-            hashes = self.manager.tx_storage.wallet_index.get_sorted_from_address(address)
-            start_index = 0
+            # The txs of the address are sorted by timestamp and hash, so we can continue from the hash
+            hashes = wallet_index.iter_from_address(address)
             if ref_hash_bytes and idx == 0:
                 # It's not the first request, so we must continue from the hash
                 # but we do it only for the first address
                 try:
-                    # Find index where the hash is
-                    start_index = hashes.index(ref_hash_bytes)
-                except ValueError:
+                    ref_tx = self.manager.tx_storage.get_transaction(ref_hash_bytes)
+                except TransactionDoesNotExist:
+                    ref_tx = None
+                if ref_tx is None or not wallet_index.has_transaction(address, ref_tx):
                     # ref_hash is not in the list
                     return json.dumps({
                         'success': False,
                         'message': 'Hash {} is not a transaction from the address {}.'.format(ref_hash, address)
                     }, indent=4).encode('utf-8')
+                hashes = wallet_index.iter_from_address(address, ref_tx.timestamp, ref_hash_bytes)
 
-            # Slice the hashes array from the start_index
-            to_iterate = hashes[start_index:]
             did_break = False
-            for index, tx_hash in enumerate(to_iterate):
+            for tx_hash in hashes:
                 if total_added == settings.MAX_TX_ADDRESSES_HISTORY:
                     # If already added the max number of elements possible, then break
                     # I need to add this if at the beginning of the loop to handle the case
@@ -178,10 +174,9 @@ class AddressHistoryResource(resource.Resource):
             if did_break:
                 # We stopped in the middle of the txs of this address
                 # So we return that we still have more data to send
-                break_index = start_index + index
                 has_more = True
                 # The hash to start the search and which address this hash belongs
-                first_hash = hashes[break_index].hex()
+                first_hash = tx_hash.hex()
                 first_address = address
                 break
 
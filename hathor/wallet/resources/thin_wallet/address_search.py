@@ -1,5 +1,4 @@
 import json
-from typing import TYPE_CHECKING
 
 from twisted.web import resource
 from twisted.web.http import Request
@@ -8,12 +7,9 @@ from hathor.api_util import get_missing_params_msg, set_cors
 from hathor.cli.openapi_files.register import register_resource
 from hathor.conf import HathorSettings
 from hathor.crypto.util import decode_address
-from hathor.transaction.scripts import parse_address_script
+from hathor.transaction.storage.exceptions import TransactionDoesNotExist
 from hathor.wallet.exceptions import InvalidAddress
 
-if TYPE_CHECKING:
-    from hathor.transaction import BaseTransaction
-
 settings = HathorSettings()
 
 
@@ -28,31 +24,6 @@ class AddressSearchResource(resource.Resource):
     def __init__(self, manager):
         self.manager = manager
 
-    def has_token_and_address(self, tx: 'BaseTransaction', address: str, token: bytes) -> bool:
-        """ Validate if transaction has any input or output with the
-            address and token sent as parameter
-        """
-        for tx_input in tx.inputs:
-            spent_tx = tx.get_spent_tx(tx_input)
-            spent_output = spent_tx.outputs[tx_input.index]
-
-            input_token_uid = spent_tx.get_token_uid(spent_output.get_token_index())
-
-            script_type_out = parse_address_script(spent_output.script)
-            if script_type_out:
-                if script_type_out.address == address and input_token_uid == token:
-                    return True
-
-        for tx_output in tx.outputs:
-            output_token_uid = tx.get_token_uid(tx_output.get_token_index())
-
-            script_type_out = parse_address_script(tx_output.script)
-            if script_type_out:
-                if script_type_out.address == address and output_token_uid == token:
-                    return True
-
-        return False
-
     def render_GET(self, request: Request) -> bytes:
         """ GET request for /thin_wallet/address_search/
             Expects 'address' and 'count' as required request args
@@ -114,20 +85,7 @@ class AddressSearchResource(resource.Resource):
                     'message': 'Token uid is not a valid hexadecimal value.'
                 }).encode('utf-8')
 
-        hashes = wallet_index.get_from_address(address)
-        # XXX To do a timestamp sorting, so the pagination works better
-        # we must get all transactions and sort them
-        # This is not optimal for performance
-        transactions = []
-        for tx_hash in hashes:
-            tx = self.manager.tx_storage.get_transaction(tx_hash)
-            if token_uid_bytes and not self.has_token_and_address(tx, address, token_uid_bytes):
-                # Request wants to filter by token but tx does not have this token
-                # so we don't add it to the transactions array
-                continue
-            transactions.append(tx.to_json_extended())
-
-        sorted_transactions = sorted(transactions, key=lambda tx: tx['timestamp'], reverse=True)
+        # The txs of the address (or only the ones with the token) are sorted by timestamp and hash in the index
         if b'hash' in request.args:
             # It's a paginated request, so 'page' must also be in request.args
             if b'page' not in request.args:
@@ -142,11 +100,11 @@ class AddressSearchResource(resource.Resource):
                 }, indent=4).encode('utf-8')
 
             ref_hash = request.args[b'hash'][0].decode('utf-8')
-            # Index where the reference hash is
-            for ref_index, tx in enumerate(sorted_transactions):
-                if tx['tx_id'] == ref_hash:
-                    break
-            else:
+            try:
+                ref_tx = self.manager.tx_storage.get_transaction(bytes.fromhex(ref_hash))
+            except (ValueError, TransactionDoesNotExist):
+                ref_tx = None
+            if ref_tx is None or not wallet_index.has_transaction(address, ref_tx, token_uid_bytes):
                 # ref_hash is not in the list
                 return json.dumps({
                     'success': False,
@@ -155,29 +113,24 @@ class AddressSearchResource(resource.Resource):
 
             if page == 'next':
                 # User clicked on 'Next' button, so the ref_hash is the last hash of the list
-                # So I need to get the transactions after the ref
-                start_index = ref_index + 1
-                end_index = start_index + count
-                ret_transactions = sorted_transactions[start_index:end_index]
-                # If has more transactions after this
-                has_more = len(sorted_transactions) > end_index
+                # So I need to get the transactions after the ref, which are older
+                hashes, has_more = wallet_index.get_older_transactions(address, ref_tx.timestamp, ref_tx.hash, count,
+                                                                       token_uid_bytes)
             else:
                 # User clicked on 'Previous' button, so the ref_hash is the first hash of the list
-                # So I need to get the transactions before the ref
-                end_index = ref_index
-                start_index = max(end_index - count, 0)
-                ret_transactions = sorted_transactions[start_index:end_index]
-                # If has more transactions before this
-                has_more = start_index > 0
+                # So I need to get the transactions before the ref, which are newer
+                hashes, has_more = wallet_index.get_newer_transactions(address, ref_tx.timestamp, ref_tx.hash, count,
+                                                                       token_uid_bytes)
         else:
-            ret_transactions = sorted_transactions[:count]
-            has_more = len(sorted_transactions) > count
+            hashes, has_more = wallet_index.get_newest_transactions(address, count, token_uid_bytes)
+
+        ret_transactions = [self.manager.tx_storage.get_transaction(tx_hash).to_json_extended() for tx_hash in hashes]
 
         data = {
             'success': True,
             'transactions': ret_transactions,
             'has_more': has_more,
-            'total': len(sorted_transactions),
+            'total': wallet_index.get_transactions_count(address, token_uid_bytes),
         }
         return json.dumps(data, indent=4).encode('utf-8')
 
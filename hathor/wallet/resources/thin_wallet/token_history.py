@@ -24,6 +24,14 @@ class TokenHistoryResource(resource.Resource):
         self.manager = manager
 
     def render_GET(self, request: Request) -> bytes:
+        """ Cached responses of `_render_GET`, they are dropped when the DAG changes (see `ResponseCache`)
+        """
+        if not self.manager.tx_storage.tokens_index:
+            # The response is an error, which is not cached
+            return self._render_GET(request)
+        return self.manager.response_cache.render('thin_wallet/token_history', request, self._render_GET)
+
+    def _render_GET(self, request: Request) -> bytes:
         """ GET request for /thin_wallet/token_history/
 
             Expects as GET parameter of the queried token:
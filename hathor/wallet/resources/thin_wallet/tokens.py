@@ -64,14 +64,14 @@ class TokenResource(resource.Resource):
         # XXX For now we only set a fixed limit of 200 tokens to return
 
         # Get all tokens
-        all_tokens = self.manager.tx_storage.tokens_index.tokens
+        all_tokens = self.manager.tx_storage.tokens_index.get_all_tokens()
 
         tokens = []
         count = 0
         limit = 200
         truncated = False
-        for uid, token_info in all_tokens.items():
-            if uid is settings.HATHOR_TOKEN_UID:
+        for uid, token_info in all_tokens:
+            if uid == settings.HATHOR_TOKEN_UID:
                 continue
 
             if count >= limit:
@@ -83,6 +83,9 @@ class HathorAdminWebsocketFactory(WebSocketServerFactory):
 
         self.metrics = metrics
         self.wallet_index = wallet_index
+        if self.wallet_index is not None:
+            # Only the history of the addresses with subscribers is serialized and published
+            self.wallet_index.address_filter = self.address_connections
 
         self.is_running = False
 
@@ -89,3 +89,27 @@ class ManagerInitializationTestCase(unittest.TestCase):
         # a new manager must be successfully initialized
         self.tx_storage._reset_cache()
         self.create_peer('testnet', tx_storage=self.tx_storage)
+
+    def test_init_verification_pool(self):
+        """A new manager must be successfully initialized when the pow and scripts are verified on a process pool.
+        """
+        self.tx_storage._reset_cache()
+        manager = self.create_peer('testnet', tx_storage=self.tx_storage, verification_processes=2)
+
+        seen = set(tx.hash for tx in manager.tx_storage.get_all_transactions())
+        self.assertEqual(seen, self.all_hashes)
+        self.assertConsensusValid(manager)
+
+    def test_init_verification_pool_invalid_script(self):
+        """The errors found by the workers must interrupt the initialization.
+        """
+        from hathor.transaction.exceptions import InvalidInputData
+
+        tx = self.tx_list[-1].clone()
+        tx.inputs[0].data = b'invalid'
+        tx.resolve()
+        self.tx_storage.save_transaction(tx)
+
+        self.tx_storage._reset_cache()
+        with self.assertRaises(InvalidInputData):
+            self.create_peer('testnet', tx_storage=self.tx_storage, verification_processes=2)
@@ -0,0 +1,92 @@
+from io import BytesIO
+
+from hathor.manager import HathorManager
+from hathor.snapshot import InvalidSnapshot, export_snapshot, import_snapshot
+from hathor.transaction.storage import TransactionMemoryStorage
+from tests import unittest
+from tests.utils import add_blocks_unlock_reward, add_new_blocks, add_new_transactions
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tx_storage = TransactionMemoryStorage()
+        self.manager = self.create_peer('testnet', tx_storage=self.tx_storage)
+        add_new_blocks(self.manager, 1, advance_clock=15)
+        add_blocks_unlock_reward(self.manager)
+        self.tx_list = add_new_transactions(self.manager, 5, advance_clock=15)
+        add_new_blocks(self.manager, 3, advance_clock=15)
+
+    def _export(self, tx_storage=None):
+        fp = BytesIO()
+        count = export_snapshot(tx_storage or self.tx_storage, fp)
+        self.assertEqual(count, self.tx_storage.get_count_tx_blocks())
+        return fp.getvalue()
+
+    def test_export_import(self):
+        data = self._export()
+        tx_storage = TransactionMemoryStorage()
+        self.assertEqual(import_snapshot(tx_storage, BytesIO(data)), self.tx_storage.get_count_tx_blocks())
+        self.assertFalse(tx_storage.is_running_full_verification())
+
+        for tx in self.tx_storage.get_all_transactions():
+            tx2 = tx_storage.get_transaction(tx.hash)
+            self.assertEqual(tx, tx2)
+            self.assertEqual(tx.get_metadata(), tx2.get_metadata(force_reload=True))
+
+        # A node starts from the imported storage without syncing.
+        tx_storage._reset_cache()
+        manager = self.create_peer('testnet', tx_storage=tx_storage)
+        self.assertTipsEqual(self.manager, manager)
+        self.assertConsensusValid(manager)
+
+    def test_import_verification_pool(self):
+        data = self._export()
+        tx_storage = TransactionMemoryStorage()
+        import_snapshot(tx_storage, BytesIO(data), verification_processes=2)
+        self.assertEqual(tx_storage.get_count_tx_blocks(), self.tx_storage.get_count_tx_blocks())
+
+    def test_import_verification_pool_invalid_script(self):
+        tx = self.tx_list[-1].create_from_struct(self.tx_list[-1].get_struct(), storage=self.tx_storage)
+        tx.inputs[0].data = b'invalid'
+        tx.resolve()
+        self.tx_storage.save_transaction(tx)
+        data = self._export()
+
+        # The metadata is trusted, so the invalid tx is only found when the txs are verified again.
+        import_snapshot(TransactionMemoryStorage(), BytesIO(data))
+        with self.assertRaises(InvalidSnapshot):
+            import_snapshot(TransactionMemoryStorage(), BytesIO(data), verification_processes=2)
+
+    def test_import_invalid_file(self):
+        data = self._export()
+        with self.assertRaises(InvalidSnapshot):
+            import_snapshot(TransactionMemoryStorage(), BytesIO(data[:-10]))
+        with self.assertRaises(InvalidSnapshot):
+            import_snapshot(TransactionMemoryStorage(), BytesIO(b'not a snapshot'))
+
+        # Any change is found, at the latest by the digest of the END record.
+        for position in range(0, len(data), 97):
+            corrupted = bytearray(data)
+            corrupted[position] ^= 0x01
+            with self.assertRaises(InvalidSnapshot):
+                import_snapshot(TransactionMemoryStorage(), BytesIO(bytes(corrupted)))
+
+    def test_import_truncated_file(self):
+        data = self._export()
+        tx_storage = TransactionMemoryStorage()
+        with self.assertRaises(InvalidSnapshot):
+            import_snapshot(tx_storage, BytesIO(data[:len(data) // 2]))
+
+        # The txs before the end of the file were saved without any checkpoint, so the storage is not reliable.
+        self.assertGreater(tx_storage.get_count_tx_blocks(), len(tx_storage.get_all_genesis()))
+        self.assertTrue(tx_storage.is_running_full_verification())
+        manager = HathorManager(self.clock, tx_storage=tx_storage)
+        manager._full_verification = False
+        with self.assertRaises(SystemExit):
+            manager.start()
+
+    def test_import_non_empty_storage(self):
+        data = self._export()
+        with self.assertRaises(InvalidSnapshot):
+            import_snapshot(self.tx_storage, BytesIO(data))
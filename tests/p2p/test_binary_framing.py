@@ -0,0 +1,85 @@
+from hathor.conf import HathorSettings
+from hathor.p2p.framing import FrameDecoder, FramingError, encode_frame
+from hathor.p2p.messages import ProtocolMessages
+from tests import unittest
+from tests.utils import FakeConnection, add_blocks_unlock_reward, add_new_blocks, add_new_transactions
+
+settings = HathorSettings()
+
+
+class BinaryFramingTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.network = 'testnet'
+        self.capabilities = [settings.CAPABILITY_WHITELIST, settings.CAPABILITY_BINARY_FRAMING]
+
+        self.manager1 = self.create_peer(self.network, unlock_wallet=True, capabilities=self.capabilities)
+        add_new_blocks(self.manager1, 5, advance_clock=15)
+        add_blocks_unlock_reward(self.manager1)
+        add_new_transactions(self.manager1, 10, advance_clock=15)
+        add_new_blocks(self.manager1, 5, advance_clock=15)
+
+    def _sync(self, capabilities):
+        manager2 = self.create_peer(self.network, capabilities=capabilities)
+        conn = FakeConnection(self.manager1, manager2)
+        for _ in range(10000):
+            if conn.is_empty():
+                break
+            conn.run_one_step()
+            self.clock.advance(0.1)
+
+        self.assertEqual(conn.proto1.state.state_name, 'READY')
+        self.assertEqual(conn.proto2.state.state_name, 'READY')
+        self.assertTipsEqual(self.manager1, manager2)
+        self.assertConsensusEqual(self.manager1, manager2)
+        return conn
+
+    def test_decoder(self):
+        messages = [
+            (ProtocolMessages.PING, ''),
+            (ProtocolMessages.GET_DATA, '00' * 32),
+            (ProtocolMessages.DATA, 'AAECAw=='),
+            (ProtocolMessages.NOT_FOUND, 'not hex'),
+            (ProtocolMessages.GET_TIPS, '{"timestamp": 1}'),
+            (ProtocolMessages.GET_DATA_BATCH, '00' * 32 + 'ff' * 32),
+            (ProtocolMessages.DATA_BATCH, 'AAECAw== AAE='),
+        ]
+        data = b''.join(encode_frame(cmd, payload) for cmd, payload in messages)
+
+        # Frames split in arbitrary chunks must be reassembled.
+        decoder = FrameDecoder(65536)
+        received = []
+        for i in range(0, len(data), 3):
+            received.extend((cmd, payload) for _, cmd, payload in decoder.feed(data[i:i + 3]))
+        self.assertEqual(received, messages)
+
+        with self.assertRaises(FramingError):
+            list(FrameDecoder(10).feed(encode_frame(ProtocolMessages.GET_TIPS, '{"timestamp": 1}')))
+        with self.assertRaises(FramingError):
+            list(FrameDecoder(65536).feed(bytes.fromhex('0000000163')))
+
+    def test_sync(self):
+        conn = self._sync(self.capabilities)
+        self.assertTrue(conn.proto1._binary_sending)
+        self.assertTrue(conn.proto2._binary_sending)
+
+    def test_sync_without_capability(self):
+        # The peers must fall back to the text protocol when only one of them supports the binary framing.
+        conn = self._sync([settings.CAPABILITY_WHITELIST])
+        self.assertFalse(conn.proto1._binary_sending)
+        self.assertFalse(conn.proto2._binary_sending)
+
+    def test_sent_bytes(self):
+        binary_conn = self._sync(self.capabilities)
+        text_conn = self._sync([settings.CAPABILITY_WHITELIST])
+        self.assertLess(binary_conn.proto1.metrics.sent_bytes, text_conn.proto1.metrics.sent_bytes)
+
+    def test_invalid_frame(self):
+        manager2 = self.create_peer(self.network, capabilities=self.capabilities)
+        conn = FakeConnection(self.manager1, manager2)
+        for _ in range(3):  # HELLO, PEER-ID, READY
+            conn.run_one_step()
+        self.assertEqual(conn.proto1.state.state_name, 'READY')
+
+        conn.proto1.dataReceived(bytes.fromhex('0000000163'))
+        self.assertTrue(conn.tr1.disconnecting)
@@ -0,0 +1,102 @@
+from hathor.conf import HathorSettings
+from hathor.p2p.node_sync import KnownInventory
+from tests import unittest
+from tests.utils import FakeConnection, add_new_block
+
+settings = HathorSettings()
+
+
+class InventoryTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.network = 'testnet'
+
+    def _run_until_empty(self, *conns):
+        for _ in range(1000):
+            if all(conn.is_empty() for conn in conns):
+                break
+            for conn in conns:
+                conn.run_one_step()
+            self.clock.advance(0.1)
+
+    def _sent_commands(self, conn, tr):
+        """ Run the connection until it is empty and return the commands sent through the transport.
+        """
+        cmds = []
+        for _ in range(1000):
+            value = tr.value()
+            cmds.extend(line.partition(b' ')[0] for line in value.splitlines())
+            if conn.is_empty():
+                break
+            conn.run_one_step()
+            self.clock.advance(0.1)
+        return cmds
+
+    def test_known_inventory(self):
+        known = KnownInventory(2)
+        known.add(b'a')
+        known.add(b'b')
+        known.add(b'a')
+        known.add(b'c')
+        self.assertEqual(len(known), 2)
+        self.assertIn(b'a', known)
+        self.assertNotIn(b'b', known)
+        self.assertIn(b'c', known)
+
+    def test_announce(self):
+        manager1 = self.create_peer(self.network)
+        manager2 = self.create_peer(self.network)
+        conn = FakeConnection(manager1, manager2)
+        self._run_until_empty(conn)
+
+        block = add_new_block(manager1, advance_clock=1)
+        node_sync1 = conn.proto1.state.get_sync_plugin()
+        node_sync2 = conn.proto2.state.get_sync_plugin()
+        self.assertTrue(node_sync1.supports_inv())
+        self.assertIn(block.hash, node_sync1.known_inventory)
+
+        # Only the hash is sent, the body is sent when the peer requests it.
+        self.clock.advance(0)
+        self.assertEqual(conn.peek_tr1_value(), b'INV ' + block.hash_hex.encode('ascii') + b'\r\n')
+        self._run_until_empty(conn)
+        self.assertTipsEqual(manager1, manager2)
+        self.assertIn(block.hash, node_sync2.known_inventory)
+        self.assertEqual(len(node_sync2.announced_requests), 0)
+
+        # manager2 knows manager1 has the block, so it is not sent back.
+        self.assertEqual(conn.proto1.metrics.discarded_blocks, 0)
+        self.assertEqual(conn.proto2.metrics.received_blocks, 1)
+
+    def test_announce_many_peers(self):
+        manager1 = self.create_peer(self.network)
+        manager2 = self.create_peer(self.network)
+        manager3 = self.create_peer(self.network)
+        conn12 = FakeConnection(manager1, manager2)
+        conn13 = FakeConnection(manager1, manager3)
+        conn23 = FakeConnection(manager2, manager3)
+        self._run_until_empty(conn12, conn13, conn23)
+
+        add_new_block(manager1, advance_clock=1)
+        self._run_until_empty(conn12, conn13, conn23)
+        self.assertTipsEqual(manager1, manager2)
+        self.assertTipsEqual(manager1, manager3)
+
+        # The block body crosses each link at most once.
+        for conn in [conn12, conn13, conn23]:
+            for proto in [conn.proto1, conn.proto2]:
+                self.assertEqual(proto.metrics.discarded_blocks, 0)
+
+    def test_no_capability(self):
+        # Peers without the capability keep receiving the full txs.
+        manager1 = self.create_peer(self.network)
+        manager2 = self.create_peer(self.network, capabilities=[settings.CAPABILITY_WHITELIST])
+        conn = FakeConnection(manager1, manager2)
+        self._run_until_empty(conn)
+
+        block = add_new_block(manager1, advance_clock=1)
+        self.assertFalse(conn.proto1.state.get_sync_plugin().supports_inv())
+        cmds = self._sent_commands(conn, conn.tr1)
+        self.assertIn(b'DATA', cmds)
+        self.assertNotIn(b'INV', cmds)
+        self.assertTipsEqual(manager1, manager2)
+        self.assertIn(block.hash, conn.proto2.state.get_sync_plugin().known_inventory)
@@ -5,6 +5,8 @@ from twisted.internet.defer import inlineCallbacks
 from twisted.python.failure import Failure
 
 from hathor.conf import HathorSettings
+from hathor.p2p.messages import ProtocolMessages
+from hathor.p2p.outbound import MessagePriority
 from hathor.p2p.peer_id import PeerId
 from hathor.p2p.protocol import HathorProtocol
 from tests import unittest
@@ -155,8 +157,10 @@ class HathorProtocolTestCase(unittest.TestCase):
         self.conn.run_one_step()  # PEER-ID
         self.conn.run_one_step()  # READY
         self.conn.run_one_step()  # GET-PEERS
-        self.conn.run_one_step()  # GET-TIPS
+        self.conn.run_one_step()  # GET-BLOCKS
         self.conn.run_one_step()  # PEERS
+        self.conn.run_one_step()  # BLOCKS
+        self.conn.run_one_step()  # GET-TIPS
         self.conn.run_one_step()  # TIPS
         invalid_payload = {'id': '123', 'entrypoints': ['tcp://localhost:1234']}
         yield self._send_cmd(self.conn.proto1, 'PEER-ID', json.dumps(invalid_payload))
@@ -248,13 +252,19 @@ class HathorProtocolTestCase(unittest.TestCase):
         self._check_result_only_cmd(self.conn.peek_tr1_value(), b'GET-PEERS')
         self._check_result_only_cmd(self.conn.peek_tr2_value(), b'GET-PEERS')
         self.conn.run_one_step()  # GET-PEERS
-        self._check_result_only_cmd(self.conn.peek_tr1_value(), b'GET-TIPS')
-        self._check_result_only_cmd(self.conn.peek_tr2_value(), b'GET-TIPS')
-        self.conn.run_one_step()  # GET-TIPS
+        self._check_result_only_cmd(self.conn.peek_tr1_value(), b'GET-BLOCKS')
+        self._check_result_only_cmd(self.conn.peek_tr2_value(), b'GET-BLOCKS')
+        self.conn.run_one_step()  # GET-BLOCKS
         self.assertIsConnected()
         self._check_result_only_cmd(self.conn.peek_tr1_value(), b'PEERS')
         self._check_result_only_cmd(self.conn.peek_tr2_value(), b'PEERS')
         self.conn.run_one_step()  # PEERS
+        self._check_result_only_cmd(self.conn.peek_tr1_value(), b'BLOCKS')
+        self._check_result_only_cmd(self.conn.peek_tr2_value(), b'BLOCKS')
+        self.conn.run_one_step()  # BLOCKS
+        self._check_result_only_cmd(self.conn.peek_tr1_value(), b'GET-TIPS')
+        self._check_result_only_cmd(self.conn.peek_tr2_value(), b'GET-TIPS')
+        self.conn.run_one_step()  # GET-TIPS
         self._check_result_only_cmd(self.conn.peek_tr1_value(), b'TIPS')
         self._check_result_only_cmd(self.conn.peek_tr2_value(), b'TIPS')
         self.conn.run_one_step()  # TIPS
@@ -265,8 +275,10 @@ class HathorProtocolTestCase(unittest.TestCase):
         self.conn.run_one_step()  # PEER-ID
         self.conn.run_one_step()  # READY
         self.conn.run_one_step()  # GET-PEERS
-        self.conn.run_one_step()  # GET-TIPS
+        self.conn.run_one_step()  # GET-BLOCKS
         self.conn.run_one_step()  # PEERS
+        self.conn.run_one_step()  # BLOCKS
+        self.conn.run_one_step()  # GET-TIPS
         self.conn.run_one_step()  # TIPS
         self.assertIsConnected()
         self.clock.advance(5)
@@ -330,11 +342,96 @@ class HathorProtocolTestCase(unittest.TestCase):
         self.conn.run_one_step()  # PEER-ID
         self.conn.run_one_step()  # READY
         self.conn.run_one_step()  # GET-PEERS
-        self.conn.run_one_step()  # GET-TIPS
+        self.conn.run_one_step()  # GET-BLOCKS
         self.conn.run_one_step()  # PEERS
+        self.conn.run_one_step()  # BLOCKS
+        self.conn.run_one_step()  # GET-TIPS
         self.conn.run_one_step()  # TIPS
         self.assertIsConnected()
         missing_tx = '00000000228dfcd5dec1c9c6263f6430a5b4316bb9e3decb9441a6414bfd8697'
         yield self._send_cmd(self.conn.proto1, 'GET-DATA', missing_tx)
         self._check_result_only_cmd(self.conn.peek_tr1_value(), b'NOT-FOUND')
         self.conn.run_one_step()
+
+    @inlineCallbacks
+    def test_get_data_batch(self):
+        self.conn.run_one_step()  # HELLO
+        self.conn.run_one_step()  # PEER-ID
+        self.conn.run_one_step()  # READY
+        self.conn.run_one_step()  # GET-PEERS
+        self.conn.run_one_step()  # GET-BLOCKS
+        self.conn.run_one_step()  # PEERS
+        self.conn.run_one_step()  # BLOCKS
+        self.conn.run_one_step()  # GET-TIPS
+        self.conn.run_one_step()  # TIPS
+        self.assertIsConnected()
+        self.conn.tr1.clear()
+        genesis = list(self.manager1.tx_storage.get_all_genesis())
+        missing_tx = 'ff' * 32
+        payload = genesis[0].hash_hex + missing_tx + genesis[1].hash_hex
+        yield self._send_cmd(self.conn.proto1, 'GET-DATA-BATCH', payload)
+
+        result = self.conn.tr1.value()
+        lines = [line.partition(b' ') for line in result.split(b'\r\n') if line]
+        self.assertEqual([cmd for cmd, _, _ in lines], [b'DATA-BATCH', b'NOT-FOUND'])
+        self.assertEqual(len(lines[0][2].split(b' ')), 2)
+        self.assertEqual(lines[1][2], missing_tx.encode('ascii'))
+        self.assertIsConnected()
+
+        # Invalid number of bytes.
+        self.conn.tr1.clear()
+        yield self._send_cmd(self.conn.proto1, 'GET-DATA-BATCH', 'abcd')
+        self._check_result_only_cmd(self.conn.peek_tr1_value(), b'ERROR')
+        self.assertTrue(self.conn.tr1.disconnecting)
+
+    def _sent_cmds(self, transport):
+        return [line.partition(b' ')[0] for line in transport.value().split(b'\r\n') if line]
+
+    def test_outbound_queue_priority(self):
+        proto = self.conn.proto1
+        self.conn.tr1.clear()
+
+        # The messages wait while the transport is paused.
+        proto.outbound.pauseProducing()
+        proto.send_message(ProtocolMessages.INV, 'ff' * 32)
+        proto.send_message(ProtocolMessages.GET_TIPS)
+        proto.send_message(ProtocolMessages.DATA, 'abcd', MessagePriority.BLOCKS)
+        proto.send_message(ProtocolMessages.PING)
+        self.assertEqual(self.conn.tr1.value(), b'')
+        self.assertEqual(proto.metrics.queued_messages, 4)
+
+        # And they are sent in priority order when it resumes.
+        proto.outbound.resumeProducing()
+        self.assertEqual(self._sent_cmds(self.conn.tr1), [b'PING', b'DATA', b'GET-TIPS', b'INV'])
+        self.assertEqual(proto.metrics.queued_messages, 0)
+        self.assertEqual(proto.metrics.queued_bytes, 0)
+
+    def test_outbound_queue_budget(self):
+        proto = self.conn.proto1
+        proto.outbound.max_bytes = 200
+        self.conn.tr1.clear()
+        proto.outbound.pauseProducing()
+
+        # The oldest tx relay messages are dropped to make room.
+        proto.send_message(ProtocolMessages.INV, 'aa' * 64)
+        proto.send_message(ProtocolMessages.INV, 'bb' * 64)
+        self.assertEqual(proto.metrics.dropped_messages, 1)
+        self.assertEqual(proto.metrics.queued_messages, 1)
+
+        # The other messages are never dropped, the messages of the peer are not read instead.
+        proto.send_message(ProtocolMessages.GET_TIPS, 'x' * 250)
+        self.assertEqual(proto.metrics.dropped_messages, 2)
+        self.assertEqual(proto.metrics.queued_messages, 1)
+        self.assertEqual(self.conn.tr1.producerState, 'paused')
+
+        proto.outbound.resumeProducing()
+        self.assertEqual(self._sent_cmds(self.conn.tr1), [b'GET-TIPS'])
+        self.assertEqual(self.conn.tr1.producerState, 'producing')
+
+        # The connection is only closed after the queued messages are sent.
+        proto.outbound.pauseProducing()
+        proto.send_error_and_close_connection('test')
+        self.assertIsNotNone(self.conn.tr1.producer)
+        proto.outbound.resumeProducing()
+        self.assertEqual(self._sent_cmds(self.conn.tr1), [b'GET-TIPS', b'ERROR'])
+        self.assertIsNone(self.conn.tr1.producer)
@@ -1,6 +1,15 @@
+import base64
+import json
 import random
+from math import inf
+from unittest.mock import patch
 
+import pytest
+
+from hathor.conf import HathorSettings
 from hathor.crypto.util import decode_address
+from hathor.manager import TestMode
+from hathor.p2p.downloader import AimdWindow, Downloader, PeerStats
 from hathor.p2p.node_sync import NodeSyncTimestamp
 from hathor.p2p.protocol import PeerIdState
 from hathor.transaction.storage.exceptions import TransactionIsNotABlock
@@ -8,6 +17,8 @@ from hathor.transaction.storage.remote_storage import RemoteCommunicationError,
 from tests import unittest
 from tests.utils import FakeConnection, start_remote_storage
 
+settings = HathorSettings()
+
 
 class HathorSyncMethodsTestCase(unittest.TestCase):
     def setUp(self):
@@ -41,6 +52,7 @@ class HathorSyncMethodsTestCase(unittest.TestCase):
         tx.verify()
         self.manager1.propagate_tx(tx)
         self.clock.advance(10)
+        return tx
 
     def _add_new_transactions(self, num_txs):
         txs = []
@@ -172,6 +184,246 @@ class HathorSyncMethodsTestCase(unittest.TestCase):
         self.assertConsensusValid(self.manager1)
         self.assertConsensusValid(manager2)
 
+    def test_send_next(self):
+        self._add_new_blocks(10)
+        manager2 = self.create_peer(self.network)
+        conn = FakeConnection(self.manager1, manager2)
+        conn.run_one_step()
+        node_sync = NodeSyncTimestamp(conn.proto1, reactor=conn.proto1.node.reactor)
+        node_sync.MAX_HASHES = 3
+
+        expected = sorted((tx.timestamp, tx.hash) for tx in self.manager1.tx_storage.get_all_transactions())
+
+        # Go through all the pages, following the next timestamp and offset.
+        hashes = []
+        timestamp, offset = self.manager1.tx_storage.first_timestamp, 0
+        while True:
+            conn.tr1.clear()
+            node_sync.send_next(timestamp, offset)
+            _, _, payload = conn.tr1.value().decode('ascii').strip().partition(' ')
+            data = json.loads(payload)
+            hashes.extend(bytes.fromhex(h) for h in data['hashes'])
+            if data['next_timestamp'] == inf:
+                break
+            timestamp, offset = data['next_timestamp'], data['next_offset']
+            # The offset is counted from the first tx at the next timestamp.
+            self.assertEqual(offset, sum(1 for ts, h in expected if ts == timestamp and h in hashes))
+        self.assertEqual(hashes, [h for _, h in expected])
+
+    def test_sync_tips_commitment(self):
+        self._add_new_blocks(10)
+        manager2 = self.create_peer(self.network)
+        conn = FakeConnection(self.manager1, manager2)
+        for _ in range(4):
+            conn.run_one_step()
+        node_sync1 = conn.proto1.state.get_sync_plugin()
+        node_sync2 = conn.proto2.state.get_sync_plugin()
+        self.assertTrue(node_sync1.supports_tips_commitment())
+
+        # The commitment and the number of tips are sent instead of the merkle tree.
+        timestamp = self.manager1.tx_storage.latest_timestamp - 1
+        conn.tr1.clear()
+        node_sync1.send_tips(timestamp, commitment=True)
+        tips = conn.tr1.value().decode('ascii')
+        commitment, length = self.manager1.tx_storage.get_tips_commitment(timestamp)
+        self.assertGreater(length, 0)
+        self.assertIn('"length": {}'.format(length), tips)
+        self.assertIn(commitment.hex(), tips)
+        self.assertEqual(node_sync1.get_local_merkle_tree(timestamp), commitment)
+
+        for _ in range(1000):
+            conn.run_one_step()
+            self.clock.advance(0.1)
+        self.assertTipsEqual(self.manager1, manager2)
+        self.assertEqual(node_sync2.get_local_merkle_tree(timestamp), commitment)
+        self.assertEqual(node_sync2.synced_timestamp, node_sync2.peer_timestamp)
+
+    def test_sync_without_tips_commitment(self):
+        self._add_new_blocks(10)
+        capabilities = [settings.CAPABILITY_WHITELIST, settings.CAPABILITY_DATA_BATCH, settings.CAPABILITY_INV]
+        manager2 = self.create_peer(self.network, capabilities=capabilities)
+        conn = FakeConnection(self.manager1, manager2)
+        for _ in range(1000):
+            conn.run_one_step()
+            self.clock.advance(0.1)
+        node_sync = conn.proto1.state.get_sync_plugin()
+        self.assertFalse(node_sync.supports_tips_commitment())
+        self.assertEqual(node_sync.synced_timestamp, node_sync.peer_timestamp)
+        self.assertTipsEqual(self.manager1, manager2)
+
+    def test_calculate_next_weight_from_window(self):
+        blocks = self._add_new_blocks(25)
+        self.manager1.test_mode = TestMode.DISABLED
+        parent = blocks[-1]
+        timestamp = parent.timestamp + 10
+        window = [(block.timestamp, block.weight) for block in self.genesis_blocks + blocks]
+        weight = self.manager1.calculate_next_weight(parent, timestamp)
+        self.assertEqual(weight, self.manager1.calculate_next_weight_from_window(26, window, timestamp))
+        self.assertEqual(self.manager1.min_block_weight,
+                         self.manager1.calculate_next_weight_from_window(5, window[:6], timestamp))
+
+    def test_sync_block_headers(self):
+        blocks = self._add_new_blocks(20)
+        self._add_new_transactions(5)
+        manager2 = self.create_peer(self.network)
+        conn = FakeConnection(self.manager1, manager2)
+        for _ in range(4):
+            conn.run_one_step()
+        node_sync2 = conn.proto2.state.get_sync_plugin()
+
+        # The chain is validated before the timestamp sync downloads anything.
+        for _ in range(100):
+            if node_sync2.block_headers:
+                break
+            conn.run_one_step()
+        self.assertTrue(node_sync2.supports_block_headers())
+        self.assertEqual([header.hash for header in node_sync2.block_headers], [block.hash for block in blocks])
+        self.assertEqual(node_sync2.get_next_checkpoint().hash, blocks[0].hash)
+        status = node_sync2.get_status()
+        self.assertEqual(status['block_headers'], {'synced': True, 'pending': 20, 'best_block': blocks[-1].hash_hex})
+
+        for _ in range(1000):
+            conn.run_one_step()
+            self.clock.advance(0.1)
+        self.assertTipsEqual(self.manager1, manager2)
+        self.assertIsNone(node_sync2.get_next_checkpoint())
+        self.assertFalse(conn.tr2.disconnecting)
+
+    def test_sync_block_headers_not_downloaded_again(self):
+        blocks = self._add_new_blocks(20)
+        txs = self._add_new_transactions(5)
+        blocks.extend(self._add_new_blocks(5))
+        manager2 = self.create_peer(self.network)
+        conn = FakeConnection(self.manager1, manager2)
+        for _ in range(4):
+            conn.run_one_step()
+        node_sync2 = conn.proto2.state.get_sync_plugin()
+
+        requested = set()
+        get_data_batch = node_sync2.get_data_batch
+
+        def download(hashes):
+            requested.update(hashes)
+            return get_data_batch(hashes)
+
+        node_sync2.get_data_batch = download
+        for _ in range(1000):
+            conn.run_one_step()
+            self.clock.advance(0.1)
+        self.assertTipsEqual(self.manager1, manager2)
+
+        # The validated blocks are added to the DAG after their parents, only the txs are downloaded.
+        self.assertTrue(any(tx.hash in block.parents for tx in txs for block in blocks))
+        self.assertEqual(requested, {tx.hash for tx in txs})
+        self.assertEqual(node_sync2.validated_blocks, {})
+        self.assertEqual(conn.proto2.metrics.received_blocks, len(blocks))
+
+    def test_sync_block_headers_invalid_weight(self):
+        self._add_new_blocks(5)
+        manager2 = self.create_peer(self.network)
+        # The blocks of manager1 have weight 1, which is too small without the test mode.
+        manager2.test_mode = TestMode.DISABLED
+        conn = FakeConnection(self.manager1, manager2)
+        for _ in range(100):
+            conn.run_one_step()
+        self.assertTrue(conn.tr2.disconnecting)
+        self.assertEqual(manager2.tx_storage.get_count_tx_blocks(), len(self.genesis))
+
+    def test_sync_block_headers_in_rounds(self):
+        blocks = self._add_new_blocks(20)
+        manager2 = self.create_peer(self.network)
+        conn = FakeConnection(self.manager1, manager2)
+        for _ in range(4):
+            conn.run_one_step()
+        node_sync2 = conn.proto2.state.get_sync_plugin()
+
+        validated = []
+        validate_block_headers = node_sync2.validate_block_headers
+
+        def validate(ancestor, headers):
+            validated.append((ancestor.hash, [header.hash for header in headers]))
+            validate_block_headers(ancestor, headers)
+
+        node_sync2.validate_block_headers = validate
+        # The NEXT messages are small too, so the timestamp sync stops close to the last validated block.
+        node_sync2.MAX_HASHES = 3
+        conn.proto1.state.get_sync_plugin().MAX_HASHES = 3
+        with patch.object(NodeSyncTimestamp, 'MAX_BLOCK_HEADERS', 8), patch.object(NodeSyncTimestamp, 'MAX_BLOCKS', 3):
+            # The first round stops after the page that reaches the limit and keeps the blocks it validated.
+            for _ in range(100):
+                if node_sync2.block_headers:
+                    break
+                conn.run_one_step()
+            self.assertEqual([header.hash for header in node_sync2.block_headers], [b.hash for b in blocks[:9]])
+            self.assertFalse(node_sync2.block_headers_synced)
+
+            for _ in range(2000):
+                conn.run_one_step()
+                self.clock.advance(0.1)
+        self.assertTipsEqual(self.manager1, manager2)
+        self.assertTrue(node_sync2.block_headers_synced)
+        self.assertFalse(conn.tr2.disconnecting)
+
+        # Each round starts after the blocks of the previous one, so all the blocks are validated.
+        self.assertEqual(validated[0][0], self.genesis_blocks[0].hash)
+        # The next rounds start after the blocks of the first one, up to the peer's best block.
+        block_hashes = [block.hash for block in blocks]
+        self.assertEqual(validated[0], (self.genesis_blocks[0].hash, block_hashes[:9]))
+        self.assertGreater(len(validated), 1)
+        for ancestor, hashes in validated[1:]:
+            self.assertIn(ancestor, block_hashes[8:])
+        self.assertEqual(validated[-1][1][-1], block_hashes[-1])
+
+    def test_get_block_locator(self):
+        blocks = self._add_new_blocks(30)
+        tx_storage = self.manager1.tx_storage
+        genesis_hash = self.genesis_blocks[0].hash
+        locator = tx_storage.get_block_locator()
+        heights = [30, 29, 28, 27, 26, 25, 24, 23, 22, 21, 19, 15, 7, 0]
+        chain = [genesis_hash] + [block.hash for block in blocks]
+        self.assertEqual(locator, [chain[height] for height in heights])
+
+        self.assertEqual(tx_storage.get_best_chain_after([blocks[20].hash, genesis_hash], 3), blocks[21:24])
+        self.assertEqual(tx_storage.get_best_chain_after([bytes(32), blocks[27].hash], 10), blocks[28:])
+        self.assertEqual(tx_storage.get_best_chain_after([blocks[-1].hash], 10), [])
+        self.assertEqual(tx_storage.get_best_chain_after([bytes(32)], 10), [])
+
+    def test_get_block_locator_without_index(self):
+        blocks = self._add_new_blocks(30)
+        tx_storage = self.manager1.tx_storage
+        tx_storage.best_chain_index = None
+        genesis_hash = self.genesis_blocks[0].hash
+
+        # The chain is not walked, so only the latest blocks are there and nothing is sent to the peers.
+        expected = [block.hash for block in reversed(blocks[-10:])] + [genesis_hash]
+        self.assertEqual(tx_storage.get_block_locator(), expected)
+        self.assertEqual(tx_storage.get_best_chain_after([blocks[20].hash, genesis_hash], 3), [])
+        self.assertEqual(tx_storage.get_best_chain_after([genesis_hash], 3), [])
+
+    def test_send_blocks(self):
+        blocks = self._add_new_blocks(3)
+        manager2 = self.create_peer(self.network)
+        conn = FakeConnection(self.manager1, manager2)
+        for _ in range(4):
+            conn.run_one_step()
+        node_sync1 = conn.proto1.state.get_sync_plugin()
+
+        conn.tr1.clear()
+        node_sync1.send_blocks([bytes(32), blocks[0].hash, self.genesis_blocks[0].hash], 10)
+        self.assertEqual(conn.tr1.value().decode('ascii').split(), [
+            'BLOCKS',
+            base64.b64encode(blocks[1].get_struct()).decode('ascii'),
+            base64.b64encode(blocks[2].get_struct()).decode('ascii'),
+        ])
+
+        # It sends nothing after the best block or for unknown blocks.
+        conn.tr1.clear()
+        node_sync1.send_blocks([blocks[2].hash], 10)
+        self.assertEqual(conn.tr1.value(), b'BLOCKS\r\n')
+        conn.tr1.clear()
+        node_sync1.send_blocks([bytes(32)], 10)
+        self.assertEqual(conn.tr1.value(), b'BLOCKS\r\n')
+
     def test_tx_propagation_nat_peers(self):
         """ manager1 <- manager2 <- manager3
         """
@@ -301,6 +553,187 @@ class HathorSyncMethodsTestCase(unittest.TestCase):
         downloader.check_downloading_queue()
         self.assertEqual(len(downloader.downloading_deque), 0)
 
+    def test_downloader_batch(self):
+        blocks = self._add_new_blocks(3)
+
+        manager2 = self.create_peer(self.network)
+        conn = FakeConnection(self.manager1, manager2)
+
+        # Get to PEER-ID state only because when it gets to READY it will automatically sync
+        conn.run_one_step()
+        node_sync2 = NodeSyncTimestamp(conn.proto2, reactor=conn.proto2.node.reactor)
+        self.assertTrue(node_sync2.supports_data_batch())
+        conn.tr2.clear()
+
+        downloader = conn.proto2.connections.downloader
+        hashes = [blk.hash for blk in blocks]
+        deferreds = downloader.get_txs(hashes, node_sync2)
+        self.assertEqual(len(deferreds), 3)
+        self.assertEqual(list(downloader.downloading_deque), hashes)
+
+        # All of them are requested in a single message.
+        value = conn.tr2.value()
+        self.assertEqual(value, b'GET-DATA-BATCH ' + b''.join(hashes).hex().encode('ascii') + b'\r\n')
+
+        # They are added in order, even if they arrive out of order.
+        for blk in reversed(blocks):
+            downloader.pending_transactions[blk.hash].downloading_deferred.callback(blk)
+        self.assertEqual(len(downloader.downloading_deque), 0)
+        self.assertEqual([d.result for d in deferreds], blocks)
+
+        # The txs of a batch that have not arrived are retried after the timeout.
+        missing = [bytes(32), b'\x01' * 32]
+        downloader.get_txs(missing, node_sync2)
+        conn.tr2.clear()
+        self.clock.advance(settings.GET_DATA_TIMEOUT)
+        expected = b''.join(b'GET-DATA ' + h.hex().encode('ascii') + b'\r\n' for h in missing)
+        self.assertEqual(conn.tr2.value(), expected)
+
+    def test_downloader_batch_timeout(self):
+        conn, node_sync1, node_sync2 = self._get_two_node_syncs()
+        self.assertTrue(node_sync1.supports_data_batch())
+        downloader = conn.proto2.connections.downloader
+        stats1 = downloader.get_peer_stats(node_sync1)
+        window_size = downloader.window_size
+
+        missing = [bytes([i]) * 32 for i in range(5)]
+        downloader.get_txs(missing, node_sync1)
+        self.clock.advance(stats1.get_timeout())
+
+        # The batch was a single request, so its timeout is a single failure of the peer.
+        self.assertEqual(stats1.retries, 1)
+        self.assertEqual(stats1.timeouts, 1)
+        self.assertEqual(stats1.backoff, 2)
+        self.assertEqual(stats1.window.size, PeerStats.INITIAL_WINDOW // 2)
+        self.assertEqual(downloader.window_size, window_size // 2)
+
+        # But all its txs are requested again.
+        self.assertEqual(stats1.outstanding, len(missing))
+        for tx_id in missing:
+            self.assertEqual(downloader.pending_transactions[tx_id].attempts, {node_sync1: 2})
+
+    def _get_two_node_syncs(self):
+        manager2 = self.create_peer(self.network)
+        conn = FakeConnection(self.manager1, manager2)
+
+        # Get to PEER-ID state only because when it gets to READY it will automatically sync
+        conn.run_one_step()
+        node_sync1 = NodeSyncTimestamp(conn.proto1, reactor=conn.proto1.node.reactor)
+        node_sync2 = NodeSyncTimestamp(conn.proto2, reactor=conn.proto2.node.reactor)
+        return conn, node_sync1, node_sync2
+
+    def test_downloader_spread_among_peers(self):
+        blocks = self._add_new_blocks(6)
+        conn, node_sync1, node_sync2 = self._get_two_node_syncs()
+        downloader = conn.proto2.connections.downloader
+        downloader.window = AimdWindow(2, 2, 2)
+        hashes = [blk.hash for blk in blocks]
+
+        downloader.get_txs(hashes, node_sync1)
+        downloader.get_txs(hashes[2:], node_sync2)
+        self.assertEqual(downloader.get_peer_stats(node_sync1).outstanding, 2)
+        self.assertEqual(downloader.get_peer_stats(node_sync2).outstanding, 0)
+
+        self.clock.advance(1)
+        for blk in blocks[:2]:
+            downloader.pending_transactions[blk.hash].downloading_deferred.callback(blk)
+        stats1 = downloader.get_peer_stats(node_sync1)
+        self.assertEqual(stats1.downloaded, 2)
+        self.assertEqual(stats1.latency, 1)
+
+        # Both peers have the same score, so the next txs are split between them.
+        self.assertEqual(downloader.get_peer_stats(node_sync1).outstanding, 1)
+        self.assertEqual(downloader.get_peer_stats(node_sync2).outstanding, 1)
+        requested = [downloader.pending_transactions[h].requested_connection for h in hashes[2:4]]
+        self.assertEqual(set(requested), {node_sync1, node_sync2})
+
+    def test_downloader_steal(self):
+        blocks = self._add_new_blocks(1)
+        conn, node_sync1, node_sync2 = self._get_two_node_syncs()
+        downloader = conn.proto2.connections.downloader
+
+        downloader.get_txs([blocks[0].hash], node_sync1)
+        downloader.get_txs([blocks[0].hash], node_sync2)
+        details = downloader.pending_transactions[blocks[0].hash]
+        self.assertIs(details.requested_connection, node_sync1)
+
+        # Not slow enough yet.
+        self.clock.advance(Downloader.STEAL_MIN_DELAY)
+        downloader.steal_slow_requests()
+        self.assertIs(details.requested_connection, node_sync1)
+
+        self.clock.advance(PeerStats.DEFAULT_LATENCY * Downloader.STEAL_FACTOR)
+        downloader.steal_slow_requests()
+        self.assertIs(details.requested_connection, node_sync2)
+        self.assertEqual(downloader.get_peer_stats(node_sync1).outstanding, 0)
+        self.assertEqual(downloader.get_peer_stats(node_sync2).outstanding, 1)
+        self.assertEqual(details.attempts, {node_sync1: 1, node_sync2: 1})
+
+        details.downloading_deferred.callback(blocks[0])
+        self.assertEqual(downloader.get_peer_stats(node_sync2).downloaded, 1)
+        self.assertEqual(len(downloader.pending_transactions), 0)
+
+    def test_aimd_window(self):
+        window = AimdWindow(4, 2, 10)
+        # Slow start until the first loss.
+        for _ in range(4):
+            window.increase()
+        self.assertEqual(window.size, 8)
+
+        window.decrease(now=100, rtt=1)
+        self.assertEqual(window.size, 4)
+        # Only one decrease per round trip.
+        window.decrease(now=100.5, rtt=1)
+        self.assertEqual(window.size, 4)
+        window.decrease(now=101, rtt=1)
+        self.assertEqual(window.size, 2)
+        window.decrease(now=102, rtt=1)
+        self.assertEqual(window.size, 2)
+
+        # Additive increase after the loss.
+        window.increase()
+        window.increase()
+        self.assertEqual(window.size, 2)
+        window.increase()
+        self.assertEqual(window.size, 3)
+        for _ in range(100):
+            window.increase()
+        self.assertEqual(window.size, 10)
+
+    def test_downloader_peer_window(self):
+        blocks = self._add_new_blocks(5)
+        conn, node_sync1, node_sync2 = self._get_two_node_syncs()
+        downloader = conn.proto2.connections.downloader
+        stats1 = downloader.get_peer_stats(node_sync1)
+        stats1.window = AimdWindow(2, 1, 2)
+        hashes = [blk.hash for blk in blocks]
+
+        # Only two requests to the peer at the same time, the other ones wait in order.
+        downloader.get_txs(hashes, node_sync1)
+        self.assertEqual(stats1.outstanding, 2)
+        self.assertEqual(list(downloader.downloading_deque), hashes[:2])
+        self.assertEqual(list(downloader.waiting_deque), hashes[2:])
+
+        # An arrival frees a slot, even when it is not the first one.
+        self.clock.advance(1)
+        downloader.pending_transactions[hashes[1]].downloading_deferred.callback(blocks[1])
+        self.assertEqual(stats1.outstanding, 2)
+        self.assertEqual(list(downloader.downloading_deque), hashes[:3])
+
+        # The timeout comes from the latency once there is a sample, and a timeout halves the windows.
+        self.assertEqual(stats1.get_timeout(), PeerStats.MIN_TIMEOUT)
+        window_size = downloader.window_size
+        self.clock.advance(PeerStats.MIN_TIMEOUT)
+        self.assertEqual(stats1.retries, 1)
+        self.assertEqual(stats1.timeouts, 1)
+        self.assertEqual(stats1.window.size, 1)
+        self.assertEqual(downloader.window_size, window_size // 2)
+        self.assertEqual(stats1.get_timeout(), 2 * PeerStats.MIN_TIMEOUT)
+
+        status = stats1.to_json()
+        self.assertEqual(status['retries'], 1)
+        self.assertEqual(status['window'], 1)
+
 
 class RemoteStorageSyncTest(HathorSyncMethodsTestCase):
     def setUp(self):
@@ -312,3 +745,28 @@ class RemoteStorageSyncTest(HathorSyncMethodsTestCase):
     def tearDown(self):
         self._server.stop(0).wait()
         super().tearDown()
+
+    # The remote storage has no best chain index, so manager1 does not send its blocks in reply to GET-BLOCKS.
+    @pytest.mark.skip(reason='requires the best chain index')
+    def test_sync_block_headers(self):
+        pass
+
+    @pytest.mark.skip(reason='requires the best chain index')
+    def test_sync_block_headers_not_downloaded_again(self):
+        pass
+
+    @pytest.mark.skip(reason='requires the best chain index')
+    def test_sync_block_headers_invalid_weight(self):
+        pass
+
+    @pytest.mark.skip(reason='requires the best chain index')
+    def test_sync_block_headers_in_rounds(self):
+        pass
+
+    @pytest.mark.skip(reason='requires the best chain index')
+    def test_get_block_locator(self):
+        pass
+
+    @pytest.mark.skip(reason='requires the best chain index')
+    def test_send_blocks(self):
+        pass
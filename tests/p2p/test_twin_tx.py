@@ -78,4 +78,14 @@ class TwinTransactionTestCase(unittest.TestCase):
         meta3 = tx3.get_metadata()
         self.assertEqual(meta3.twins, [])
 
+        # The fingerprint does not depend on the order of the outputs
+        tx4 = Transaction.create_from_struct(tx1.get_struct())
+        tx4.outputs = tx4.outputs[::-1]
+        self.assertEqual(tx1.get_twin_fingerprint(), tx4.get_twin_fingerprint())
+        self.assertNotEqual(tx1.get_twin_fingerprint(), tx3.get_twin_fingerprint())
+
+        twins_index = self.manager.tx_storage.twins_index
+        self.assertEqual(twins_index.get_twins(tx1), {tx2.hash})
+        self.assertEqual(twins_index.get_twins(tx3), set())
+
         self.assertConsensusValid(self.manager)
@@ -55,6 +55,8 @@ class TestDummyRequest(DummyRequest):
         DummyRequest.__init__(self, url.split('/'))
         self.method = method
         self.headers = headers or {}
+        for name, value in self.headers.items():
+            self.requestHeaders.setRawHeaders(name, [value])
         self.content = RequestBody()
 
         # Set request args
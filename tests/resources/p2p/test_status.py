@@ -65,6 +65,12 @@ class StatusTest(_BaseResourceTest._ResourceTest):
         self.assertEqual(len(connections['connected_peers']), 1)
         self.assertEqual(connections['connected_peers'][0]['id'], self.manager2.my_peer.id)
 
+        self.assertEqual(data['downloader']['window_size'], self.manager.connections.downloader.window_size)
+        download = connections['connected_peers'][0]['plugins']['node-sync-timestamp']['download']
+        self.assertEqual(download['retries'], 0)
+        self.assertIn('window', download)
+        self.assertIn('latency', download)
+
     @inlineCallbacks
     def test_connecting_peers(self):
         address = '192.168.1.1:54321'
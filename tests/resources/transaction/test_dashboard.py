@@ -2,6 +2,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from hathor.transaction.resources import DashboardTransactionResource
 from tests.resources.base_resource import StubSite, _BaseResourceTest
+from tests.utils import add_new_blocks
 
 
 class DashboardTest(_BaseResourceTest._ResourceTest):
@@ -40,3 +41,29 @@ class DashboardTest(_BaseResourceTest._ResourceTest):
         response = yield self.web.get("dashboard_tx", {b'block': b'6'})
         data = response.json_value()
         self.assertFalse(data['success'])
+
+    @inlineCallbacks
+    def test_cache(self):
+        args = {b'block': b'6', b'tx': b'6'}
+        response = yield self.web.get("dashboard_tx", args)
+        data = response.json_value()
+        etag = response.responseHeaders.getRawHeaders(b'etag')[0]
+        self.assertEqual(self.manager.metrics.response_cache_misses, 1)
+
+        # The order of the arguments does not matter
+        response = yield self.web.get("dashboard_tx", {b'tx': b'6', b'block': b'6'})
+        self.assertEqual(response.json_value(), data)
+        self.assertEqual(response.responseHeaders.getRawHeaders(b'content-type'),
+                         [b'application/json; charset=utf-8'])
+        self.assertEqual(self.manager.metrics.response_cache_hits, 1)
+
+        response = yield self.web.get("dashboard_tx", args, {b'If-None-Match': etag})
+        self.assertEqual(response.responseCode, 304)
+        self.assertEqual(response.written, [b''])
+
+        # A new block changes the response
+        add_new_blocks(self.manager, 1, advance_clock=1)
+        response = yield self.web.get("dashboard_tx", args, {b'If-None-Match': etag})
+        self.assertIsNone(response.responseCode)
+        self.assertNotEqual(response.json_value(), data)
+        self.assertEqual(self.manager.metrics.response_cache_misses, 2)
@@ -1,7 +1,11 @@
-from twisted.internet.defer import inlineCallbacks
+from unittest import mock
 
+from twisted.internet.defer import gatherResults, inlineCallbacks
+
+from hathor.graphviz import GraphvizVisualizer
 from hathor.transaction import Transaction
-from hathor.transaction.resources import GraphvizFullResource, GraphvizNeighboursResource
+from hathor.transaction.resources import GraphvizFullResource, GraphvizNeighboursResource, GraphvizRenderer
+from hathor.transaction.resources.graphviz import settings
 from tests.resources.base_resource import StubSite, TestDummyRequest, _BaseResourceTest
 from tests.utils import add_blocks_unlock_reward, add_new_blocks, add_new_transactions
 
@@ -56,6 +60,59 @@ class GraphvizFullTest(_GraphvizBase):
         data = response.written[0]
         self.assertIsNotNone(data)
 
+    @inlineCallbacks
+    def test_full_graph_cache(self):
+        response1 = yield self.web.get('graphviz', {b'weight': b'true'})
+        response2 = yield self.web.get('graphviz', {b'weight': b'true'})
+        self.assertEqual(response1.written, response2.written)
+        self.assertEqual(len(self.resource.renderer._cache), 1)
+
+        # The graph changes with the DAG
+        add_new_blocks(self.manager, 1, advance_clock=1)
+        response3 = yield self.web.get('graphviz', {b'weight': b'true'})
+        self.assertNotEqual(response1.written, response3.written)
+        self.assertEqual(len(self.resource.renderer._cache), 2)
+
+    @inlineCallbacks
+    def test_full_graph_too_large(self):
+        tx_storage = self.manager.tx_storage
+        count = tx_storage.get_block_count() + tx_storage.get_tx_count()
+        # The size is checked with the counters of the indexes, without going through the storage
+        with mock.patch.object(tx_storage, 'get_count_tx_blocks', side_effect=AssertionError):
+            with mock.patch('hathor.transaction.resources.graphviz.settings',
+                            settings._replace(GRAPHVIZ_FULL_MAX_NODES=count - 1)):
+                response = yield self.web.get('graphviz', {})
+            self.assertFalse(response.json_value()['success'])
+
+            with mock.patch('hathor.transaction.resources.graphviz.settings',
+                            settings._replace(GRAPHVIZ_FULL_MAX_NODES=count)):
+                response = yield self.web.get('graphviz', {})
+            self.assertIsNotNone(response.written[0])
+
+    @inlineCallbacks
+    def test_full_graph_busy(self):
+        self.resource.renderer.max_pending = 0
+        response = yield self.web.get('graphviz', {})
+        self.assertEqual(response.responseCode, 503)
+        self.assertFalse(response.json_value()['success'])
+
+    @inlineCallbacks
+    def test_renderer_coalescing(self):
+        renderer = GraphvizRenderer()
+        calls = []
+
+        def render():
+            calls.append(None)
+            return b'graph'
+
+        results = yield gatherResults([renderer.render('key', render), renderer.render('key', render)])
+        self.assertEqual(results, [b'graph', b'graph'])
+        self.assertEqual(len(calls), 1)
+
+        result = yield renderer.render('key', render)
+        self.assertEqual(result, b'graph')
+        self.assertEqual(len(calls), 1)
+
     def test_parse_arg(self):
         false_args = ['false', 'False', '0', None, 0, False]
         for arg in false_args:
@@ -86,6 +143,11 @@ class GraphvizNeigboursTest(_GraphvizBase):
         data = response.written[0]
         self.assertIsNotNone(data)
 
+    def test_neighbours_max_nodes(self):
+        graphviz = GraphvizVisualizer(self.manager.tx_storage)
+        dot = graphviz.tx_neighborhood(self.tx2, format='dot', max_level=3, graph_type='funds', max_nodes=2)
+        self.assertEqual(sum(1 for line in dot.body if 'label=' in line), 2)
+
     def test_error_request(self):
         request = TestDummyRequest('GET', 'graphviz', {})
         self.assertIsNotNone(request._finishedDeferreds)
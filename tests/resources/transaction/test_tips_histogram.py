@@ -49,6 +49,27 @@ class TipsTest(_BaseResourceTest._ResourceTest):
         self.assertTrue(data3['success'])
         self.assertEqual(len(data3['tips']), 19)
 
+        # The sweep gives the same number of tips of each timestamp
+        begin = txs[0].timestamp - 5
+        end = txs[-1].timestamp + 5
+        expected = [[timestamp, len(self.manager.tx_storage.get_tx_tips(timestamp))]
+                    for timestamp in range(begin, end + 1)]
+        response4 = yield self.web.get("tips-histogram", {
+            b'begin': str(begin).encode(),
+            b'end': str(end).encode()
+        })
+        self.assertEqual(response4.json_value()['tips'], expected)
+
+        # Each bucket has the maximum number of its timestamps
+        response5 = yield self.web.get("tips-histogram", {
+            b'begin': str(begin).encode(),
+            b'end': str(end).encode(),
+            b'bucket': b'4'
+        })
+        expected_buckets = [[expected[i][0], max(count for _, count in expected[i:i + 4])]
+                            for i in range(0, len(expected), 4)]
+        self.assertEqual(response5.json_value()['tips'], expected_buckets)
+
     @inlineCallbacks
     def test_invalid_params(self):
         # missing end param
@@ -70,3 +91,12 @@ class TipsTest(_BaseResourceTest._ResourceTest):
         response = yield self.web.get("tips-histogram", {b'begin': b'0', b'end': b'a'})
         data = response.json_value()
         self.assertFalse(data['success'])
+
+        # wrong bucket param
+        response = yield self.web.get("tips-histogram", {b'begin': b'0', b'end': b'10', b'bucket': b'a'})
+        data = response.json_value()
+        self.assertFalse(data['success'])
+
+        response = yield self.web.get("tips-histogram", {b'begin': b'0', b'end': b'10', b'bucket': b'0'})
+        data = response.json_value()
+        self.assertFalse(data['success'])
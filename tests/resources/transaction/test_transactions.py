@@ -0,0 +1,71 @@
+from unittest.mock import patch
+
+from twisted.internet.defer import inlineCallbacks
+
+from hathor.conf import HathorSettings
+from hathor.transaction.resources import TransactionResource, TransactionsResource
+from hathor.util import json_loadb
+from tests.resources.base_resource import StubSite, _BaseResourceTest
+from tests.utils import add_blocks_unlock_reward, add_new_blocks, add_new_transactions
+
+settings = HathorSettings()
+
+
+class TransactionsTest(_BaseResourceTest._ResourceTest):
+    def setUp(self):
+        super().setUp()
+        self.web = StubSite(TransactionsResource(self.manager))
+        self.web_transaction = StubSite(TransactionResource(self.manager))
+        self.manager.wallet.unlock(b'MYPASS')
+
+    @inlineCallbacks
+    def test_get_data(self):
+        blocks = add_new_blocks(self.manager, 2, advance_clock=1)
+        add_blocks_unlock_reward(self.manager)
+        txs = add_new_transactions(self.manager, 3, advance_clock=1)
+        missing = '00000b8792cb13e8adb51cc7d866541fc29b532e8dec95ae4661cf3da4d42cb4'
+        ids = [txs[1].hash_hex, blocks[0].hash_hex, missing, 'abc', txs[0].hash_hex]
+
+        response = yield self.web.post('transactions', {'ids': ids})
+        data = json_loadb(b''.join(response.written))
+        self.assertTrue(data['success'])
+        self.assertEqual([item['id'] for item in data['transactions']], ids)
+        self.assertEqual([item['success'] for item in data['transactions']], [True, True, False, False, True])
+
+        # The same data of the single tx API
+        for tx, item in [(txs[1], data['transactions'][0]), (blocks[0], data['transactions'][1])]:
+            response_single = yield self.web_transaction.get('transaction', {b'id': tx.hash_hex.encode()})
+            data_single = response_single.json_value()
+            for field in ['tx', 'meta', 'spent_outputs']:
+                self.assertEqual(item[field], data_single[field])
+
+        # Only the requested fields
+        response = yield self.web.post('transactions', {'ids': [txs[2].hash_hex], 'fields': ['meta']})
+        data = json_loadb(b''.join(response.written))
+        item, = data['transactions']
+        self.assertEqual(set(item.keys()), {'id', 'success', 'meta'})
+        self.assertEqual(item['meta']['hash'], txs[2].hash_hex)
+
+    @inlineCallbacks
+    def test_write_error(self):
+        ids = ['abc', settings.GENESIS_TX1_HASH.hex(), settings.GENESIS_TX2_HASH.hex()]
+        with patch('hathor.transaction.resources.transactions.get_tx_extra_data', side_effect=ValueError):
+            response = yield self.web.post('transactions', {'ids': ids})
+
+        # The response is closed after the txs written before the error.
+        data = json_loadb(b''.join(response.written))
+        self.assertFalse(data['success'])
+        self.assertEqual([item['id'] for item in data['transactions']], ids[:1])
+        self.assertTrue(response.finished)
+
+    @inlineCallbacks
+    def test_invalid_params(self):
+        response = yield self.web.post('transactions', {'ids': 'abc'})
+        self.assertFalse(response.json_value()['success'])
+
+        response = yield self.web.post('transactions', {'ids': [], 'fields': ['tx', 'other']})
+        self.assertFalse(response.json_value()['success'])
+
+        ids = [settings.GENESIS_TX1_HASH.hex()] * (settings.MAX_TX_LOOKUP_COUNT + 1)
+        response = yield self.web.post('transactions', {'ids': ids})
+        self.assertFalse(response.json_value()['success'])
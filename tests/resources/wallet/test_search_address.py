@@ -91,6 +91,54 @@ class SearchAddressTest(_BaseResourceTest._ResourceTest):
         for tx in data2['transactions']:
             self.assertNotIn(tx['tx_id'], tx_ids_data)
 
+    @inlineCallbacks
+    def test_search_token(self):
+        resource = StubSite(AddressSearchResource(self.manager))
+
+        # Only the token creation tx has the token in the address
+        response = yield resource.get('thin_wallet/address_search', {
+            b'address': self.address.encode(),
+            b'count': 3,
+            b'token': self.token_uid.hex().encode(),
+        })
+        data = response.json_value()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['total'], 1)
+        self.assertEqual([tx['tx_id'] for tx in data['transactions']], [self.token_uid.hex()])
+        self.assertFalse(data['has_more'])
+
+        # The blocks are newer, and they do not have the token
+        response = yield resource.get('thin_wallet/address_search', {
+            b'address': self.address.encode(),
+            b'count': 3,
+            b'token': self.token_uid.hex().encode(),
+            b'page': b'previous',
+            b'hash': self.token_uid.hex().encode(),
+        })
+        data = response.json_value()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['transactions'], [])
+        self.assertFalse(data['has_more'])
+
+        # A hash that is not in the address is invalid
+        block_hash = self.manager.tx_storage.get_best_block_tips()[0]
+        response = yield resource.get('thin_wallet/address_search', {
+            b'address': self.address.encode(),
+            b'count': 3,
+            b'token': self.token_uid.hex().encode(),
+            b'page': b'next',
+            b'hash': block_hash.hex().encode(),
+        })
+        self.assertFalse(response.json_value()['success'])
+
+        # The txs are sorted from the newest to the oldest
+        response = yield resource.get('thin_wallet/address_search', {b'address': self.address.encode(), b'count': 10})
+        data = response.json_value()
+        self.assertEqual(data['total'], 6)
+        timestamps = [tx['timestamp'] for tx in data['transactions']]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        self.assertEqual(data['transactions'][0]['tx_id'], block_hash.hex())
+
     @inlineCallbacks
     def test_address_balance(self):
         resource = StubSite(AddressBalanceResource(self.manager))
@@ -1,7 +1,8 @@
+from hathor.confirmation_tracker import get_confirmation_stop_value
 from hathor.transaction import sum_weights
 from hathor.transaction.storage import TransactionMemoryStorage
 from tests import unittest
-from tests.utils import add_blocks_unlock_reward, add_new_blocks, add_new_transactions
+from tests.utils import add_blocks_unlock_reward, add_new_blocks, add_new_transactions, gen_new_double_spending
 
 
 class AccumulatedWeightTestCase(unittest.TestCase):
@@ -42,3 +43,78 @@ class AccumulatedWeightTestCase(unittest.TestCase):
 
         meta = tx0.update_accumulated_weight()
         self.assertAlmostEqual(meta.accumulated_weight, expected)
+
+    def test_confirmation_tracker(self):
+        manager = self.create_peer('testnet', tx_storage=self.tx_storage)
+        tracker = manager.confirmation_tracker
+
+        add_new_blocks(manager, 3, advance_clock=15)
+        add_blocks_unlock_reward(manager)
+        tx_list = add_new_transactions(manager, 10, advance_clock=15)
+
+        # Not confirmed by a block yet, the tracker has the same value of the walk
+        for tx in tx_list:
+            self.assertIn(tx.hash, tracker)
+            expected = tx.clone().update_accumulated_weight(save_file=False).accumulated_weight
+            self.assertAlmostEqual(tracker.get_accumulated_weight(tx.hash), expected)
+
+        # The fully confirmed txs are no longer tracked, their accumulated weight is saved
+        add_new_blocks(manager, 2, advance_clock=15)
+        tx0 = tx_list[0]
+        self.assertNotIn(tx0.hash, tracker)
+        meta = tx0.get_metadata()
+        self.assertGreater(meta.accumulated_weight, get_confirmation_stop_value(tx0))
+
+    def test_confirmation_tracker_max_txs(self):
+        manager = self.create_peer('testnet', tx_storage=self.tx_storage)
+        tracker = manager.confirmation_tracker
+        tracker.max_txs = 3
+
+        add_new_blocks(manager, 3, advance_clock=15)
+        add_blocks_unlock_reward(manager)
+        tx_list = add_new_transactions(manager, 5, advance_clock=15)
+
+        for tx in tx_list[:2]:
+            self.assertNotIn(tx.hash, tracker)
+        for tx in tx_list[2:]:
+            self.assertIn(tx.hash, tracker)
+
+    def test_confirmation_tracker_voided(self):
+        manager = self.create_peer('testnet', tx_storage=self.tx_storage)
+        tracker = manager.confirmation_tracker
+
+        add_new_blocks(manager, 3, advance_clock=15)
+        add_blocks_unlock_reward(manager)
+        tx1, = add_new_transactions(manager, 1, advance_clock=15)
+        self.assertIn(tx1.hash, tracker)
+
+        # A double spending with a higher weight voids the tracked tx, which is then no longer tracked.
+        tx2 = gen_new_double_spending(manager, use_same_parents=True)
+        tx2.weight = tx1.weight + 2
+        tx2.resolve()
+        manager.propagate_tx(tx2, fails_silently=False)
+        self.assertEqual(tx1.get_metadata().voided_by, {tx1.hash})
+        self.assertNotIn(tx1.hash, tracker)
+        self.assertIn(tx2.hash, tracker)
+
+        # The voided txs are not tracked when they arrive.
+        tx3 = gen_new_double_spending(manager, use_same_parents=True)
+        manager.propagate_tx(tx3, fails_silently=False)
+        self.assertEqual(tx3.get_metadata().voided_by, {tx3.hash})
+        self.assertNotIn(tx3.hash, tracker)
+
+    def test_confirmation_tracker_max_walk(self):
+        manager = self.create_peer('testnet', tx_storage=self.tx_storage)
+        tracker = manager.confirmation_tracker
+        tracker.max_walk = 3
+
+        add_new_blocks(manager, 3, advance_clock=15)
+        add_blocks_unlock_reward(manager)
+        tx_list = add_new_transactions(manager, 6, advance_clock=15)
+
+        # The walk of each new tx stops before the older txs, which are no longer tracked.
+        self.assertNotIn(tx_list[0].hash, tracker)
+        for tx in tx_list[-3:]:
+            self.assertIn(tx.hash, tracker)
+            expected = tx.clone().update_accumulated_weight(save_file=False).accumulated_weight
+            self.assertAlmostEqual(tracker.get_accumulated_weight(tx.hash), expected)
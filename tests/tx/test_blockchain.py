@@ -348,6 +348,44 @@ class BlockchainTestCase(unittest.TestCase):
             expected_height = i + 1
             self.assertEqual(block.get_metadata().height, expected_height)
 
+    def test_best_chain_index(self):
+        manager = self.create_peer('testnet', tx_storage=self.tx_storage)
+        blocks = add_new_blocks(manager, 10, advance_clock=15)
+
+        # A longer side chain starting before the last two blocks takes over the best chain.
+        sidechain = add_new_blocks(manager, 3, advance_clock=15, parent_block_hash=blocks[-3].hash)
+        self.assertIsNone(sidechain[-1].get_metadata().voided_by)
+        self.assertIsNotNone(blocks[-1].get_metadata().voided_by)
+
+        best_chain = []
+        block = sidechain[-1]
+        while block.parents:
+            best_chain.append(block)
+            block = block.get_block_parent()
+        best_chain.append(block)
+        best_chain.reverse()
+
+        index = self.tx_storage.best_chain_index
+        self.assertEqual(index.hashes, [blk.hash for blk in best_chain])
+        self.assertEqual(self.tx_storage.get_height_best_block(), len(best_chain) - 1)
+        self.assertFalse(index.is_in_best_chain(blocks[-1]))
+        for blk in best_chain:
+            height = blk.get_metadata().height
+            self.assertEqual(index.get_hash(height), blk.hash)
+            self.assertEqual(self.tx_storage.get_height_best_block_at(blk.timestamp), height)
+            if height > 0:
+                self.assertEqual(self.tx_storage.get_height_best_block_at(blk.timestamp - 1), height - 1)
+
+        blocks_before = self.tx_storage.get_blocks_before(sidechain[-1].hash, 5)
+        self.assertEqual(blocks_before, best_chain[-2:-7:-1])
+
+        # The index is rebuilt when the best block tips are set without the consensus.
+        self.tx_storage._reset_cache()
+        for tx in self.tx_storage._topological_sort():
+            self.tx_storage._add_to_cache(tx)
+        self.assertEqual(self.tx_storage.get_height_best_block(), len(best_chain) - 1)
+        self.assertEqual(self.tx_storage.best_chain_index.hashes, [blk.hash for blk in best_chain])
+
     def test_tokens_issued_per_block(self):
         manager = self.create_peer('testnet', tx_storage=self.tx_storage)
         # this test is pretty dumb in that it test every possible height until halving has long stopped
@@ -565,6 +565,22 @@ class BasicTransaction(unittest.TestCase):
 
         assert cloned_block == block
 
+    def test_start_mining_first_nonce(self):
+        from hathor.pow import hash_to_int
+
+        block = self.genesis_blocks[0].clone()
+        block.weight = 10
+        target = block.get_target()
+
+        self.assertTrue(block.resolve(update_time=False))
+        self.assertEqual(block.hash, block.calculate_hash())
+        block.verify_pow()
+
+        # the nonce found by the batched search must be the first solution
+        nonce = block.nonce
+        for block.nonce in range(nonce):
+            self.assertGreaterEqual(hash_to_int(block.calculate_hash()), target)
+
     def test_block_data(self):
         def add_block_with_data(data: bytes = b'') -> None:
             add_new_blocks(self.manager, 1, advance_clock=1, block_data=data)[0]
@@ -854,6 +870,39 @@ class BasicTransaction(unittest.TestCase):
 
             mocked.sha256.assert_called_once()
 
+    def test_to_json_extended_cache(self):
+        from unittest import mock
+
+        genesis_block = self.genesis_blocks[0]
+        address = get_address_from_public_key(self.genesis_public_key)
+        output = TxOutput(genesis_block.outputs[0].value, P2PKH.create_output_script(address))
+        tx = Transaction(weight=1, inputs=[TxInput(genesis_block.hash, 0, b'')], outputs=[output],
+                         parents=[tx.hash for tx in self.genesis_txs], storage=self.tx_storage)
+        tx.update_hash()
+
+        data = tx.to_json_extended()
+        self.assertFalse(data['is_voided'])
+
+        # The callers get their own copy
+        data['inputs'][0]['decoded'].clear()
+        data['outputs'].clear()
+
+        with mock.patch.object(self.tx_storage, 'get_transaction') as mocked:
+            tx.get_metadata().voided_by = {tx.hash}
+            data2 = tx.to_json_extended()
+            mocked.assert_not_called()
+
+        self.assertTrue(data2['is_voided'])
+        self.assertEqual(len(data2['outputs']), len(tx.outputs))
+        self.assertTrue(data2['inputs'][0]['decoded'])
+        self.assertEqual(data2['tx_id'], tx.hash_hex)
+
+        # Changing the tx (and its hash) builds the JSON again
+        tx.timestamp += 1
+        tx.update_hash()
+        self.assertEqual(tx.to_json_extended()['timestamp'], tx.timestamp)
+        self.assertEqual(tx.to_json()['timestamp'], tx.timestamp)
+
 
 if __name__ == '__main__':
     unittest.main()
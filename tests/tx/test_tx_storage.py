@@ -11,7 +11,7 @@ from twisted.internet.threads import deferToThread
 from twisted.trial import unittest
 
 from hathor.conf import HathorSettings
-from hathor.indexes import TokensIndex, WalletIndex
+from hathor.indexes import TipsCommitment, TokensIndex, WalletIndex
 from hathor.manager import TestMode
 from hathor.transaction import Block, Transaction, TxInput, TxOutput
 from hathor.transaction.storage import (
@@ -222,7 +222,7 @@ class _BaseTransactionStorageTest:
             wallet_index = self.tx_storage.wallet_index
             addresses = wallet_index._get_addresses(tx)
             for address in addresses:
-                self.assertNotIn(tx.hash, wallet_index.index[address])
+                self.assertNotIn(tx.hash, wallet_index.get_from_address(address))
 
             # TODO Check self.tx_storage.tokens_index
 
@@ -266,6 +266,20 @@ class _BaseTransactionStorageTest:
             with self.assertRaises(TransactionDoesNotExist):
                 self.tx_storage.get_transaction(hex_error)
 
+        def test_get_transactions(self):
+            self.validate_save(self.block)
+            self.validate_save(self.tx)
+
+            hex_error = bytes.fromhex('00001c5c0b69d13b05534c94a69b2c8272294e6b0c536660a3ac264820677024')
+            hashes = [self.block.hash, self.tx.hash, self.genesis_txs[0].hash, hex_error, self.tx.hash]
+            txs = self.tx_storage.get_transactions(hashes)
+            self.assertEqual(set(txs.keys()), {self.block.hash, self.tx.hash, self.genesis_txs[0].hash})
+            for hash_bytes, tx in txs.items():
+                self.assertEqual(tx.hash, hash_bytes)
+                self.assertEqual(tx, self.tx_storage.get_transaction(hash_bytes))
+
+            self.assertEqual(self.tx_storage.get_transactions([]), {})
+
         def test_save_metadata(self):
             # Saving genesis metadata
             self.tx_storage.save_transaction(self.genesis_txs[0], only_metadata=True)
@@ -312,6 +326,28 @@ class _BaseTransactionStorageTest:
             tip_blocks = [x.data for x in self.tx_storage.get_block_tips()]
             self.assertEqual(set(tip_blocks), {block2.hash, block3.hash})
 
+        def _assert_tips_commitment(self):
+            # The commitment only changes at the timestamps of the transactions.
+            timestamps = set()
+            for tx in self.tx_storage.get_all_transactions():
+                timestamps.update([tx.timestamp - 1, tx.timestamp, tx.timestamp + 1])
+            for timestamp in sorted(timestamps):
+                tips = self.tx_storage.get_all_tips(timestamp)
+                expected = TipsCommitment.calculate(x.data for x in tips), len(tips)
+                self.assertEqual(self.tx_storage.get_tips_commitment(timestamp), expected)
+
+        def test_tips_commitment(self):
+            self._assert_tips_commitment()
+            block1 = self._add_new_block()
+            self._add_new_block()
+            # A block with the same parents changes the interval of its parent back in time.
+            self._add_new_block(parents=block1.parents)
+            self._assert_tips_commitment()
+            self.assertEqual(self.tx_storage.get_tips_commitment()[1], len(self.tx_storage.get_all_tips()))
+
+            self.tx_storage._manually_initialize()
+            self._assert_tips_commitment()
+
         def test_token_list(self):
             tx = self.tx
             self.validate_save(tx)
@@ -43,7 +43,7 @@ class TestCase(unittest.TestCase):
         return wallet
 
     def create_peer(self, network, peer_id=None, wallet=None, tx_storage=None, unlock_wallet=True, wallet_index=False,
-                    capabilities=None):
+                    capabilities=None, verification_processes=1):
         if peer_id is None:
             peer_id = PeerId()
         if not wallet:
@@ -58,6 +58,7 @@ class TestCase(unittest.TestCase):
             tx_storage=tx_storage,
             wallet_index=wallet_index,
             capabilities=capabilities,
+            verification_processes=verification_processes,
         )
         manager.avg_time_between_blocks = 0.0001
         manager.test_mode = TestMode.TEST_ALL_WEIGHT
@@ -1,16 +1,43 @@
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+from unittest.mock import patch
+
+import pytest
+
+from hathor.conf import HathorSettings
 from hathor.crypto.util import decode_address
+from hathor.manager import HathorManager
+from hathor.pubsub import HathorEvents
 from hathor.transaction import Transaction
+from hathor.transaction.scripts import parse_address_script
+from hathor.transaction.storage import TransactionCacheStorage, TransactionRocksDBStorage
+from hathor.transaction.storage.rocksdb_indexes import RocksDBWalletIndex
 from hathor.wallet.base_wallet import WalletOutputInfo
 from tests import unittest
 from tests.utils import add_blocks_unlock_reward, add_new_blocks
 
+settings = HathorSettings()
+
+try:
+    import rocksdb  # noqa: F401
+except ImportError:
+    HAS_ROCKSDB = False
+else:
+    HAS_ROCKSDB = True
+
 
 class TwinTransactionTestCase(unittest.TestCase):
     def setUp(self):
         super().setUp()
 
         self.network = 'testnet'
-        self.manager = self.create_peer(self.network, unlock_wallet=True, wallet_index=True)
+        self.manager = self.create_peer(self.network, unlock_wallet=True, wallet_index=True,
+                                        tx_storage=self.create_tx_storage())
+
+    def create_tx_storage(self):
+        return None
 
     def test_twin_tx(self):
         add_new_blocks(self.manager, 5, advance_clock=15)
@@ -51,3 +78,201 @@ class TwinTransactionTestCase(unittest.TestCase):
         wallet_data = self.manager.tx_storage.wallet_index.get_from_address(address)
         self.assertEqual(len(wallet_data), 2)
         self.assertEqual(set(wallet_data), set([tx1.hash, tx2.hash]))
+
+    def test_publish_address_history(self):
+        add_new_blocks(self.manager, 5, advance_clock=15)
+        add_blocks_unlock_reward(self.manager)
+        address = self.get_address(0)
+        published = []
+        self.manager.pubsub.subscribe(HathorEvents.WALLET_ADDRESS_HISTORY,
+                                      lambda key, args: published.append(args.address))
+        wallet_index = self.manager.tx_storage.wallet_index
+
+        def propagate_tx():
+            outputs = [WalletOutputInfo(address=decode_address(address), value=100, timelock=None)]
+            tx = self.manager.wallet.prepare_transaction_compute_inputs(Transaction, outputs, self.manager.tx_storage)
+            tx.weight = 10
+            tx.parents = self.manager.get_new_tx_parents()
+            tx.timestamp = int(self.clock.seconds())
+            tx.resolve()
+            self.manager.propagate_tx(tx)
+            self.run_to_completion()
+
+        # Nobody is subscribed to any address, so nothing is published.
+        wallet_index.address_filter = set()
+        with patch.object(Transaction, 'to_json_extended') as to_json_extended:
+            propagate_tx()
+        to_json_extended.assert_not_called()
+        self.assertEqual(published, [])
+
+        wallet_index.address_filter = {address}
+        propagate_tx()
+        self.assertEqual(set(published), {address})
+
+    def _get_output_address(self, output):
+        if output.is_token_authority():
+            return None
+        script_type_out = parse_address_script(output.script)
+        return script_type_out.address if script_type_out else None
+
+    def assertBalancesValid(self, address):
+        """ Compare the balances of the wallet index with the ones calculated from the txs of the address.
+        """
+        tx_storage = self.manager.tx_storage
+        wallet_index = tx_storage.wallet_index
+        received = defaultdict(int)
+        spent = defaultdict(int)
+        utxos = defaultdict(dict)
+        for tx_hash in wallet_index.get_from_address(address):
+            tx = tx_storage.get_transaction(tx_hash)
+            meta = tx.get_metadata(force_reload=True)
+            if meta.voided_by:
+                continue
+            for tx_input in tx.inputs:
+                tx2 = tx_storage.get_transaction(tx_input.tx_id)
+                output = tx2.outputs[tx_input.index]
+                if self._get_output_address(output) == address:
+                    spent[tx2.get_token_uid(output.get_token_index())] += output.value
+            for index, output in enumerate(tx.outputs):
+                if self._get_output_address(output) != address:
+                    continue
+                token_uid = tx.get_token_uid(output.get_token_index())
+                received[token_uid] += output.value
+                spent_by = meta.spent_outputs.get(index, [])
+                if all(tx_storage.get_metadata(h).voided_by for h in spent_by):
+                    utxos[token_uid][(tx_hash, index)] = output.value
+
+        balances = wallet_index.get_balances(address)
+        self.assertEqual(set(balances), set(received))
+        for token_uid, balance in balances.items():
+            self.assertEqual(balance.received, received[token_uid])
+            self.assertEqual(balance.spent, spent[token_uid])
+            self.assertEqual(wallet_index.get_utxos(address, token_uid), utxos[token_uid])
+
+    def test_balances(self):
+        add_new_blocks(self.manager, 5, advance_clock=15)
+        add_blocks_unlock_reward(self.manager)
+
+        address = self.get_address(0)
+        outputs = [WalletOutputInfo(address=decode_address(address), value=500, timelock=None)]
+        tx1 = self.manager.wallet.prepare_transaction_compute_inputs(Transaction, outputs, self.manager.tx_storage)
+        tx1.weight = 10
+        tx1.parents = self.manager.get_new_tx_parents()
+        tx1.timestamp = int(self.clock.seconds())
+        tx1.resolve()
+        spent_tx = self.manager.tx_storage.get_transaction(tx1.inputs[0].tx_id)
+        input_address = self._get_output_address(spent_tx.outputs[tx1.inputs[0].index])
+        self.manager.propagate_tx(tx1)
+        self.run_to_completion()
+        self.assertBalancesValid(address)
+        self.assertBalancesValid(input_address)
+        utxos = self.manager.tx_storage.wallet_index.get_utxos(address, settings.HATHOR_TOKEN_UID)
+        self.assertIn(500, [value for (tx_hash, _), value in utxos.items() if tx_hash == tx1.hash])
+
+        # A twin with more weight voids tx1, so its outputs leave the balance and its inputs are unspent again.
+        tx2 = Transaction.create_from_struct(tx1.get_struct())
+        tx2.parents = [tx1.parents[1], tx1.parents[0]]
+        tx2.weight = 11
+        tx2.resolve()
+        self.manager.propagate_tx(tx2)
+        self.run_to_completion()
+        self.assertTrue(tx1.get_metadata(force_reload=True).voided_by)
+        self.assertFalse(tx2.get_metadata(force_reload=True).voided_by)
+        self.assertBalancesValid(address)
+        self.assertBalancesValid(input_address)
+        utxos = self.manager.tx_storage.wallet_index.get_utxos(address, settings.HATHOR_TOKEN_UID)
+        self.assertEqual({tx_hash for tx_hash, _ in utxos} & {tx1.hash, tx2.hash}, {tx2.hash})
+
+
+@pytest.mark.skipif(not HAS_ROCKSDB, reason='requires python-rocksdb')
+class RocksDBTwinTransactionTestCase(TwinTransactionTestCase):
+    def create_tx_storage(self):
+        self.directory = tempfile.mkdtemp()
+        return TransactionRocksDBStorage(self.directory, with_persistent_indexes=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def test_restart(self):
+        add_new_blocks(self.manager, 5, advance_clock=15)
+        add_blocks_unlock_reward(self.manager)
+        address = self.get_address(0)
+        outputs = [WalletOutputInfo(address=decode_address(address), value=500, timelock=None)]
+        tx1 = self.manager.wallet.prepare_transaction_compute_inputs(Transaction, outputs, self.manager.tx_storage)
+        tx1.weight = 10
+        tx1.parents = self.manager.get_new_tx_parents()
+        tx1.timestamp = int(self.clock.seconds())
+        tx1.resolve()
+        self.manager.propagate_tx(tx1)
+        self.run_to_completion()
+
+        tx_storage = self.manager.tx_storage
+        history = tx_storage.wallet_index.get_from_address(address)
+        balances = {token_uid: balance.balance for token_uid, balance in
+                    tx_storage.wallet_index.get_balances(address).items()}
+        utxos = tx_storage.wallet_index.get_utxos(address, settings.HATHOR_TOKEN_UID)
+        self.assertIn(tx1.hash, history)
+        self.manager.stop()
+        self.assertTrue(tx_storage.are_wallet_indexes_built())
+
+        # The indexes are not built again when the node starts without a full verification.
+        tx_storage._index_db._cache.clear()
+        self.manager = HathorManager(self.clock, tx_storage=tx_storage, wallet_index=True)
+        self.manager._full_verification = False
+        with patch.object(RocksDBWalletIndex, 'add_tx') as add_tx:
+            self.manager.start()
+        add_tx.assert_not_called()
+        wallet_index = tx_storage.wallet_index
+        self.assertEqual(wallet_index.get_from_address(address), history)
+        self.assertEqual({token_uid: balance.balance for token_uid, balance in
+                          wallet_index.get_balances(address).items()}, balances)
+        self.assertEqual(wallet_index.get_utxos(address, settings.HATHOR_TOKEN_UID), utxos)
+        newest, has_more = wallet_index.get_newest_transactions(address, 1)
+        self.assertEqual(newest, history[-1:])
+        self.assertEqual(has_more, len(history) > 1)
+        older, _ = wallet_index.get_older_transactions(address, tx1.timestamp, tx1.hash, len(history))
+        newer, _ = wallet_index.get_newer_transactions(address, tx1.timestamp, tx1.hash, len(history))
+        index = history.index(tx1.hash)
+        self.assertEqual(older, history[:index][::-1])
+        self.assertEqual(newer, history[index + 1:][::-1])
+        self.manager.stop()
+
+    def _copy_storage(self, directory):
+        """ Return a storage with a copy of the databases of another one, which may still be open.
+        """
+        path = os.path.join(tempfile.mkdtemp(), 'data')
+        self.tmpdirs.append(os.path.dirname(path))
+        shutil.copytree(directory, path)
+        return path
+
+    def test_rebuild_after_run_without_indexes(self):
+        add_new_blocks(self.manager, 5, advance_clock=15)
+        self.manager.stop()
+        self.assertTrue(self.manager.tx_storage.are_wallet_indexes_built())
+
+        # A run without the persistent indexes adds a block that is not in them.
+        path = self._copy_storage(self.directory)
+        manager = self.create_peer(self.network, tx_storage=TransactionRocksDBStorage(path), wallet_index=True)
+        block, = add_new_blocks(manager, 1, advance_clock=15)
+        manager.stop()
+        self.assertFalse(manager.tx_storage.are_wallet_indexes_built())
+
+        # So they are built again in the next run with them, even without a full verification.
+        tx_storage = TransactionRocksDBStorage(self._copy_storage(path), with_persistent_indexes=True)
+        self.assertFalse(tx_storage.are_wallet_indexes_built())
+        manager = HathorManager(self.clock, tx_storage=tx_storage, wallet_index=True)
+        manager._full_verification = False
+        manager.start()
+        address = parse_address_script(block.outputs[0].script).address
+        self.assertIn(block.hash, tx_storage.wallet_index.get_from_address(address))
+        manager.stop()
+        self.assertTrue(tx_storage.are_wallet_indexes_built())
+
+    def test_cache_storage_clears_built(self):
+        add_new_blocks(self.manager, 1, advance_clock=15)
+        self.manager.stop()
+        tx_storage = self.manager.tx_storage
+        self.assertTrue(tx_storage.are_wallet_indexes_built())
+        TransactionCacheStorage(tx_storage, self.clock)
+        self.assertFalse(tx_storage.are_wallet_indexes_built())
@@ -0,0 +1,46 @@
+""" It measures the number of hashes per second of the CPU mining loops (`start_mining` and stratum's `miner_job`).
+"""
+
+import threading
+import time
+from multiprocessing import Queue
+from multiprocessing.sharedctypes import Value
+
+from hathor.stratum.stratum import MinerJob, StratumClient, miner_job
+from hathor.transaction import Block
+
+number = 200000
+duration = 10
+
+# a weight that is never reached, so `start_mining` goes through all the nonces
+block = Block(weight=256, parents=[bytes(32)] * 3)
+t0 = time.time()
+assert block.start_mining(0, number, update_time=False) is None
+dt = time.time() - t0
+print('start_mining hashes per second: {:.1f}'.format(number / dt))
+
+# `miner_job` runs until it is stopped, so we estimate the hash rate from the number of solutions it finds
+weight = 12
+job_data = MinerJob()
+job_data.update_job({
+    'data': block.get_header_without_nonce().hex(),
+    'job_id': bytes(16).hex(),
+    'nonce_size': Block.HASH_NONCE_SIZE,
+    'weight': weight,
+})
+signal = Value('B')
+signal.value = StratumClient.WORK
+queue: Queue = Queue()
+miner = threading.Thread(target=miner_job, args=(0, 1, job_data, signal, queue))
+t0 = time.time()
+miner.start()
+time.sleep(duration)
+signal.value = StratumClient.STOP
+miner.join()
+dt = time.time() - t0
+solutions = 0
+while not queue.empty():
+    queue.get()
+    solutions += 1
+print('miner_job hashes per second: ~{:.1f} ({} solutions of weight {})'.format(solutions * 2**weight / dt,
+                                                                                solutions, weight))